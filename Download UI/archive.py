@@ -0,0 +1,233 @@
+"""
+Download archive and duplicate detection.
+
+Every URL is reduced to one or two keys: its normalized form (no tracking
+parameters, fragment, scheme or "www."/"m." host prefix, and short links
+expanded) and, once yt-dlp's extractors have loaded in the background and
+one recognizes it without a network request, "<extractor> <video id>" in the same format as yt-dlp's
+--download-archive file. add_task rejects a URL whose keys belong to a task
+that is queued or running, or to a finished download recorded in the
+archive, an indexed SQLite table that stays fast with hundreds of thousands
+of entries.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+ARCHIVE_FILE = "m3udl_archive.db"
+
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "si", "feature", "ref", "ref_src", "pp"}
+TRACKING_PREFIXES = ("utm_",)
+HOST_PREFIXES = ("www.", "m.", "mobile.")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    added_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize_url(url):
+    """Reduces the URL forms that point at the same video to one string."""
+    url = url.strip()
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in DEFAULT_PORTS or not parts.hostname:
+        return url
+    host = parts.hostname.lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if parts.port and parts.port != DEFAULT_PORTS[parts.scheme.lower()]:
+        host = f"{host}:{parts.port}"
+
+    path = parts.path.rstrip("/") or "/"
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)]
+
+    # Short and alternate YouTube links name the same video as /watch?v=.
+    if host == "youtu.be" and path != "/":
+        host, query, path = "youtube.com", query + [("v", path.strip("/"))], "/watch"
+    elif host == "youtube.com" and path.startswith(("/shorts/", "/embed/", "/live/")):
+        query, path = query + [("v", path.split("/")[2])], "/watch"
+
+    query.sort()
+    return f"{host}{path}" + (f"?{urlencode(query)}" if query else "")
+
+def video_key(info_dict):
+    """The archive key for an extracted video, as yt-dlp writes it."""
+    extractor, video_id = info_dict.get("extractor_key") or info_dict.get("ie_key"), info_dict.get("id")
+    # The generic extractor's id is just the file name, which says nothing across sites.
+    if not (extractor and video_id) or extractor.lower() == "generic": return None
+    return f"{extractor.lower()} {video_id}"
+
+
+class ExtractorMatcher:
+    """
+    Finds "<extractor> <id>" for a URL using yt-dlp's URL patterns, without
+    any network request. Trying all ~1800 extractors costs a few
+    milliseconds, so the result is remembered per host: later URLs from the
+    same site try the extractor that matched before, and sites no extractor
+    handles are not scanned again.
+
+    Loading the extractors imports all of them, which takes seconds, so it
+    happens on a background thread; until it is done, video_key returns None
+    and duplicates are found by normalized URL only.
+    """
+
+    def __init__(self):
+        self.extractors = None
+        self.loading = False
+        self.by_host = {}
+        self.lock = threading.Lock()
+
+    def preload(self):
+        """Loads the extractors on the calling thread, unless they are loaded or loading already."""
+        with self.lock:
+            if self.extractors is not None or self.loading: return
+            self.loading = True
+        self._load()
+
+    def _load(self):
+        extractors = self._load_extractors()
+        with self.lock:
+            self.extractors, self.loading = extractors, False
+
+    def video_key(self, url):
+        host = urlsplit(url).hostname
+        if not host: return None
+        start_loading = False
+        with self.lock:
+            if self.extractors is None:
+                # add_task runs on the UI thread; never make it wait for yt-dlp's extractors.
+                start_loading, self.loading = not self.loading, True
+                extractor = None
+            elif host in self.by_host:
+                extractor = self.by_host[host]
+                if extractor is None: return None
+                if not extractor.suitable(url):
+                    extractor = self._scan(url)
+            else:
+                extractor = self.by_host[host] = self._scan(url)
+        if start_loading:
+            threading.Thread(target=self._load, name="m3udl-extractors", daemon=True).start()
+        if extractor is None: return None
+        try:
+            video_id = extractor.get_temp_id(url)
+        except Exception:
+            return None
+        return f"{extractor.ie_key().lower()} {video_id}" if video_id else None
+
+    def _scan(self, url):
+        return next((ie for ie in self.extractors if ie.suitable(url)), None)
+
+    @staticmethod
+    def _load_extractors():
+        try:
+            from yt_dlp.extractor import gen_extractor_classes
+        except ImportError:
+            return []
+        extractors = [ie for ie in gen_extractor_classes() if ie.ie_key() != "Generic"]
+        for ie in extractors:
+            # Compiles each extractor's URL pattern now, so the first scan of a site is as fast as the rest.
+            try: ie.suitable("")
+            except Exception: pass
+        return extractors
+
+
+class DownloadArchive:
+    """Persistent set of keys of finished downloads."""
+
+    def __init__(self, path=ARCHIVE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def contains(self, keys):
+        keys = [key for key in keys if key]
+        if not keys: return False
+        with self.lock:
+            row = self.conn.execute(f"SELECT 1 FROM archive WHERE key IN ({', '.join('?' * len(keys))}) LIMIT 1", keys).fetchone()
+        return row is not None
+
+    def add(self, keys, url):
+        now = time.time()
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO archive (key, url, added_at) VALUES (?, ?, ?)",
+                                      [(key, url, now) for key in keys if key])
+        except sqlite3.Error:
+            logging.exception("Failed to write to the download archive.")
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class DedupIndex:
+    """
+    Keys of queued and running tasks (in memory) plus the download archive
+    (on disk). A task claims its keys when queued, releases them if it fails
+    or is cancelled, and moves them to the archive when it completes.
+    """
+
+    def __init__(self, archive=None):
+        self.archive = archive
+        self.matcher = ExtractorMatcher()
+        self.active = {}        # key -> task id
+        self.task_keys = {}     # task id -> keys
+        self.lock = threading.Lock()
+
+    def keys_for(self, url):
+        return [f"url {normalize_url(url)}", self.matcher.video_key(url)]
+
+    def find(self, keys):
+        """Returns ("queued", task_id), ("downloaded", None) or None."""
+        with self.lock:
+            for key in keys:
+                if key and key in self.active:
+                    return "queued", self.active[key]
+        if self.archive is not None and self.archive.contains(keys):
+            return "downloaded", None
+        return None
+
+    def claim(self, task_id, keys):
+        keys = [key for key in keys if key]
+        with self.lock:
+            self.task_keys[task_id] = keys
+            for key in keys:
+                self.active.setdefault(key, task_id)
+
+    def add_key(self, task_id, key):
+        """Adds a key learned later, e.g. the exact video id once extraction is done."""
+        if not key: return
+        with self.lock:
+            keys = self.task_keys.get(task_id)
+            if keys is None or key in keys: return
+            keys.append(key)
+            self.active.setdefault(key, task_id)
+
+    def release(self, task_id):
+        with self.lock:
+            keys = self.task_keys.pop(task_id, ())
+            for key in keys:
+                if self.active.get(key) == task_id:
+                    del self.active[key]
+        return keys
+
+    def complete(self, task_id, url):
+        keys = self.release(task_id)
+        if self.archive is not None and keys:
+            self.archive.add(keys, url)
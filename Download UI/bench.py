@@ -0,0 +1,340 @@
+"""
+Benchmarks for the download engine, run against fakeserver.py.
+
+    python bench.py                         # every scenario at its default sizes
+    python bench.py download enqueue --jobs 10,1000,50000
+
+Scenarios:
+    download   N small files through yt-dlp, end to end
+    enqueue    bulk import of an N-entry .m3u file with the queue stopped
+               (the add_bulk_to_queue path: parsing, dedup, journal, events)
+    hls        N HLS playlists with many segments through the built-in downloader
+    direct     N large files through the built-in multi-connection downloader,
+               with the server capping each connection's speed
+    errors     N files where some answer 429 or 503 first, some 404 and some are slow
+    startup    cold import of the engine (capability probe included), a cached
+               probe, engine construction and loading yt-dlp (N is ignored)
+
+Each run happens in a fresh child process so peak RSS belongs to that run
+alone. Results are appended to bench_results.jsonl with the git revision,
+and each row is compared with the previous result for the same scenario and
+size, so a regression shows up as a negative change.
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from fakeserver import FakeMediaServer
+
+RESULTS_FILE = "bench_results.jsonl"
+UI_REFRESH_INTERVAL = 0.066     # how often the GUI drains the progress table (main.PROGRESS_REFRESH_MS)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None     # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def percentile(values, q):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=10).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+class EventProbe:
+    """
+    Counts what a front-end would have to handle: engine events (one Tk call
+    each) and progress rows (drained on the GUI's timer). Also measures
+    scheduling latency, the time from a download slot freeing up to the
+    next task being dispatched into it.
+    """
+
+    def __init__(self, engine):
+        from engine import EVENT_TASK_UPDATED, STATUS_DOWNLOADING
+        self.engine = engine
+        self.updated_event, self.downloading = EVENT_TASK_UPDATED, STATUS_DOWNLOADING
+        self.events = collections.Counter()
+        self.progress_rows = 0
+        self.running = set()
+        self.freed = collections.deque()
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        engine.subscribe(self.on_event)
+        threading.Thread(target=self.drain_progress, daemon=True).start()
+
+    def on_event(self, event, task_id, data):
+        now = time.perf_counter()
+        with self.lock:
+            self.events[event] += 1
+            status = data.get("status")
+            if event != self.updated_event or status is None: return
+            if status == self.downloading:
+                self.running.add(task_id)
+                if self.freed:
+                    self.latencies.append(now - self.freed.popleft())
+            elif task_id in self.running:
+                self.running.discard(task_id)
+                self.freed.append(now)
+
+    def drain_progress(self):
+        while not self.stop_event.wait(UI_REFRESH_INTERVAL):
+            self.progress_rows += len(self.engine.progress.drain())
+
+    def stop(self):
+        self.stop_event.set()
+
+    def summary(self, seconds):
+        events = sum(self.events.values())
+        return {
+            "events": events,
+            "events_per_s": round(events / seconds, 1),
+            "progress_rows_per_s": round(self.progress_rows / seconds, 1),
+            "sched_latency_p50_ms": None if not self.latencies else round(percentile(self.latencies, 0.5) * 1000, 2),
+            "sched_latency_p95_ms": None if not self.latencies else round(percentile(self.latencies, 0.95) * 1000, 2),
+        }
+
+
+# --- Scenarios (run in the child process) ---
+
+def make_engine(directory, **overrides):
+    from engine import DownloadEngine, load_settings
+    from journal import JobJournal, JOURNAL_FILE
+    from archive import DownloadArchive, ARCHIVE_FILE
+    from info_cache import InfoCache, INFO_CACHE_DIR
+
+    settings = load_settings(os.path.join(directory, "settings.json"))
+    settings.update({"enable_scheduling": False, "autopilot": True, **overrides})
+    return DownloadEngine(settings, journal=JobJournal(os.path.join(directory, JOURNAL_FILE)),
+                          archive=DownloadArchive(os.path.join(directory, ARCHIVE_FILE)),
+                          info_cache=InfoCache(os.path.join(directory, INFO_CACHE_DIR)))
+
+def run_to_completion(engine, urls, output_path):
+    from bulk_import import BATCH_SIZE
+    from engine import STATUS_COMPLETED
+
+    probe = EventProbe(engine)
+    start = time.perf_counter()
+    for i in range(0, len(urls), BATCH_SIZE):
+        engine.add_tasks(((url, None) for url in urls[i:i + BATCH_SIZE]), output_path)
+    engine.start_scheduler()
+    engine.wait_until_idle()
+    seconds = time.perf_counter() - start
+    probe.stop()
+    engine.shutdown()
+
+    completed = sum(1 for task in engine.tasks.values() if task["status"] == STATUS_COMPLETED)
+    stages = engine.metrics.snapshot()["stages"]
+    return dict({
+        "seconds": round(seconds, 3),
+        "completed": completed,
+        "failed": len(urls) - completed,
+        "jobs_per_s": round(len(urls) / seconds, 2),
+        "mb_per_s": round(engine.metrics.bytes_total / seconds / 1e6, 2),
+        "extract_p50_s": stages["extract"]["p50"],
+        "transfer_p50_s": stages["transfer"]["p50"],
+    }, **probe.summary(seconds))
+
+# Settings that send plain file links through yt-dlp, as every download did when these scenarios were written.
+YT_DLP_ONLY = {"native_direct": False, "native_hls": False}
+
+def scenario_download(server, jobs, directory, args):
+    urls = [server.url(f"/video/v{i}.mp4?size={args.size}") for i in range(jobs)]
+    engine = make_engine(directory, simultaneous_downloads=args.slots, per_host_downloads=0, **YT_DLP_ONLY)
+    return run_to_completion(engine, urls, os.path.join(directory, "out"))
+
+def scenario_direct(server, jobs, directory, args):
+    urls = [server.url(f"/video/d{i}.mp4?size={args.direct_size}&rate={args.connection_rate}") for i in range(jobs)]
+    engine = make_engine(directory, simultaneous_downloads=args.slots, per_host_downloads=0,
+                         native_direct=True, direct_connections=args.connections)
+    return run_to_completion(engine, urls, os.path.join(directory, "out"))
+
+def scenario_hls(server, jobs, directory, args):
+    urls = [server.url(f"/hls/p{i}.m3u8?segments={args.segments}&size={args.segment_size}") for i in range(jobs)]
+    engine = make_engine(directory, simultaneous_downloads=args.slots, per_host_downloads=0, native_hls=True)
+    return run_to_completion(engine, urls, os.path.join(directory, "out"))
+
+def scenario_errors(server, jobs, directory, args):
+    def url(i):
+        path = f"/video/e{i}.mp4?size={args.size}"
+        if i % 50 == 0: return server.url(path + "&fail=1&code=429&retry_after=1")
+        if i % 10 == 1: return server.url(path + "&fail=1&code=503")
+        if i % 10 == 2: return server.url(path + "&fail=99&code=404")
+        if i % 10 == 3: return server.url(path + f"&rate={args.size * 4}")
+        return server.url(path)
+    engine = make_engine(directory, simultaneous_downloads=args.slots, per_host_downloads=0,
+                         max_retries=1, retry_delay=0, host_cooldown=1, **YT_DLP_ONLY)
+    return run_to_completion(engine, [url(i) for i in range(jobs)], os.path.join(directory, "out"))
+
+def scenario_enqueue(server, jobs, directory, args):
+    from bulk_import import BulkImport
+
+    playlist = os.path.join(directory, "import.m3u")
+    with open(playlist, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        for i in range(jobs):
+            f.write(f"#EXTINF:-1,Video {i}\n{server.url(f'/video/q{i}.mp4')}\n")
+    engine = make_engine(directory, autopilot=False)
+    probe = EventProbe(engine)
+    start = time.perf_counter()
+    job = BulkImport(engine, playlist, os.path.join(directory, "out"))
+    job.run()
+    seconds = time.perf_counter() - start
+    probe.stop()
+    engine.shutdown()
+    if job.error:
+        raise RuntimeError(job.error)
+    return dict({"seconds": round(seconds, 3), "queued": job.added, "jobs_per_s": round(job.added / seconds, 1)}, **probe.summary(seconds))
+
+def scenario_startup(server, jobs, directory, args):
+    # A fresh directory has no capability cache, so the import below pays for a full probe.
+    os.chdir(directory)
+    timings = {}
+    start = time.perf_counter()
+    import engine
+    timings["import"] = time.perf_counter() - start
+
+    import capabilities
+    mark = time.perf_counter()
+    capabilities.probe()
+    timings["cached_probe"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    make_engine(directory).shutdown()
+    timings["engine"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    if engine.YT_DLP_AVAILABLE:
+        engine.load_yt_dlp()
+    timings["yt_dlp"] = time.perf_counter() - mark
+    return {"seconds": round(timings["import"] + timings["engine"], 3), "startup": {k: round(v, 4) for k, v in timings.items()}}
+
+# name -> (function, default sizes)
+SCENARIOS = {
+    "download": (scenario_download, (10, 1000)),
+    "enqueue": (scenario_enqueue, (10, 1000, 50000)),
+    "hls": (scenario_hls, (1, 10)),
+    "direct": (scenario_direct, (1, 10)),
+    "errors": (scenario_errors, (10, 1000)),
+    "startup": (scenario_startup, (1,)),
+}
+
+def run_child(args):
+    function = SCENARIOS[args.child][0]
+    with FakeMediaServer() as server, tempfile.TemporaryDirectory(prefix="m3udl-bench-") as directory:
+        result = function(server, args.child_jobs, directory, args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    with open(args.result_file, "w") as f:
+        json.dump(result, f)
+
+
+# --- Driver ---
+
+def run_one(scenario, jobs, args):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_file = f.name
+    command = [sys.executable, os.path.abspath(__file__), "--child", scenario, "--child-jobs", str(jobs), "--result-file", result_file,
+               "--size", str(args.size), "--slots", str(args.slots), "--segments", str(args.segments), "--segment-size", str(args.segment_size),
+               "--direct-size", str(args.direct_size), "--connections", str(args.connections), "--connection-rate", str(args.connection_rate)]
+    try:
+        # yt-dlp prints every progress line; keep only the tail in case the run fails.
+        proc = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace")
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}")
+        with open(result_file) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+def load_previous(path):
+    previous = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                previous[(row["scenario"], row["jobs"])] = row
+    return previous
+
+def format_row(row, before):
+    change = ""
+    if before and before.get("jobs_per_s"):
+        change = f"{(row['jobs_per_s'] / before['jobs_per_s'] - 1) * 100:+.1f}% vs {before['revision']}"
+    elif before and before.get("seconds") and row.get("jobs_per_s") is None:
+        change = f"{(before['seconds'] / row['seconds'] - 1) * 100:+.1f}% vs {before['revision']}"
+    def show(value): return "-" if value is None else value
+    line = (f"{row['scenario']:<9} {row['jobs']:>6} {row['seconds']:>9} {show(row.get('jobs_per_s')):>9} {show(row.get('mb_per_s')):>7} "
+            f"{show(row.get('sched_latency_p50_ms')):>9} {show(row.get('sched_latency_p95_ms')):>9} {show(row.get('events_per_s')):>9} "
+            f"{show(row['peak_rss_mb']):>8}  {change}")
+    if "startup" in row:
+        line += "\n          " + ", ".join(f"{name} {value * 1000:.0f} ms" for name, value in row["startup"].items())
+    return line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the M3UDL engine against a local fake media server.")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all).")
+    parser.add_argument("--jobs", default=None, help="Comma-separated job counts, overriding each scenario's defaults.")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="Bytes per file.")
+    parser.add_argument("--slots", type=int, default=8, help="Simultaneous downloads.")
+    parser.add_argument("--segments", type=int, default=200, help="Segments per HLS playlist.")
+    parser.add_argument("--segment-size", type=int, default=64 * 1024, help="Bytes per HLS segment.")
+    parser.add_argument("--direct-size", type=int, default=16 * 1024 * 1024, help="Bytes per file in the direct scenario.")
+    parser.add_argument("--connections", type=int, default=4, help="Connections per file in the direct scenario.")
+    parser.add_argument("--connection-rate", type=int, default=4_000_000, help="Bytes/s the fake server sends per connection in the direct scenario.")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON-lines file results are appended to.")
+    parser.add_argument("--no-save", action="store_true", help="Print results without recording them.")
+    parser.add_argument("--child", choices=list(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--child-jobs", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args)
+        return 0
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    previous = load_previous(args.results)
+    revision = git_revision()
+    print(f"{'scenario':<9} {'jobs':>6} {'seconds':>9} {'jobs/s':>9} {'MB/s':>7} {'sched p50':>9} {'sched p95':>9} {'events/s':>9} {'RSS MB':>8}")
+    failed = False
+    for scenario in args.scenarios or list(SCENARIOS):
+        counts = [int(n) for n in args.jobs.split(",")] if args.jobs else SCENARIOS[scenario][1]
+        for jobs in counts:
+            try:
+                result = run_one(scenario, jobs, args)
+            except Exception as e:
+                print(f"{scenario:<9} {jobs:>6}  failed: {e}")
+                failed = True
+                continue
+            row = dict(scenario=scenario, jobs=jobs, revision=revision, time=time.time(),
+                       python=platform.python_version(), size=args.size, slots=args.slots, **result)
+            print(format_row(row, previous.get((scenario, jobs))), flush=True)
+            if not args.no_save:
+                with open(args.results, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(row) + "\n")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
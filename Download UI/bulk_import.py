@@ -0,0 +1,119 @@
+"""
+Streaming bulk import.
+
+URL lists are read line by line on a background thread and handed to the
+engine in batches, so a 50k-line file neither sits in memory as a list nor
+blocks the Tk thread, and the task list redraws once per batch instead of
+once per URL. Besides plain one-URL-per-line text, .m3u/.m3u8 playlists are
+understood: the #EXTINF title of an entry becomes its file name.
+"""
+import logging
+import os
+import threading
+
+BATCH_SIZE = 500
+
+
+class ImportFailed(Exception):
+    pass
+
+
+def parse_extinf(line):
+    """Returns the title of an "#EXTINF:<duration> <attributes>,<title>" line (commas inside quoted attributes don't count)."""
+    in_quotes = False
+    for i, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == "," and not in_quotes:
+            return line[i + 1:].strip() or None
+    return None
+
+def iter_entries(lines):
+    """
+    Yields (url, title) for every URL in an iterable of lines. Titles come
+    from a preceding #EXTINF line and are None for plain lists. Other '#'
+    lines are comments.
+    """
+    title = None
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+        if line.startswith("#"):
+            if line[:8].upper() == "#EXTINF:":
+                title = parse_extinf(line[8:])
+            elif line.startswith(("#EXT-X-TARGETDURATION", "#EXT-X-STREAM-INF", "#EXT-X-MEDIA-SEQUENCE")):
+                raise ImportFailed("This is an HLS stream playlist, not a list of videos. Add its URL as a single download instead.")
+            continue
+        yield line, title
+        title = None
+
+def read_entries(file_path):
+    with open(file_path, "r", encoding="utf-8-sig", errors="replace") as f:
+        yield from iter_entries(f)
+
+
+class BulkImport:
+    """
+    Imports one URL file on a background thread. on_progress(fraction,
+    added, skipped) is called after every batch and on_done(import) once at
+    the end, both from the import thread. cancel() stops after the current
+    batch; tasks already added stay queued.
+    """
+
+    def __init__(self, engine, file_path, output_path, sequential=False, on_progress=None, on_done=None, batch_size=BATCH_SIZE):
+        self.engine = engine
+        self.file_path = file_path
+        self.output_path = output_path
+        self.sequential = sequential
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.batch_size = batch_size
+        self.added = 0
+        self.skipped = 0
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="m3udl-bulk-import", daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            self._import()
+        except (OSError, ImportFailed) as e:
+            self.error = str(e)
+        except Exception as e:
+            logging.exception(f"Bulk import of {self.file_path} failed.")
+            self.error = str(e)
+        if self.on_done:
+            self.on_done(self)
+
+    def _import(self):
+        total_size = os.path.getsize(self.file_path) or 1
+        # Binary mode so tell() keeps working while iterating, for the progress fraction.
+        with open(self.file_path, "rb") as f:
+            lines = (raw.decode("utf-8-sig" if i == 0 else "utf-8", errors="replace") for i, raw in enumerate(f))
+            batch = []
+            for entry in iter_entries(lines):
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    self._add_batch(batch, f.tell() / total_size)
+                    batch = []
+                    if self.cancelled: return
+            if batch:
+                self._add_batch(batch, 1.0)
+
+    def _add_batch(self, batch, fraction):
+        added, skipped = self.engine.add_tasks(batch, self.output_path, sequential=self.sequential)
+        self.added += len(added)
+        self.skipped += skipped
+        if self.on_progress:
+            self.on_progress(min(fraction, 1.0), self.added, self.skipped)
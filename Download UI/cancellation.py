@@ -0,0 +1,73 @@
+"""
+Subprocess tracking for cancellation.
+
+yt-dlp only checks for cancellation from its progress hooks, which don't run
+while FFmpeg is merging or converting a file. track_subprocesses() swaps the
+Popen class yt-dlp's FFmpeg code uses for one that registers every child with
+the task running on the current thread, so cancelling a task can kill its
+FFmpeg process instead of waiting for it to finish.
+"""
+import threading
+
+_current = threading.local()
+_processes = {}     # task id -> set of live processes
+_lock = threading.Lock()
+
+
+def set_current_task(task_id):
+    _current.task_id = task_id
+
+def current_task():
+    return getattr(_current, "task_id", None)
+
+def kill_processes(task_id):
+    with _lock:
+        processes = list(_processes.get(task_id, ()))
+    for process in processes:
+        try:
+            process.kill()
+        except OSError:
+            pass
+    return len(processes)
+
+def _register(task_id, process):
+    with _lock:
+        _processes.setdefault(task_id, set()).add(process)
+
+def _unregister(task_id, process):
+    with _lock:
+        processes = _processes.get(task_id)
+        if processes is not None:
+            processes.discard(process)
+            if not processes:
+                del _processes[task_id]
+
+
+def track_subprocesses():
+    """Makes FFmpeg processes started by yt-dlp killable per task. Safe to call more than once."""
+    try:
+        from yt_dlp.utils import Popen
+        from yt_dlp.postprocessor import ffmpeg as ffmpeg_pp
+        from yt_dlp.downloader import external as external_fd
+    except ImportError:
+        return False
+    if getattr(ffmpeg_pp.Popen, "tracked", False): return True
+
+    class TrackedPopen(Popen):
+        tracked = True
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.task_id = current_task()
+            if self.task_id is not None:
+                _register(self.task_id, self)
+
+        def __exit__(self, *exc_info):
+            if self.task_id is not None:
+                _unregister(self.task_id, self)
+            return super().__exit__(*exc_info)
+
+    for module in (ffmpeg_pp, external_fd):
+        if getattr(module, "Popen", None) is Popen:
+            module.Popen = TrackedPopen
+    return True
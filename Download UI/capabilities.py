@@ -0,0 +1,94 @@
+"""
+Capability probe for yt-dlp and FFmpeg.
+
+The app needs to know whether they are installed before it builds its
+window. Finding out used to mean importing yt-dlp (hundreds of modules) and
+running `ffmpeg -version` on every start. Now yt-dlp is only located, not
+imported, and the results are cached on disk keyed by each tool's path, size
+and modification time, so the probe only runs again after one of them is
+installed, upgraded or removed.
+"""
+import importlib.util
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+CAPABILITIES_FILE = "m3udl_capabilities.json"
+VERSION_RE = re.compile(r"""__version__\s*=\s*['"]([^'"]+)['"]""")
+
+
+def _fingerprint(path):
+    if not path: return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [path, stat.st_size, stat.st_mtime]
+
+def locate_yt_dlp():
+    """Path of yt-dlp's version.py, found without importing the package; None if it isn't installed."""
+    try:
+        spec = importlib.util.find_spec("yt_dlp")
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin: return None
+    version_file = os.path.join(os.path.dirname(spec.origin), "version.py")
+    # version.py is rewritten by every release, so its stamp identifies the install.
+    return version_file if os.path.exists(version_file) else spec.origin
+
+def yt_dlp_version(version_file):
+    try:
+        with open(version_file, encoding="utf-8") as f:
+            match = VERSION_RE.search(f.read())
+    except OSError:
+        return None
+    return match.group(1) if match else None
+
+def ffmpeg_version(path):
+    """Runs `ffmpeg -version`; returns the version string, or None if FFmpeg doesn't run."""
+    try:
+        startupinfo = None
+        if sys.platform == "win32":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        result = subprocess.run([path, '-version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    first_line = result.stdout.decode(errors="replace").split("\n", 1)[0].split()
+    return first_line[2] if len(first_line) > 2 else "unknown"
+
+
+def probe(cache_path=CAPABILITIES_FILE):
+    """
+    Returns {"yt_dlp": bool, "yt_dlp_version", "ffmpeg": bool, "ffmpeg_version"},
+    from the cache file when neither tool has changed since it was written.
+    """
+    yt_dlp_file, ffmpeg_path = locate_yt_dlp(), shutil.which("ffmpeg")
+    fingerprint = {"yt_dlp": _fingerprint(yt_dlp_file), "ffmpeg": _fingerprint(ffmpeg_path)}
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("fingerprint") == fingerprint:
+            return cached
+    except (OSError, ValueError):
+        pass
+
+    ydl_version = yt_dlp_version(yt_dlp_file) if yt_dlp_file else None
+    ff_version = ffmpeg_version(ffmpeg_path) if ffmpeg_path else None
+    result = {
+        "fingerprint": fingerprint,
+        "yt_dlp": yt_dlp_file is not None, "yt_dlp_version": ydl_version,
+        "ffmpeg": ff_version is not None, "ffmpeg_version": ff_version,
+    }
+    try:
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not cache capability probe in {cache_path}: {e}")
+    return result
@@ -0,0 +1,84 @@
+"""
+Adaptive download concurrency.
+
+An AIMD controller that picks how many downloads run at once. Every sample
+window it looks at the total throughput and the failures seen since the last
+window: while adding a slot still raises throughput it adds one more
+(additive increase), and on failures it halves the level (multiplicative
+decrease). If a step up made throughput drop, the step is undone. When
+throughput plateaus it holds, re-probing one step higher every few windows
+in case conditions improved.
+"""
+import threading
+
+SAMPLE_INTERVAL = 5.0
+DECREASE_FACTOR = 0.5
+GAIN_THRESHOLD = 0.05     # an extra slot must add at least 5% throughput to count as a gain
+DROP_THRESHOLD = 0.15     # throughput falling by more than this after a raise is treated as congestion
+PROBE_WINDOWS = 6
+
+
+class AdaptiveConcurrency:
+    def __init__(self, minimum=1, maximum=8, start=None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.level = min(max(start or self.minimum, self.minimum), self.maximum)
+        self.bytes = 0
+        self.failures = 0
+        self.last_throughput = None
+        self.last_change = 0        # +1 after an increase, -1 after a decrease, 0 when holding
+        self.holding = 0
+        self.lock = threading.Lock()
+
+    def set_bounds(self, minimum, maximum):
+        with self.lock:
+            self.minimum = max(1, minimum)
+            self.maximum = max(self.minimum, maximum)
+            self.level = min(max(self.level, self.minimum), self.maximum)
+
+    def record_bytes(self, amount):
+        with self.lock:
+            self.bytes += amount
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def sample(self, elapsed, busy_slots):
+        """
+        Closes a sample window and returns (new_level, reason), reason being
+        None when the level didn't change. busy_slots is how many downloads
+        were running; the level only grows while every slot is in use.
+        """
+        with self.lock:
+            throughput = self.bytes / elapsed if elapsed > 0 else 0
+            failures, self.bytes, self.failures = self.failures, 0, 0
+            previous, self.last_throughput = self.last_throughput, throughput
+            level, reason = self.level, None
+
+            if failures:
+                level = max(self.minimum, int(self.level * DECREASE_FACTOR))
+                reason = f"{failures} failure{'s' if failures != 1 else ''}"
+            elif busy_slots < self.level:
+                # Not enough work to fill the slots, so throughput says nothing about the level.
+                self.holding = 0
+            elif previous is None or (self.last_change >= 0 and throughput > previous * (1 + GAIN_THRESHOLD)):
+                level = min(self.maximum, self.level + 1)
+                reason = "throughput rising"
+            elif self.last_change > 0 and throughput < previous * (1 - DROP_THRESHOLD):
+                # Past the saturation point: undo the last step and hold there.
+                level = max(self.minimum, self.level - 1)
+                reason = "throughput fell after adding a download"
+            else:
+                self.holding += 1
+                if self.holding >= PROBE_WINDOWS:
+                    level = min(self.maximum, self.level + 1)
+                    reason = "probing for more bandwidth"
+
+            if level == self.level:
+                reason = None
+            self.last_change = (level > self.level) - (level < self.level)
+            if self.last_change:
+                self.holding = 0
+            self.level = level
+            return level, reason
@@ -0,0 +1,349 @@
+"""
+Built-in downloader for direct media files.
+
+A plain link to an .mp4, .mkv or similar file needs no extractor, and a
+single stream through yt-dlp is often capped per connection by the origin.
+When the server honours byte ranges, the file is preallocated and split into
+ranges that several pooled connections fetch in parallel, each writing at
+its own offset. A connection that runs out of work takes over the back half
+of the largest range still in flight, and a connection that stalls gives up
+the back half of its range to the next free one before reconnecting, so one
+slow or stuck connection can't hold up the end of the file. Servers without
+range support get a single stream.
+
+Progress is saved next to the .part file, so a retry fetches only the
+missing ranges, after checking with resume.py that both the server's file
+and the partial data are unchanged.
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+import requests
+
+import resume
+from hls import render_filename
+
+DEFAULT_CONNECTIONS = 4
+MIN_SPLIT = 1024 * 1024         # ranges are never cut smaller than this
+STALL_TIMEOUT = 10              # seconds without a byte before a connection counts as stalled
+REQUEST_RETRIES = 3
+REQUEST_TIMEOUT = (10, STALL_TIMEOUT)   # connect, and read: a stalled connection errors out instead of hanging
+READ_CHUNK = 64 * 1024
+REPORT_INTERVAL = 0.2
+RESUME_STATE_INTERVAL = 1.0
+
+DIRECT_EXTENSIONS = {
+    "mp4", "m4v", "mkv", "webm", "mov", "avi", "flv", "wmv", "mpg", "mpeg", "ts", "3gp", "ogv",
+    "m4a", "mp3", "aac", "ogg", "oga", "opus", "flac", "wav",
+}
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DirectError(Exception):
+    pass
+
+class DirectUnsupported(DirectError):
+    """The URL isn't a plain media file after all (e.g. it serves an HTML page); use yt-dlp instead."""
+
+class DirectCancelled(DirectError):
+    pass
+
+class DirectRateLimited(DirectError):
+    """The server answered 429; retrying right away would only make it worse."""
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_direct_url(url):
+    name = os.path.basename(urlparse(url).path.lower())
+    return "." in name and name.rsplit(".", 1)[1] in DIRECT_EXTENSIONS
+
+def parse_content_range(header):
+    """Returns (first byte, total size or None) from a Content-Range header, or None."""
+    match = CONTENT_RANGE_RE.match(header or "")
+    if not match: return None
+    return int(match.group(1)), None if match.group(3) == "*" else int(match.group(3))
+
+
+class ByteRange:
+    """Bytes [pos, end) still to fetch. `end` shrinks when another connection takes over the tail."""
+
+    __slots__ = ("pos", "end")
+
+    def __init__(self, start, end):
+        self.pos, self.end = start, end
+
+    @property
+    def remaining(self):
+        return max(0, self.end - self.pos)
+
+
+class DirectDownloader:
+    def __init__(self, session, connections=DEFAULT_CONNECTIONS, progress_hook=None, is_cancelled=None, throttle=None):
+        self.session = session
+        self.connections = max(1, connections)
+        self.progress_hook = progress_hook
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.throttle = throttle
+        self.pending = []           # ranges waiting for a connection
+        self.active = set()         # ranges a connection is fetching
+        self.validators = {}
+        self.failed = False
+        self.lock = threading.Lock()
+
+    # --- HTTP ---
+
+    def open(self, url, headers):
+        for attempt in range(REQUEST_RETRIES + 1):
+            self.check_cancelled()
+            try:
+                response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+            except requests.RequestException as e:
+                if attempt == REQUEST_RETRIES:
+                    raise DirectError(f"Failed to fetch {url}: {e}") from e
+                time.sleep(0.5 * 2 ** attempt)
+                continue
+            if response.status_code == 429:
+                response.close()
+                retry_after = response.headers.get("Retry-After", "")
+                raise DirectRateLimited(f"HTTP Error 429: Too Many Requests ({url})",
+                                        retry_after=int(retry_after) if retry_after.isdigit() else None)
+            if response.status_code >= 500 and attempt < REQUEST_RETRIES:
+                response.close()
+                time.sleep(0.5 * 2 ** attempt)
+                continue
+            if response.status_code >= 400:
+                response.close()
+                raise DirectError(f"HTTP Error {response.status_code}: {response.reason} ({url})")
+            return response
+
+    def check_cancelled(self):
+        if self.failed or self.is_cancelled():
+            raise DirectCancelled("Download cancelled by user.")
+
+    def report(self, status, **data):
+        if self.progress_hook:
+            self.progress_hook(dict(status=status, **data))
+
+    # --- Download ---
+
+    def download(self, url, output_path, sequence_number=None, output_template="%(title)s.%(ext)s"):
+        response = self.open(url, {"Range": "bytes=0-"})
+        content_type = response.headers.get("Content-Type", "").lower()
+        if content_type.startswith(("text/html", "application/xhtml")):
+            response.close()
+            raise DirectUnsupported(f"the server sent a web page ({content_type.split(';')[0]})")
+        self.validators = resume.validators(response)
+
+        name = unquote(os.path.basename(urlparse(url).path))
+        title, ext = os.path.splitext(name)
+        filename = f"{sequence_number}{ext}" if sequence_number is not None else render_filename(output_template, title or "video", ext[1:] or "mp4")
+        os.makedirs(output_path, exist_ok=True)
+        filepath = os.path.join(output_path, filename)
+        part_path = filepath + ".part"
+
+        content_range = parse_content_range(response.headers.get("Content-Range"))
+        ranged = (response.status_code == 206 and content_range is not None and content_range[0] == 0
+                  and content_range[1] is not None and response.headers.get("Accept-Ranges", "bytes").lower() != "none")
+        if ranged:
+            self.download_ranges(url, response, filepath, part_path, content_range[1])
+        else:
+            size = content_range[1] if content_range else (int(response.headers["Content-Length"]) if response.headers.get("Content-Length", "").isdigit() else None)
+            self.download_single(response, filepath, part_path, size)
+
+        os.replace(part_path, filepath)
+        if os.path.exists(part_path + ".json"):
+            os.remove(part_path + ".json")
+        size = os.path.getsize(filepath)
+        self.report("finished", filename=filepath, downloaded_bytes=size, total_bytes=size)
+        return filepath
+
+    def download_single(self, response, filepath, part_path, size):
+        downloaded, last_report = 0, 0
+        with response, open(part_path, "wb") as out:
+            for chunk in response.iter_content(READ_CHUNK):
+                self.check_cancelled()
+                if self.throttle:
+                    self.throttle(len(chunk))
+                out.write(chunk)
+                downloaded += len(chunk)
+                if time.monotonic() - last_report >= REPORT_INTERVAL:
+                    self.report("downloading", downloaded_bytes=downloaded, total_bytes=size, filename=filepath, tmpfilename=part_path)
+                    last_report = time.monotonic()
+        if size is not None and downloaded != size:
+            raise DirectError(f"Connection closed after {downloaded} of {size} bytes")
+
+    def download_ranges(self, url, probe, filepath, part_path, size):
+        remaining = self.load_resume_state(part_path, url, size)
+        if remaining is None:
+            with open(part_path, "wb") as f:
+                f.truncate(size)    # preallocate; every connection writes at its own offset
+            count = max(1, min(self.connections, size // MIN_SPLIT))
+            bounds = [size * i // count for i in range(count + 1)]
+            remaining = list(zip(bounds, bounds[1:]))
+        else:
+            probe.close()
+            probe = None
+            resumed = size - sum(end - start for start, end in remaining)
+            self.report("downloading", downloaded_bytes=resumed, total_bytes=size, filename=filepath, tmpfilename=part_path, resumed_bytes=resumed)
+
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix="m3udl-direct")
+        futures = set()
+        with self.lock:
+            self.pending = [ByteRange(start, end) for start, end in remaining]
+            for _ in range(min(self.connections, len(self.pending))):
+                rng = self.pending.pop(0)
+                self.active.add(rng)
+                # The probe response already streams from byte 0; the first range reads from it.
+                futures.add(pool.submit(self.worker, url, part_path, rng, probe if probe is not None and rng.pos == 0 else None))
+        if probe is not None and not any(rng.pos == 0 for rng in self.active):
+            probe.close()
+        last_save = time.monotonic()
+        try:
+            while futures:
+                self.report("downloading", downloaded_bytes=self.downloaded_bytes(size), total_bytes=size, filename=filepath, tmpfilename=part_path)
+                done, futures = concurrent.futures.wait(futures, timeout=REPORT_INTERVAL, return_when=concurrent.futures.FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+                self.check_cancelled()
+                with self.lock:
+                    # A stalled connection may have handed back a range after the others finished.
+                    while self.pending and len(futures) < self.connections:
+                        rng = self.pending.pop(0)
+                        self.active.add(rng)
+                        futures.add(pool.submit(self.worker, url, part_path, rng))
+                if time.monotonic() - last_save >= RESUME_STATE_INTERVAL:
+                    self.save_resume_state(part_path, url, size)
+                    last_save = time.monotonic()
+        except BaseException as e:
+            self.failed = True
+            pool.shutdown(wait=False, cancel_futures=True)
+            if not isinstance(e, DirectCancelled):
+                # Keep what has arrived so a retry picks up from here.
+                self.save_resume_state(part_path, url, size)
+            raise
+        pool.shutdown(wait=True)
+        missing = size - self.downloaded_bytes(size)
+        if missing:
+            self.save_resume_state(part_path, url, size)
+            raise DirectError(f"Download ended with {missing} bytes missing")
+
+    def worker(self, url, part_path, rng, response=None):
+        with open(part_path, "r+b", buffering=0) as out:
+            while rng is not None:
+                self.fetch_range(url, rng, out, response)
+                response = None
+                rng = self.next_range(rng)
+
+    def fetch_range(self, url, rng, out, response=None):
+        for attempt in range(REQUEST_RETRIES + 1):
+            try:
+                if response is None:
+                    with self.lock:
+                        start, end = rng.pos, rng.end
+                    if start >= end: return
+                    response = self.open(url, {"Range": f"bytes={start}-{end - 1}"})
+                    content_range = parse_content_range(response.headers.get("Content-Range"))
+                    if response.status_code != 206 or content_range is None or content_range[0] != start:
+                        response.close()
+                        raise DirectError(f"The server stopped honouring byte ranges ({url})")
+                with response:
+                    for chunk in response.iter_content(READ_CHUNK):
+                        self.check_cancelled()
+                        if self.throttle:
+                            self.throttle(len(chunk))
+                        with self.lock:
+                            offset, chunk = rng.pos, chunk[:rng.end - rng.pos]
+                        # Outside the lock: if the tail was just taken over, both connections write the same bytes there.
+                        out.seek(offset)
+                        out.write(chunk)
+                        with self.lock:
+                            rng.pos = offset + len(chunk)
+                            if rng.pos >= rng.end: return
+                response = None
+                with self.lock:
+                    if rng.pos >= rng.end: return
+                raise requests.ConnectionError("connection closed before the range was complete")
+            except requests.RequestException as e:
+                # Stalled or dropped: hand the back half to the next free connection and reconnect for the rest.
+                response = None
+                self.split(rng)
+                if attempt == REQUEST_RETRIES:
+                    raise DirectError(f"Failed to fetch {url}: {e}") from e
+                time.sleep(0.5 * 2 ** attempt)
+
+    def split(self, rng):
+        """Moves the back half of `rng` to the waiting ranges, if it is big enough to be worth it."""
+        with self.lock:
+            tail = self._cut_tail(rng)
+            if tail is not None:
+                self.pending.append(tail)
+
+    def next_range(self, finished):
+        """Gives a connection that finished `finished` its next range: a waiting one, or the back half of the largest in flight."""
+        # Choosing and cutting happen under one lock, so two idle connections never take the same tail.
+        with self.lock:
+            self.active.discard(finished)
+            if self.pending:
+                rng = self.pending.pop(0)
+            else:
+                largest = max(self.active, key=lambda r: r.remaining, default=None)
+                rng = self._cut_tail(largest) if largest is not None else None
+                if rng is None: return None
+            self.active.add(rng)
+            return rng
+
+    @staticmethod
+    def _cut_tail(rng):
+        """Shortens `rng` to its front half and returns the back half; None if it is too small to split. Needs the lock."""
+        if rng.remaining < 2 * MIN_SPLIT: return None
+        middle = rng.pos + rng.remaining // 2
+        tail = ByteRange(middle, rng.end)
+        rng.end = middle
+        return tail
+
+    def downloaded_bytes(self, size):
+        with self.lock:
+            return size - sum(r.remaining for r in self.pending) - sum(r.remaining for r in self.active)
+
+    # --- Resume ---
+
+    def load_resume_state(self, part_path, url, size):
+        """
+        Returns the [start, end) ranges still missing from an interrupted
+        download of the same file, or None if there is nothing to resume or
+        the partial data can't be trusted.
+        """
+        try:
+            with open(part_path + ".json", "r") as f: state = json.load(f)
+            remaining = [tuple(r) for r in state["remaining"]]
+            if state["url"] != url or state["size"] != size or os.path.getsize(part_path) != size:
+                return None
+            if not resume.validators_match(state["validators"], self.validators):
+                logging.info(f"{url} has changed on the server since it was partly downloaded; starting over.")
+                return None
+            if not resume.verify_tail_checks(part_path, state["checks"]):
+                logging.warning(f"Partial download {part_path} is damaged; starting over.")
+                return None
+            return remaining
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save_resume_state(self, part_path, url, size):
+        with self.lock:
+            remaining = sorted([r.pos, r.end] for r in list(self.pending) + list(self.active) if r.remaining)
+        tmp_path = part_path + ".json.tmp"
+        try:
+            checks = resume.tail_checks(part_path, resume.written_spans(remaining, size))
+            with open(tmp_path, "w") as f:
+                json.dump({"url": url, "size": size, "validators": self.validators, "remaining": remaining, "checks": checks}, f)
+            os.replace(tmp_path, part_path + ".json")
+        except OSError:
+            pass
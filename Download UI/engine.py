@@ -0,0 +1,1223 @@
+import collections
+import concurrent.futures
+import copy
+import datetime
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from itertools import chain
+
+import cancellation
+import capabilities
+import direct
+import hls
+import logpipe
+import postprocess
+import resume
+from archive import DedupIndex, video_key
+from concurrency import AdaptiveConcurrency, SAMPLE_INTERVAL
+from hosts import HostLimiter, host_key, is_rate_limited
+from metrics import Metrics, MetricsServer, SnapshotWriter, failure_cause
+from ratelimit import TokenBucket, parse_rate
+from procpool import ProcessWorkerPool, expected_filename
+from progress import ProgressTable, format_bytes
+from registry import TaskRegistry
+from sequence import SequenceAllocator
+from info_cache import InfoCache
+from workers import WorkerPool
+
+# --- Dependency Check ---
+# Cached on disk and done without importing yt-dlp; see capabilities.py.
+CAPABILITIES = capabilities.probe()
+YT_DLP_AVAILABLE = CAPABILITIES["yt_dlp"]
+FFMPEG_AVAILABLE = CAPABILITIES["ffmpeg"]
+
+_yt_dlp_lock = threading.Lock()
+
+def load_yt_dlp():
+    """
+    Imports yt-dlp on first use rather than at startup, since it takes a few
+    hundred milliseconds, and hooks the FFmpeg processes it starts so that
+    cancel_task can kill them. Later calls just return the module.
+    """
+    with _yt_dlp_lock:
+        import yt_dlp
+        cancellation.track_subprocesses()
+    return yt_dlp
+
+# --- Constants ---
+SETTINGS_FILE = "m3udl_settings.json"
+LOG_FILE = "m3udl_app.log"
+SOCKET_TIMEOUT = 20 # bounds how long a stalled connection can keep a cancelled yt-dlp job alive
+
+# --- Default Settings ---
+DEFAULT_SETTINGS = {
+    "simultaneous_downloads": 3,
+    "adaptive_concurrency": False,
+    "adaptive_min_downloads": 1,
+    "adaptive_max_downloads": 8,
+    "per_host_downloads": 2,
+    "host_cooldown": 30,
+    "max_rate_limit_requeues": 10,
+    "max_retries": 3,
+    "retry_delay": 5,
+    "output_format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
+    "proxy": "",
+    "user_agent": "",
+    "speed_limit": "",
+    "schedule_mode": "pause",
+    "schedule_speed_limit": "",
+    "autopilot": True,
+    "use_yt_dlp": True,
+    "native_hls": True,
+    "hls_segment_concurrency": hls.DEFAULT_SEGMENT_CONCURRENCY,
+    "native_direct": True,
+    "direct_connections": direct.DEFAULT_CONNECTIONS,
+    "info_cache_ttl": 3 * 3600,
+    "info_cache_max_mb": 200,
+    "prefetch_depth": 4,
+    "prefetch_workers": 2,
+    "keep_partial_files": False,
+    "skip_duplicates": True,
+    "postprocess_workers": os.cpu_count() or 2,
+    "worker_mode": "thread",
+    "json_log": False,
+    "metrics_port": 0,
+    "metrics_file": "",
+    "metrics_interval": 15,
+    "theme": "System",
+    "enable_scheduling": False,
+    "start_time": "00:00",
+    "end_time": "23:59",
+    "yt_dlp_options": {
+        "video_quality": "best",
+        "audio_quality": "best",
+        "audio_format": "m4a",
+        "output_template": "%(title)s [%(id)s].%(ext)s",
+        "download_subs": False,
+        "sub_lang": "en",
+        "embed_subs": False,
+        "embed_thumbnail": False,
+        "embed_metadata": False,
+        "convert_video": "none"
+    }
+}
+
+# --- Download Statuses ---
+STATUS_QUEUED = "Queued"
+STATUS_DOWNLOADING = "Downloading"
+STATUS_RETRYING = "Retrying"
+STATUS_POSTPROCESSING = "Processing"
+STATUS_COMPLETED = "Completed"
+STATUS_ERROR = "Error"
+STATUS_CANCELLED = "Cancelled"
+
+FINISHED_STATUSES = (STATUS_COMPLETED, STATUS_ERROR, STATUS_CANCELLED)
+UNFINISHED_STATUSES = (STATUS_QUEUED, STATUS_DOWNLOADING, STATUS_RETRYING, STATUS_POSTPROCESSING)
+
+# --- Schedule Modes ---
+SCHEDULE_PAUSE = "pause"    # only start downloads inside the schedule window
+SCHEDULE_LIMIT = "limit"    # download any time, at schedule_speed_limit inside the window
+
+# --- Engine Events ---
+EVENT_TASK_ADDED = "task_added"
+EVENT_TASKS_ADDED = "tasks_added"   # a bulk import batch; data: task_ids
+EVENT_TASK_UPDATED = "task_updated"
+EVENT_TASK_REMOVED = "task_removed"
+EVENT_LOG = "log"
+EVENT_CONCURRENCY = "concurrency_changed"
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+def playlist_filename_template(title):
+    """An output template that names the file after a playlist entry's title."""
+    name = hls.INVALID_FILENAME_CHARS_RE.sub("_", title).strip(" .") or "video"
+    return name.replace("%", "%%") + ".%(ext)s"
+
+
+def load_settings(path=SETTINGS_FILE):
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f: loaded_settings = json.load(f)
+            for key, value in loaded_settings.items():
+                if isinstance(value, dict) and key in settings: settings[key].update(value)
+                else: settings[key] = value
+        except json.JSONDecodeError: logging.error("Could not decode settings.json, using defaults.")
+    return settings
+
+def save_settings(settings, path=SETTINGS_FILE):
+    with open(path, "w") as f: json.dump(settings, f, indent=4)
+
+
+class DownloadEngine:
+    """
+    UI-independent download engine. Owns the task table, the download queue
+    and the worker pool, and reports everything that happens to subscribers
+    as (event, task_id, data) callbacks. Callbacks run on whichever thread
+    produced the event, so GUI subscribers must marshal to their own thread.
+    """
+
+    def __init__(self, settings, journal=None, info_cache=None, archive=None):
+        self.settings = settings
+        self.journal = journal
+        self.info_cache = info_cache
+        self.dedup = DedupIndex(archive)
+        self.sequences = SequenceAllocator()
+        self.tasks = TaskRegistry()
+        self.download_queue = queue.Queue()
+        self.hosts = HostLimiter(self.settings["per_host_downloads"], self.settings["host_cooldown"])
+        self.parked = {}            # host -> deque of task ids waiting for that host; guarded by dispatch_lock
+        self.stop_event = threading.Event()
+        self.shutdown_event = threading.Event()
+        self.queue_started = False
+        self.scheduler_wakeup = threading.Event()
+        self.dispatch_lock = threading.Lock()
+        self.status_changed = threading.Condition()
+        self.adaptive = AdaptiveConcurrency(self.settings["adaptive_min_downloads"], self.settings["adaptive_max_downloads"],
+                                            start=self.settings["simultaneous_downloads"])
+        self.workers = WorkerPool(self.download_slots())
+        self.postprocessors = WorkerPool(self.settings["postprocess_workers"], name="m3udl-postprocess")
+        self.prefetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.settings["prefetch_workers"], thread_name_prefix="m3udl-prefetch")
+        self.subscribers = []
+        self.progress = ProgressTable()
+        self.http_session = None
+        self.http_session_slots = 0
+        self.http_session_lock = threading.Lock()
+        self.bandwidth = TokenBucket(self.current_speed_limit())
+        self.process_pool = None
+        self.process_pool_lock = threading.Lock()
+        self.metrics = Metrics(self.metric_gauges)
+        self.metrics_server = None
+        self.metrics_writer = None
+
+    def preload(self):
+        """Loads yt-dlp and its extractor list on a background thread, so the first download or add doesn't wait for them."""
+        if not YT_DLP_AVAILABLE: return
+        def run():
+            started = time.perf_counter()
+            load_yt_dlp()
+            self.dedup.matcher.preload()
+            logging.info(f"yt-dlp loaded in the background in {time.perf_counter() - started:.2f}s.")
+        threading.Thread(target=run, name="m3udl-preload", daemon=True).start()
+
+    # --- Events ---
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def emit(self, event, task_id=None, **data):
+        for callback in list(self.subscribers):
+            try:
+                callback(event, task_id, data)
+            except Exception:
+                logging.exception(f"Subscriber failed while handling '{event}' event.")
+
+    def log(self, message):
+        logging.info(message)
+        self.emit(EVENT_LOG, message=message)
+
+    def update_task(self, task_id, **updates):
+        previous_status = self.tasks.get(task_id, {}).get("status")
+        task = self.tasks.update(task_id, updates)
+        if task is None: return
+        if updates.get("status", previous_status) != previous_status:
+            self.record_stage(task, previous_status)
+        if updates.get("status") == STATUS_COMPLETED:
+            self.dedup.complete(task_id, task["url"])
+            self.sequences.observe_file(task.get("final_filepath"))
+        elif updates.get("status") in (STATUS_ERROR, STATUS_CANCELLED):
+            self.dedup.release(task_id)
+        if self.journal:
+            self.journal.update(task_id, updates)
+        if "status" in updates:
+            with self.status_changed:
+                self.status_changed.notify_all()
+        self.emit(EVENT_TASK_UPDATED, task_id, **updates)
+
+    def record_stage(self, task, previous_status):
+        """
+        Records a task's move to a new status: the stage timestamps behind the
+        metrics, and a JSON-lines event with the time spent in the previous
+        status.
+        """
+        status = task["status"]
+        if status == STATUS_QUEUED:
+            self.metrics.mark(task, "queued")
+        elif status == STATUS_DOWNLOADING:
+            self.metrics.mark(task, "dispatched")
+        elif status == STATUS_POSTPROCESSING:
+            self.metrics.mark(task, "transferred")
+        elif status == STATUS_COMPLETED:
+            self.metrics.mark(task, "postprocessed" if previous_status == STATUS_POSTPROCESSING else "transferred")
+        if status in FINISHED_STATUSES:
+            self.metrics.finish(task, host_key(task["url"]), status)
+
+        now = time.monotonic()
+        seconds = now - task.get("stage_started", now)
+        task["stage_started"] = now
+        fields = {"previous": previous_status, "seconds": round(seconds, 3),
+                  "total_seconds": round(now - task.get("queued_at", now), 3), "url": task["url"]}
+        row = self.progress.get(task["id"])
+        if row:
+            fields["bytes"] = row["downloaded_bytes"]
+        if status in (STATUS_ERROR, STATUS_RETRYING):
+            fields["error"] = task.get("error_message")
+            fields["cause"] = failure_cause(task.get("error_message"))
+        if status in FINISHED_STATUSES:
+            fields["stages"] = self.metrics.stage_durations(task)
+        logpipe.log_event(task["id"], status.lower(), **fields)
+
+    # --- Task Management ---
+
+    def add_task(self, url, output_path, sequence_number=None, sequential=False):
+        """
+        Queues a download and returns its task id, or None if the URL is a
+        duplicate and skip_duplicates is on. With sequential=True the task
+        gets the next free sequence number for output_path.
+        """
+        keys = self.dedup.keys_for(url)
+        if self.settings["skip_duplicates"]:
+            duplicate = self.dedup.find(keys)
+            if duplicate:
+                self.log(f"Skipped, {'already in the queue' if duplicate[0] == 'queued' else 'already downloaded'}: {url}")
+                return None
+        if sequential and sequence_number is None:
+            sequence_number = self.sequences.allocate(output_path)
+        task = self._enqueue(str(uuid.uuid4()), url, output_path, sequence_number, keys=keys)
+        task_id = task["id"]
+        if self.journal:
+            self.journal.record(task)
+
+        log_msg = f"Queued: {url}"
+        if sequence_number is not None:
+            log_msg += f" (as number {sequence_number})"
+        self.log(log_msg)
+
+        return task_id
+
+    def add_tasks(self, entries, output_path, sequential=False):
+        """
+        Queues a batch of (url, title) entries from a bulk import, with one
+        event and one scheduler wake-up for the whole batch. Returns (added
+        task ids, number of duplicates skipped).
+        """
+        added, skipped = [], 0
+        for url, title in entries:
+            keys = self.dedup.keys_for(url)
+            if self.settings["skip_duplicates"] and self.dedup.find(keys):
+                skipped += 1
+                continue
+            sequence_number = self.sequences.allocate(output_path) if sequential else None
+            fields = {"playlist_title": title, "filename": title} if title else {}
+            task = self._enqueue(str(uuid.uuid4()), url, output_path, sequence_number, keys=keys, notify=False, **fields)
+            if self.journal:
+                self.journal.record(task)
+            added.append(task["id"])
+        if added:
+            self.emit(EVENT_TASKS_ADDED, task_ids=added)
+            self.wake_scheduler()
+        return added, skipped
+
+    def _enqueue(self, task_id, url, output_path, sequence_number=None, keys=None, notify=True, **fields):
+        task = {
+            "id": task_id, "url": url, "output_path": output_path,
+            "status": STATUS_QUEUED, "retries": 0,
+            "future": None, "final_filepath": None,
+            "filename": os.path.basename(url) or url,
+            "error_message": "",
+            "sequence_number": sequence_number,
+            "queued_at": time.monotonic(), "stage_started": time.monotonic(),
+        }
+        task.update(fields)
+        if sequence_number is not None:
+            self.sequences.observe(output_path, sequence_number)
+        self.dedup.claim(task_id, keys or self.dedup.keys_for(url))
+        self.metrics.mark(task, "queued")
+        self.tasks.add(task)
+        self.download_queue.put(task_id)
+        logpipe.log_event(task_id, "queued", url=url)
+        if notify:
+            self.emit(EVENT_TASK_ADDED, task_id)
+            self.wake_scheduler()
+        return task
+
+    def restore_jobs(self):
+        """
+        Re-queues every job the journal recorded as unfinished, e.g. after a
+        crash. Backends continue from their partial files instead of starting over.
+        """
+        if not self.journal: return 0
+        rows = self.journal.load_unfinished(FINISHED_STATUSES)
+        for row in rows:
+            if row["id"] in self.tasks: continue
+            self._enqueue(row["id"], row["url"], row["output_path"], row["sequence_number"],
+                          retries=row["retries"] or 0, filename=row["filename"] or os.path.basename(row["url"]) or row["url"],
+                          playlist_title=row["playlist_title"])
+            self.journal.update(row["id"], {"status": STATUS_QUEUED})
+        if rows:
+            self.log(f"Restored {len(rows)} unfinished downloads from the previous session.")
+        return len(rows)
+
+    def wake_scheduler(self):
+        """Asks the scheduler thread to run a dispatch pass as soon as possible."""
+        self.scheduler_wakeup.set()
+
+    def process_queue(self):
+        self.apply_speed_limit()
+        with self.dispatch_lock:
+            self._dispatch()
+            if not self.shutdown_event.is_set():
+                self.schedule_prefetch()
+
+    def _dispatch(self):
+        if self.stop_event.is_set() or self.shutdown_event.is_set(): return
+        if not (self.settings["autopilot"] or self.queue_started): return
+
+        if self.settings["enable_scheduling"] and self.settings["schedule_mode"] == SCHEDULE_PAUSE:
+            if not self.is_within_schedule():
+                if not hasattr(self, 'last_schedule_log_time') or time.time() - self.last_schedule_log_time > 300:
+                    self.log("Queue processing paused due to schedule.")
+                    self.last_schedule_log_time = time.time()
+                return
+
+        active_downloads = self.tasks.count(STATUS_DOWNLOADING)
+        max_downloads = self.download_slots()
+
+        # Tasks parked behind a busy or rate-limited host go first once that host has room again.
+        for host in list(self.parked):
+            waiting = self.parked[host]
+            while waiting and active_downloads < max_downloads and self.hosts.can_start(host):
+                if self.start_download(waiting.popleft(), host):
+                    active_downloads += 1
+            if not waiting:
+                del self.parked[host]
+
+        while active_downloads < max_downloads:
+            try:
+                task_id = self.download_queue.get_nowait()
+            except queue.Empty:
+                break
+            task = self.tasks.get(task_id)
+            if task is None or task["status"] != STATUS_QUEUED: continue
+            host = host_key(task["url"])
+            if not self.hosts.can_start(host):
+                # Leave the slot to other hosts' work instead of waiting in line.
+                self.parked.setdefault(host, collections.deque()).append(task_id)
+            elif self.start_download(task_id, host):
+                active_downloads += 1
+
+    def start_download(self, task_id, host):
+        task = self.tasks.get(task_id)
+        if task is None or task["status"] != STATUS_QUEUED: return False
+        task["host"] = host
+        self.hosts.acquire(host)
+        self.update_task(task_id, status=STATUS_DOWNLOADING)
+        future = self.workers.submit(self.run_download, task_id)
+        self.tasks.set_future(task_id, future)
+        future.add_done_callback(self.on_download_done)
+        return True
+
+    def run_download(self, task_id):
+        # Lets cancel_task find and kill FFmpeg processes yt-dlp starts on this thread.
+        cancellation.set_current_task(task_id)
+        try:
+            return self.download_video(task_id)
+        finally:
+            cancellation.set_current_task(None)
+
+    def download_video(self, task_id):
+        task = self.tasks[task_id]
+        url = task["url"]
+
+        def progress_hook(d):
+            if d.get('tmpfilename'):
+                task.setdefault('partial_files', set()).add(d['tmpfilename'])
+                sources = task.setdefault('partial_sources', {})
+                if d['tmpfilename'] not in sources:
+                    # yt-dlp passes the format being fetched (the process relay sends it as "source").
+                    info = d.get('info_dict') or {}
+                    source = d.get('source') or [info.get('url'), info.get('http_headers') or {}]
+                    if source[0]: sources[d['tmpfilename']] = source
+            if task['status'] == STATUS_CANCELLED:
+                raise DownloadCancelled("Download cancelled by user.")
+            if d['status'] == 'downloading':
+                if d.get('resumed_bytes'):
+                    # Reported by the built-in downloaders; yt-dlp resumes are recorded by verify_partial_files.
+                    self.record_resume(task, d['resumed_bytes'])
+                if d.get('downloaded_bytes'):
+                    self.metrics.mark(task, "first_byte")
+                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+                self.progress.update(task_id, d.get('downloaded_bytes') or 0, total_bytes, d.get('speed'), d.get('eta'))
+            elif d['status'] == 'finished':
+                task['final_filepath'] = d.get('filename') or d.get('info_dict', {}).get('_filename')
+                self.progress.finish(task_id)
+                if task['final_filepath']:
+                     self.update_task(task_id, filename=os.path.basename(task['final_filepath']))
+
+        counted = {}    # bytes already accounted per file; merged formats download one file each
+        def throttled_progress_hook(d):
+            # yt-dlp calls hooks from inside its transfer loop, so waiting here paces the download.
+            downloaded = d.get('downloaded_bytes') or 0
+            previous = counted.get(d.get('tmpfilename'), 0)
+            if d['status'] == 'downloading' and downloaded > previous:
+                self.transferred(task, downloaded - previous)
+                counted[d.get('tmpfilename')] = downloaded
+            progress_hook(d)
+
+        if self.settings.get("native_hls") and hls.is_hls_url(url):
+            try:
+                self.download_hls(task_id, progress_hook)
+                return (STATUS_COMPLETED, f"Downloaded (native HLS): {url}", None)
+            except hls.HLSUnsupported as e:
+                self.log(f"Built-in HLS downloader can't handle {url} ({e}). Falling back to yt-dlp.")
+            except hls.HLSRateLimited as e:
+                task["retry_after"] = e.retry_after
+                return (STATUS_ERROR, f"HLS error for {url}: {e}", str(e))
+            except Exception as e:
+                error_str = str(e).split('\n')[0]
+                return (STATUS_ERROR, f"HLS error for {url}: {error_str}", error_str)
+
+        if self.settings.get("native_direct") and direct.is_direct_url(url):
+            try:
+                self.download_direct(task_id, progress_hook)
+                return (STATUS_COMPLETED, f"Downloaded (direct): {url}", None)
+            except direct.DirectUnsupported as e:
+                self.log(f"Built-in downloader can't handle {url} ({e}). Falling back to yt-dlp.")
+            except direct.DirectRateLimited as e:
+                task["retry_after"] = e.retry_after
+                return (STATUS_ERROR, f"Download error for {url}: {e}", str(e))
+            except Exception as e:
+                error_str = str(e).split('\n')[0]
+                return (STATUS_ERROR, f"Download error for {url}: {error_str}", error_str)
+
+        if self.settings["use_yt_dlp"] and YT_DLP_AVAILABLE:
+            try:
+                prefetch_future = task.get("prefetch_future")
+                if prefetch_future is not None and not prefetch_future.done():
+                    # Extraction for this task is already under way in the prefetch pool.
+                    concurrent.futures.wait([prefetch_future])
+                self.verify_partial_files(task)
+                if self.settings["worker_mode"] == "process":
+                    return self.download_in_process(task, progress_hook)
+                with load_yt_dlp().YoutubeDL(self.build_ydl_opts(task, throttled_progress_hook)) as ydl:
+                    captured = postprocess.capture_info(ydl) if self.build_postprocessors() else None
+                    info_dict = task.pop("info", None)
+                    reused = info_dict is not None
+                    if info_dict is None:
+                        info_dict, reused = self.extract_info(ydl, url)
+                    self.metrics.mark(task, "extracted")
+                    self.dedup.add_key(task_id, video_key(info_dict))
+                    self.update_task(task_id, filename=self.describe_filename(ydl, task, info_dict))
+
+                    # Download from the info we already have instead of running the extractor again.
+                    try:
+                        ydl.process_ie_result(info_dict, download=True)
+                    except DownloadCancelled:
+                        raise
+                    except Exception:
+                        if not reused: raise
+                        # Cached or prefetched format URLs may have expired; extract fresh and try once more.
+                        self.log(f"Cached info for {url} is stale. Extracting again.")
+                        if self.info_cache:
+                            self.info_cache.invalidate(InfoCache.make_key(url, self.settings))
+                        info_dict, _ = self.extract_info(ydl, url, use_cache=False)
+                        ydl.process_ie_result(info_dict, download=True)
+                if captured:
+                    task["pp_info"] = captured
+                return (STATUS_COMPLETED, f"Downloaded: {url}", None)
+            except Exception as e:
+                error_str = str(e).split('\n')[0]
+                return (STATUS_ERROR, f"yt-dlp error for {url}: {error_str}", error_str)
+        else:
+            return (STATUS_ERROR, "yt-dlp is not available. Please install it.", "yt-dlp is not available.")
+
+    def build_ydl_opts(self, task, progress_hook=None):
+        opts = self.settings.get("yt_dlp_options", {})
+        video_quality_map = { "best": "bestvideo", "1080p": "bestvideo[height<=1080]", "720p": "bestvideo[height<=720]", "480p": "bestvideo[height<=480]", "worst": "worstvideo" }
+        audio_quality_map = {"best": "bestaudio", "worst": "worstaudio"}
+        video_part = video_quality_map.get(opts.get("video_quality", "best"), "bestvideo")
+        audio_part = audio_quality_map.get(opts.get("audio_quality", "best"), "bestaudio")
+        format_string = f"{video_part}[ext=mp4]+{audio_part}[ext=m4a]/{video_part}+{audio_part}/best"
+
+        # Choose output template based on task data
+        if task.get('sequence_number') is not None:
+            output_template = f"{task['sequence_number']}.%(ext)s"
+        elif task.get('playlist_title'):
+            output_template = playlist_filename_template(task['playlist_title'])
+        else:
+            output_template = opts.get("output_template", "%(title)s.%(ext)s")
+
+        def postprocessor_hook(d):
+            # Progress hooks stop firing once the download is done; this catches a cancel between FFmpeg steps.
+            if task['status'] == STATUS_CANCELLED:
+                raise DownloadCancelled("Download cancelled by user.")
+
+        return {
+            'outtmpl': os.path.join(task["output_path"], output_template),
+            'format': format_string,
+            'progress_hooks': [progress_hook] if progress_hook else [], 'noplaylist': True,
+            'postprocessor_hooks': [postprocessor_hook] if progress_hook else [],
+            'socket_timeout': SOCKET_TIMEOUT,
+            'quiet': progress_hook is None,
+            'proxy': self.settings["proxy"] or None,
+            'http_headers': {'User-Agent': self.settings["user_agent"]} if self.settings["user_agent"] else None,
+            'writesubtitles': opts.get("download_subs", False),
+            'subtitleslangs': [opts.get("sub_lang", "en")] if opts.get("download_subs") else None,
+        }
+
+    def build_postprocessors(self):
+        """The FFmpeg steps to run after a download; these run in the post-processing stage, not the download slot."""
+        opts = self.settings.get("yt_dlp_options", {})
+        postprocessors = []
+        if FFMPEG_AVAILABLE:
+            if opts.get("embed_thumbnail"): postprocessors.append({'key': 'EmbedThumbnail', 'already_have_thumbnail': False})
+            if opts.get("embed_metadata"): postprocessors.append({'key': 'FFmpegMetadata', 'add_metadata': True})
+            if opts.get("embed_subs") and opts.get("download_subs"): postprocessors.append({'key': 'FFmpegEmbedSubtitle'})
+            if opts.get("audio_format") not in ["m4a"]: postprocessors.append({'key': 'FFmpegExtractAudio', 'preferredcodec': opts.get("audio_format", "m4a")})
+            if opts.get("convert_video") != "none": postprocessors.append({'key': 'FFmpegVideoConvertor', 'preferedformat': opts.get("convert_video")})
+        return postprocessors
+
+    @staticmethod
+    def describe_filename(ydl, task, info_dict):
+        return expected_filename(ydl, info_dict, task.get('sequence_number'))
+
+    def extract_info(self, ydl, url, use_cache=True):
+        """Returns (info_dict, from_cache), consulting the on-disk info cache first."""
+        key = InfoCache.make_key(url, self.settings) if self.info_cache else None
+        if key and use_cache:
+            info = self.info_cache.get(key)
+            if info is not None:
+                return info, True
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        if key:
+            self.info_cache.put(key, info)
+        return info, False
+
+    # --- Process Workers ---
+
+    def get_process_pool(self):
+        with self.process_pool_lock:
+            if self.process_pool is None:
+                self.process_pool = ProcessWorkerPool(self.bandwidth, max_idle=self.max_pool_size())
+            return self.process_pool
+
+    def shutdown_process_pool(self):
+        with self.process_pool_lock:
+            pool, self.process_pool = self.process_pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def download_in_process(self, task, progress_hook):
+        """
+        Runs the yt-dlp part of a download in a reusable worker process. The
+        worker paces itself against the shared bandwidth bucket; here we only
+        relay its progress into the task table and the throughput stats.
+        """
+        url = task["url"]
+        job = {
+            "url": url,
+            "ydl_opts": self.build_ydl_opts(task),
+            "info": task.pop("info", None),
+            "sequence_number": task.get("sequence_number"),
+            "info_cache": dict(directory=self.info_cache.directory, ttl=self.info_cache.ttl, max_bytes=self.info_cache.max_bytes) if self.info_cache else None,
+            "cache_key": InfoCache.make_key(url, self.settings) if self.info_cache else None,
+            "capture_info": bool(self.build_postprocessors()),
+        }
+
+        counted = {}
+        def relay(kind, data):
+            if kind == "filename":
+                self.metrics.mark(task, "extracted")
+                self.update_task(task["id"], filename=data)
+            elif kind == "video_key":
+                self.dedup.add_key(task["id"], data)
+            elif kind == "progress":
+                downloaded = data.get('downloaded_bytes') or 0
+                previous = counted.get(data.get('tmpfilename'), 0)
+                if data['status'] == 'downloading' and downloaded > previous:
+                    self.adaptive.record_bytes(downloaded - previous)
+                    self.metrics.record_bytes(downloaded - previous)
+                    counted[data.get('tmpfilename')] = downloaded
+                try:
+                    progress_hook(data)
+                except DownloadCancelled:
+                    pass    # the pool notices the cancel and stops the worker
+
+        ok, error, captured = self.get_process_pool().run(job, relay, lambda: task['status'] == STATUS_CANCELLED)
+        if ok:
+            if captured:
+                task["pp_info"] = captured
+            return (STATUS_COMPLETED, f"Downloaded: {url}", None)
+        return (STATUS_ERROR, f"yt-dlp error for {url}: {error}", error)
+
+    # --- Metadata Prefetch ---
+
+    def schedule_prefetch(self):
+        """
+        Starts extraction for the next few queued tasks so that formats,
+        filenames and sizes are known before a download slot frees up.
+        """
+        if not (self.settings["use_yt_dlp"] and YT_DLP_AVAILABLE) or self.settings["prefetch_depth"] <= 0: return
+        with self.download_queue.mutex:
+            upcoming = list(self.download_queue.queue)
+        depth = 0
+        for task_id in chain(*self.parked.values(), upcoming):
+            if depth >= self.settings["prefetch_depth"]: break
+            task = self.tasks.get(task_id)
+            if task is None or task["status"] != STATUS_QUEUED: continue
+            if self.settings.get("native_hls") and hls.is_hls_url(task["url"]): continue
+            if self.settings.get("native_direct") and direct.is_direct_url(task["url"]): continue
+            if self.hosts.is_paused(host_key(task["url"])): continue
+            depth += 1
+            if "prefetch_future" not in task:
+                task["prefetch_future"] = self.prefetch_executor.submit(self.prefetch_metadata, task_id)
+
+    def prefetch_metadata(self, task_id):
+        task = self.tasks.get(task_id)
+        if task is None or task["status"] != STATUS_QUEUED: return
+        try:
+            with load_yt_dlp().YoutubeDL(self.build_ydl_opts(task)) as ydl:
+                info_dict, _ = self.extract_info(ydl, task["url"])
+                filename = self.describe_filename(ydl, task, info_dict)
+        except Exception as e:
+            # The download itself will extract again and report the error properly.
+            logging.info(f"Prefetch failed for {task['url']}: {str(e).splitlines()[0] if str(e) else e}")
+            return
+        if task["status"] != STATUS_QUEUED: return
+        task["info"] = info_dict
+        self.dedup.add_key(task_id, video_key(info_dict))
+        size = info_dict.get("filesize") or info_dict.get("filesize_approx")
+        if not size and info_dict.get("requested_formats"):
+            size = sum(f.get("filesize") or f.get("filesize_approx") or 0 for f in info_dict["requested_formats"]) or None
+        self.update_task(task_id, filename=filename, title=info_dict.get("title"), total_bytes=size)
+
+    def record_resume(self, task, resumed):
+        """Notes that an attempt continued from `resumed` bytes of partial data instead of fetching them again."""
+        self.metrics.record_resumed(resumed)
+        logpipe.log_event(task["id"], "resumed", bytes=resumed, url=task["url"])
+        self.log(f"Resuming {task['url']} from {format_bytes(resumed)} already downloaded.")
+        self.update_task(task["id"], resumed_bytes=task.get("resumed_bytes", 0) + resumed)
+
+    def transferred(self, task, amount):
+        """Called by the backends for every chunk received; feeds throughput stats and the bandwidth limit."""
+        self.adaptive.record_bytes(amount)
+        self.metrics.record_bytes(amount)
+        self.bandwidth.consume(amount, lambda: task['status'] == STATUS_CANCELLED)
+
+    def get_http_session(self):
+        with self.http_session_lock:
+            if self.http_session is None:
+                # One keep-alive pool per host, big enough for every download that host may run at once.
+                slots = self.max_pool_size()
+                per_host = self.settings["per_host_downloads"] or slots
+                pool_size = max(self.settings["hls_segment_concurrency"], self.settings["direct_connections"]) * min(per_host, slots)
+                self.http_session = hls.create_session(self.settings, pool_size=pool_size, hosts=max(10, slots))
+                self.http_session_slots = slots
+            return self.http_session
+
+    def reset_http_session(self):
+        """Drops the pooled session so the next job picks up new proxy/user-agent settings."""
+        with self.http_session_lock:
+            self.http_session = None
+
+    def download_hls(self, task_id, progress_hook):
+        task = self.tasks[task_id]
+        opts = self.settings.get("yt_dlp_options", {})
+        if self.build_postprocessors():
+            # The segments are only joined; conversion and embedding need yt-dlp's info dict and postprocessors.
+            raise hls.HLSUnsupported("post-processing is enabled")
+        downloader = hls.HLSDownloader(
+            self.get_http_session(),
+            concurrency=self.settings["hls_segment_concurrency"],
+            progress_hook=progress_hook,
+            is_cancelled=lambda: task['status'] == STATUS_CANCELLED,
+            throttle=lambda n: self.transferred(task, n),
+        )
+        return downloader.download(
+            task["url"], task["output_path"],
+            video_quality=opts.get("video_quality", "best"),
+            sequence_number=task.get("sequence_number"),
+            output_template=playlist_filename_template(task["playlist_title"]) if task.get("playlist_title") else opts.get("output_template", "%(title)s.%(ext)s"),
+        )
+
+    def download_direct(self, task_id, progress_hook):
+        task = self.tasks[task_id]
+        opts = self.settings.get("yt_dlp_options", {})
+        if self.build_postprocessors():
+            # As with HLS: the file is only fetched, so FFmpeg steps need the yt-dlp path.
+            raise direct.DirectUnsupported("post-processing is enabled")
+        downloader = direct.DirectDownloader(
+            self.get_http_session(),
+            connections=self.settings["direct_connections"],
+            progress_hook=progress_hook,
+            is_cancelled=lambda: task['status'] == STATUS_CANCELLED,
+            throttle=lambda n: self.transferred(task, n),
+        )
+        return downloader.download(
+            task["url"], task["output_path"],
+            sequence_number=task.get("sequence_number"),
+            output_template=playlist_filename_template(task["playlist_title"]) if task.get("playlist_title") else opts.get("output_template", "%(title)s.%(ext)s"),
+        )
+
+    def on_download_done(self, future):
+        task_id = self.tasks.pop_future(future)
+        if not task_id: return
+        host = self.tasks[task_id].pop("host", None)
+        self.hosts.release(host)
+
+        if self.tasks[task_id]["status"] == STATUS_CANCELLED:
+            # The worker has stopped writing, so whatever it left behind can go now.
+            if not self.settings["keep_partial_files"]:
+                self.remove_partial_files(self.tasks[task_id])
+            self.log(f"Cancelled: {self.tasks[task_id]['url']}")
+            self.wake_scheduler()
+            return
+
+        try:
+            status, message, error_details = future.result()
+            self.log(message)
+            if status == STATUS_COMPLETED:
+                self.hosts.succeeded(host)
+                if "pp_info" in self.tasks[task_id]:
+                    self.start_postprocess(task_id)
+                else:
+                    self.update_task(task_id, status=STATUS_COMPLETED, final_filepath=self.tasks[task_id]["final_filepath"])
+            else:
+                self.handle_download_error(task_id, error_details or message)
+        except Exception as e:
+            self.handle_download_error(task_id, str(e))
+
+        self.wake_scheduler()
+
+    # --- Post-processing Stage ---
+
+    def start_postprocess(self, task_id):
+        """Hands a downloaded file to the post-processing pool. Leaving STATUS_DOWNLOADING frees its download slot."""
+        self.update_task(task_id, status=STATUS_POSTPROCESSING, pp_step=None)
+        future = self.postprocessors.submit(self.run_postprocess, task_id)
+        self.tasks.set_future(task_id, future)
+        future.add_done_callback(self.on_postprocess_done)
+
+    def run_postprocess(self, task_id):
+        task = self.tasks[task_id]
+        url = task["url"]
+
+        def postprocessor_hook(d):
+            if task['status'] == STATUS_CANCELLED:
+                raise DownloadCancelled("Download cancelled by user.")
+            if d['status'] == 'started' and d.get('postprocessor') in postprocess.STEP_LABELS:
+                self.update_task(task_id, pp_step=postprocess.STEP_LABELS[d['postprocessor']])
+
+        cancellation.set_current_task(task_id)
+        try:
+            opts = dict(self.build_ydl_opts(task), postprocessors=self.build_postprocessors(), postprocessor_hooks=[postprocessor_hook], quiet=False)
+            with load_yt_dlp().YoutubeDL(opts) as ydl:
+                task["final_filepath"] = postprocess.run_postprocessors(ydl, task.pop("pp_info"))
+            return (STATUS_COMPLETED, f"Post-processed: {url}", None)
+        except Exception as e:
+            error_str = str(e).split('\n')[0]
+            return (STATUS_ERROR, f"Post-processing error for {url}: {error_str}", error_str)
+        finally:
+            cancellation.set_current_task(None)
+
+    def on_postprocess_done(self, future):
+        task_id = self.tasks.pop_future(future)
+        if not task_id: return
+        task = self.tasks[task_id]
+        if task["status"] == STATUS_CANCELLED:
+            self.log(f"Cancelled: {task['url']}")
+            return
+        try:
+            status, message, error_details = future.result()
+            self.log(message)
+            if status == STATUS_COMPLETED:
+                self.update_task(task_id, status=STATUS_COMPLETED, final_filepath=task["final_filepath"],
+                                 filename=os.path.basename(task["final_filepath"]), pp_step=None)
+            else:
+                self.handle_download_error(task_id, error_details or message)
+        except Exception as e:
+            self.handle_download_error(task_id, str(e))
+        self.wake_scheduler()
+
+    def handle_download_error(self, task_id, error_message):
+        task = self.tasks[task_id]
+        if task["status"] == STATUS_CANCELLED:
+            self.log(f"Cancelled: {task['url']}")
+            return
+        self.adaptive.record_failure()
+        rate_limited = is_rate_limited(error_message)
+        if not rate_limited:
+            # A 429 attempt wrote nothing, and a HEAD now would only add to the requests the host is refusing.
+            self.snapshot_partial_files(task)
+
+        if rate_limited:
+            # The host is throttling us, not failing: pause it and requeue without using up a retry.
+            host = task.get("host") or host_key(task["url"])
+            pause = self.hosts.trip(host, task.pop("retry_after", None))
+            requeues = task.get("rate_limit_requeues", 0)
+            if requeues >= self.settings["max_rate_limit_requeues"]:
+                self.log(f"Download failed permanently for {task['url']}: {host} is still rate limiting it after {requeues} requeues.")
+                self.update_task(task_id, status=STATUS_ERROR, error_message=error_message)
+                return
+            task["rate_limit_requeues"] = requeues + 1
+            self.metrics.retry(host_key(task["url"]), "rate_limited")
+            self.log(f"{host} is rate limiting downloads (HTTP 429). Pausing it for {pause:.0f}s: {task['url']}")
+            self.update_task(task_id, status=STATUS_QUEUED, error_message=error_message)
+            self.download_queue.put(task_id)
+            return
+
+        if task["retries"] < self.settings["max_retries"]:
+            retries = task["retries"] + 1
+            delay = self.settings["retry_delay"]
+            self.metrics.retry(host_key(task["url"]), failure_cause(error_message))
+            self.log(f"Download failed for {task['url']}. Retrying in {delay}s... (Attempt {retries})")
+            self.update_task(task_id, retries=retries, status=STATUS_RETRYING, error_message=error_message)
+            timer = threading.Timer(delay, self.retry_task, args=(task_id,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.log(f"Download failed permanently for {task['url']}: {error_message}")
+            self.update_task(task_id, status=STATUS_ERROR, error_message=error_message)
+
+    def retry_task(self, task_id):
+        task = self.tasks.get(task_id)
+        if not task or task['status'] == STATUS_CANCELLED: return
+        self.update_task(task_id, status=STATUS_QUEUED)
+        self.download_queue.put(task_id)
+        self.wake_scheduler()
+
+    def cancel_task(self, task_id):
+        """
+        Cancels a task and frees its slot at once. A running worker stops at
+        its next cancellation check (or when its FFmpeg process is killed) and
+        is detached from the pool meanwhile, so it no longer counts.
+        """
+        task = self.tasks.get(task_id)
+        if not task: return
+
+        if task['status'] not in FINISHED_STATUSES:
+            pool = self.postprocessors if task['status'] == STATUS_POSTPROCESSING else self.workers
+            task.pop("info", None)
+            task.pop("pp_info", None)
+            self.update_task(task_id, status=STATUS_CANCELLED)
+            future = task.get("future")
+            if future is not None and not future.cancel():
+                pool.detach(future)
+                cancellation.kill_processes(task_id)
+                self.hosts.release(task.pop("host", None))
+            self.wake_scheduler()
+
+    def remove_partial_files(self, task):
+        """Deletes the .part files (and yt-dlp fragment/state files) a cancelled download left behind."""
+        task.pop("partial_sources", None)
+        return sum(self.remove_partial_file(part_path) for part_path in task.pop("partial_files", ()))
+
+    def remove_partial_file(self, part_path):
+        removed = 0
+        final_path = part_path[:-len(".part")] if part_path.endswith(".part") else part_path
+        candidates = [part_path, part_path + ".json", final_path + ".ytdl"] + glob.glob(glob.escape(part_path) + "-Frag*")
+        for path in candidates:
+            if path != final_path and os.path.isfile(path):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    logging.warning(f"Could not remove partial file {path}: {e}")
+        return removed
+
+    def snapshot_partial_files(self, task):
+        """
+        Records a tail checksum of each partial file a failed yt-dlp attempt
+        left, and the server's ETag, Last-Modified and size for it, so the
+        retry can tell whether it is safe to continue from it. The built-in
+        downloaders keep their own checks in a .part.json file.
+
+        This runs on the failed worker's done callback, so the HEAD requests
+        go to the prefetch pool and verify_partial_files collects the result.
+        """
+        snapshots = {}
+        for part_path in task.get("partial_files", ()):
+            if os.path.exists(part_path + ".json"): continue
+            try:
+                size = os.path.getsize(part_path)
+                if not size: continue
+                checks = resume.tail_checks(part_path, [(0, size)])
+            except OSError:
+                continue
+            source = task.get("partial_sources", {}).get(part_path)
+            validators = None
+            if source:
+                try:
+                    validators = self.prefetch_executor.submit(resume.head_validators, self.get_http_session(), *source)
+                except RuntimeError:
+                    pass    # shutting down
+            snapshots[part_path] = {"checks": checks, "validators": validators}
+        task["resume_checks"] = snapshots
+
+    def verify_partial_files(self, task):
+        """
+        Before yt-dlp continues a failed download from its .part files, checks
+        each still ends with the bytes it had when the attempt failed and that
+        the server's copy hasn't changed since. Files that fail either check are
+        deleted so yt-dlp starts them over; the rest count as resumed.
+        """
+        resumed = 0
+        for part_path, snapshot in task.pop("resume_checks", {}).items():
+            if not os.path.exists(part_path): continue
+            problem = None
+            if not resume.verify_tail_checks(part_path, snapshot["checks"]):
+                problem = "its data has changed since the last attempt"
+            elif snapshot["validators"] is not None:
+                try:
+                    saved = snapshot["validators"].result(timeout=resume.HEAD_TIMEOUT)
+                except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+                    saved = None
+                current = resume.head_validators(self.get_http_session(), *task["partial_sources"][part_path]) if saved else None
+                if current and not resume.validators_match(saved, current):
+                    problem = "the file on the server has changed"
+            if problem:
+                self.log(f"Not resuming {part_path}: {problem}. Downloading it again.")
+                self.remove_partial_file(part_path)
+            else:
+                resumed += os.path.getsize(part_path)
+        if resumed:
+            self.record_resume(task, resumed)
+        return resumed
+
+    def start_queue(self):
+        self.stop_event.clear()
+        self.queue_started = True
+        self.log("Manual queue start initiated.")
+        self.wake_scheduler()
+
+    def stop_queue(self):
+        self.stop_event.set()
+        self.queue_started = False
+        while not self.download_queue.empty():
+            try: self.download_queue.get_nowait()
+            except queue.Empty: break
+        with self.dispatch_lock:
+            self.parked.clear()
+        for task_id in self.tasks.ids_with_status(*UNFINISHED_STATUSES):
+            self.cancel_task(task_id)
+        self.log("Stop command issued. All active downloads cancelled.")
+
+    def clear_completed(self):
+        completed_ids = self.tasks.ids_with_status(*FINISHED_STATUSES)
+        for tid in completed_ids:
+            self.tasks.remove(tid)
+            self.progress.reset(tid)
+            self.emit(EVENT_TASK_REMOVED, tid)
+        if self.journal:
+            self.journal.remove(completed_ids)
+        self.log("Cleared completed tasks from view.")
+        return completed_ids
+
+    def has_active_downloads(self):
+        return self.tasks.count(STATUS_DOWNLOADING, STATUS_POSTPROCESSING) > 0
+
+    def is_idle(self):
+        """True once every task has reached a finished status."""
+        return self.tasks.count(*UNFINISHED_STATUSES) == 0
+
+    def wait_until_idle(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.status_changed:
+            while not self.is_idle() and not self.shutdown_event.is_set():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0: return False
+                # The timeout also lets Ctrl+C through on platforms where waits block signals.
+                self.status_changed.wait(min(remaining or 1.0, 1.0))
+        return self.is_idle()
+
+    # --- Scheduler ---
+    def start_scheduler(self):
+        """
+        Starts the dispatch thread. It sleeps until something can change what
+        should run (a task added, finished, retried or cancelled, a settings
+        change, or the next schedule window boundary) instead of polling.
+        """
+        def scheduler_loop():
+            while not self.shutdown_event.is_set():
+                self.scheduler_wakeup.wait(self.seconds_until_next_wakeup())
+                self.scheduler_wakeup.clear()
+                if self.shutdown_event.is_set(): break
+                self.process_queue()
+        threading.Thread(target=scheduler_loop, name="m3udl-scheduler", daemon=True).start()
+        threading.Thread(target=self.adaptive_loop, name="m3udl-adaptive", daemon=True).start()
+        self.apply_metrics_export()
+        self.wake_scheduler()
+
+    # --- Metrics ---
+
+    def metric_gauges(self):
+        return {status.lower(): self.tasks.count(status) for status in UNFINISHED_STATUSES}
+
+    def apply_metrics_export(self):
+        """Starts, stops or moves the metrics endpoint and snapshot file to match the settings."""
+        port, path = self.settings["metrics_port"], self.settings["metrics_file"]
+        if self.metrics_server is not None and self.metrics_server.port != port:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if port and self.metrics_server is None and not self.shutdown_event.is_set():
+            try:
+                self.metrics_server = MetricsServer(self.metrics, port)
+                self.log(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+            except OSError as e:
+                self.log(f"Could not serve metrics on port {port}: {e}")
+
+        if self.metrics_writer is not None and (self.metrics_writer.path != path or self.metrics_writer.interval != self.settings["metrics_interval"]):
+            self.metrics_writer.close()
+            self.metrics_writer = None
+        if path and self.metrics_writer is None and not self.shutdown_event.is_set():
+            self.metrics_writer = SnapshotWriter(self.metrics, path, self.settings["metrics_interval"])
+
+    def stop_metrics_export(self):
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if self.metrics_writer is not None:
+            self.metrics_writer.close()
+            self.metrics_writer = None
+
+    # --- Adaptive Concurrency ---
+
+    def download_slots(self):
+        """How many downloads may run at once: the adaptive level, or the fixed setting."""
+        if self.settings["adaptive_concurrency"]:
+            return self.adaptive.level
+        return self.settings["simultaneous_downloads"]
+
+    def resize_workers(self):
+        """
+        Matches the worker pool to the current slot count. Growing starts queued
+        work right away; shrinking lets running downloads finish and only holds
+        back new dispatches until the count is below the new limit.
+        """
+        self.workers.resize(self.download_slots())
+        if self.max_pool_size() > self.http_session_slots:
+            # Running downloads keep the old session; new ones get pools sized for the extra slots.
+            self.reset_http_session()
+        if self.process_pool is not None:
+            self.process_pool.set_max_idle(self.max_pool_size())
+        self.wake_scheduler()
+
+    def max_pool_size(self):
+        """Most downloads that can ever run at once under the current settings."""
+        if self.settings["adaptive_concurrency"]:
+            return max(self.settings["simultaneous_downloads"], self.settings["adaptive_max_downloads"])
+        return self.settings["simultaneous_downloads"]
+
+    def adaptive_loop(self):
+        last_sample = time.monotonic()
+        while not self.shutdown_event.wait(SAMPLE_INTERVAL):
+            now = time.monotonic()
+            if self.settings["adaptive_concurrency"]:
+                self.adapt_concurrency(now - last_sample)
+            last_sample = now
+
+    def adapt_concurrency(self, elapsed):
+        previous = self.adaptive.level
+        level, reason = self.adaptive.sample(elapsed, self.tasks.count(STATUS_DOWNLOADING))
+        if reason is None: return
+        self.log(f"Adaptive concurrency: {previous} -> {level} simultaneous downloads ({reason}).")
+        self.emit(EVENT_CONCURRENCY, level=level, adaptive=True)
+        self.resize_workers()
+
+    def current_speed_limit(self):
+        """Bytes per second allowed right now across all downloads, or None for unlimited."""
+        limit = self.settings["speed_limit"]
+        if self.settings["enable_scheduling"] and self.settings["schedule_mode"] == SCHEDULE_LIMIT and self.is_within_schedule():
+            limit = self.settings["schedule_speed_limit"]
+        try:
+            return parse_rate(limit)
+        except ValueError:
+            self.log(f"Ignoring invalid speed limit {limit!r}.")
+            return None
+
+    def apply_speed_limit(self):
+        """Points the shared bandwidth bucket at the current tier; running downloads adjust on their next chunk."""
+        rate = self.current_speed_limit()
+        if rate != self.bandwidth.rate:
+            self.bandwidth.set_rate(rate)
+            self.log(f"Speed limit is now {format_bytes(rate) + '/s' if rate else 'unlimited'}.")
+
+    def settings_changed(self):
+        self.adaptive.set_bounds(self.settings["adaptive_min_downloads"], self.settings["adaptive_max_downloads"])
+        self.emit(EVENT_CONCURRENCY, level=self.download_slots(), adaptive=self.settings["adaptive_concurrency"])
+        self.workers.resize(self.download_slots())
+        self.postprocessors.resize(self.settings["postprocess_workers"])
+        self.hosts.per_host_limit = self.settings["per_host_downloads"]
+        self.hosts.cooldown = self.settings["host_cooldown"]
+        if self.settings["worker_mode"] != "process":
+            self.shutdown_process_pool()
+        self.apply_metrics_export()
+        self.wake_scheduler()
+
+    def seconds_until_next_wakeup(self):
+        """The nearer of the next schedule boundary and the next paused host reopening."""
+        waits = [w for w in (self.seconds_until_schedule_change(), self.hosts.seconds_until_reopen()) if w is not None]
+        return min(waits) if waits else None
+
+    def seconds_until_schedule_change(self):
+        """Seconds until the schedule window next opens or closes, or None if there is no schedule."""
+        if not self.settings["enable_scheduling"]: return None
+        try:
+            start = datetime.datetime.strptime(self.settings["start_time"], "%H:%M").time()
+            end = datetime.datetime.strptime(self.settings["end_time"], "%H:%M").time()
+        except ValueError:
+            return None
+        now = datetime.datetime.now()
+        waits = []
+        for boundary in (start, end):
+            at = datetime.datetime.combine(now.date(), boundary)
+            if at <= now: at += datetime.timedelta(days=1)
+            waits.append((at - now).total_seconds())
+        # Land just past the boundary minute so is_within_schedule sees the new state.
+        return min(waits) + 0.5
+
+    def is_within_schedule(self):
+        try:
+            now = datetime.datetime.now().time()
+            start = datetime.datetime.strptime(self.settings["start_time"], "%H:%M").time()
+            end = datetime.datetime.strptime(self.settings["end_time"], "%H:%M").time()
+            if start <= end: return start <= now <= end
+            else: return now >= start or now <= end
+        except ValueError:
+            self.log("Invalid time format in scheduling settings. Ignoring schedule.")
+            return True
+
+    def set_max_workers(self, new_max_workers):
+        if new_max_workers == self.settings["simultaneous_downloads"]: return
+        self.settings["simultaneous_downloads"] = new_max_workers
+        self.log(f"Simultaneous downloads set to {new_max_workers}.")
+        self.resize_workers()
+
+    def shutdown(self):
+        self.shutdown_event.set()
+        self.stop_event.set()
+        self.wake_scheduler()
+        with self.status_changed:
+            self.status_changed.notify_all()
+        self.workers.shutdown()
+        self.postprocessors.shutdown()
+        self.prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        self.shutdown_process_pool()
+        self.stop_metrics_export()
+        if self.journal:
+            self.journal.close()
+        if self.dedup.archive is not None:
+            self.dedup.archive.close()
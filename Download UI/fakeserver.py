@@ -0,0 +1,220 @@
+"""
+Local stand-in for a media host, for benchmarks and manual testing.
+
+Serves synthetic files without touching the disk, so any number and size of
+"videos" can be requested:
+
+    /video/<name>.mp4?size=1048576     a file of `size` bytes (HEAD and Range work)
+    /hls/<name>.m3u8?segments=200&size=65536
+                                       a media playlist of `segments` segments
+                                       (live=1 leaves out #EXT-X-ENDLIST)
+    /hls/<name>/<i>.ts?size=65536      one segment
+
+Any file URL also takes behaviour switches:
+
+    rate=<bytes/s>          send slowly
+    stall_after=<bytes>     stop sending after that many bytes (for `stall` seconds, default 60);
+                            stalls=<n> limits that to the first n requests
+    fail=<n>&code=<status>  answer the first n requests with `code` (default 503);
+                            retry_after=<seconds> adds a Retry-After header
+
+    python fakeserver.py --port 8765
+"""
+import argparse
+import email.utils
+import http.server
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_SIZE = 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+LAST_MODIFIED = email.utils.formatdate(1700000000, usegmt=True)
+CONTENT_TYPES = {"mp4": "video/mp4", "ts": "video/mp2t", "m3u8": "application/vnd.apple.mpegurl"}
+
+_blocks = {}
+
+
+def content_block(name):
+    """The repeating 64 KiB pattern a file's bytes are made of; differs per name so mixed-up files show."""
+    seed = zlib.crc32(name.encode()) & 0xff
+    if seed not in _blocks:
+        _blocks[seed] = bytes((i + seed) & 0xff for i in range(BLOCK_SIZE))
+    return _blocks[seed]
+
+def file_bytes(name, start, end):
+    """Bytes start..end (exclusive) of the synthetic file `name`."""
+    block = content_block(name)
+    out = bytearray()
+    while start < end:
+        offset = start % BLOCK_SIZE
+        piece = block[offset:offset + min(BLOCK_SIZE - offset, end - start)]
+        out += piece
+        start += len(piece)
+    return bytes(out)
+
+def media_playlist(name, segments, size, duration=4, live=False):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{duration}", "#EXT-X-MEDIA-SEQUENCE:0"]
+    for i in range(segments):
+        lines += [f"#EXTINF:{duration:.1f},", f"{name}/{i}.ts?size={size}"]
+    if not live:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+class FakeMediaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        parts = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.server.count_request()
+
+        if self.should_fail(parts.path + "?" + parts.query, params):
+            code = int(params.get("code", 503))
+            self.send_response(code)
+            if "retry_after" in params:
+                self.send_header("Retry-After", params["retry_after"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if parts.path.startswith("/hls/") and parts.path.endswith(".m3u8"):
+            name = parts.path[len("/hls/"):-len(".m3u8")]
+            body = media_playlist(name, int(params.get("segments", 100)), int(params.get("size", BLOCK_SIZE)),
+                                  live=params.get("live") == "1").encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES["m3u8"])
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if send_body: self.wfile.write(body)
+        elif parts.path.startswith(("/video/", "/hls/")):
+            self.send_file(parts.path, params, send_body)
+        else:
+            self.send_error(404)
+
+    def should_fail(self, key, params):
+        failures = int(params.get("fail", 0))
+        return failures > 0 and self.server.count_attempt(key) <= failures
+
+    def send_file(self, path, params, send_body):
+        name = path.rsplit("/", 1)[-1]
+        ext = name.rsplit(".", 1)[-1] if "." in name else "mp4"
+        size = int(params.get("size", DEFAULT_SIZE))
+        start, end = 0, size
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes="):
+            first, _, last = range_header[len("bytes="):].split(",")[0].partition("-")
+            start = int(first) if first else max(0, size - int(last))
+            end = min(size, int(last) + 1) if first and last else size
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(ext, "application/octet-stream"))
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{zlib.crc32(path.encode()):08x}-{size}"')
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        if not send_body: return
+
+        rate = float(params.get("rate", 0))
+        stall_after = int(params["stall_after"]) if "stall_after" in params else None
+        if stall_after is not None and "stalls" in params and self.server.count_attempt(path + "#stall") > int(params["stalls"]):
+            stall_after = None
+        sent = 0
+        try:
+            while start < end:
+                chunk = file_bytes(path, start, min(end, start + BLOCK_SIZE))
+                if stall_after is not None and sent + len(chunk) > stall_after:
+                    self.wfile.write(chunk[:max(0, stall_after - sent)])
+                    self.wfile.flush()
+                    time.sleep(float(params.get("stall", 60)))
+                    self.close_connection = True
+                    return
+                self.wfile.write(chunk)
+                start += len(chunk)
+                sent += len(chunk)
+                if rate:
+                    time.sleep(len(chunk) / rate)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeMediaServer(http.server.ThreadingHTTPServer):
+    """Runs on its own daemon thread; port 0 picks a free port."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, host="127.0.0.1"):
+        super().__init__((host, port), FakeMediaHandler)
+        self.attempts = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def count_attempt(self, key):
+        with self.lock:
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            return self.attempts[key]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-media-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve synthetic videos and HLS playlists for testing M3UDL.")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    server = FakeMediaServer(args.port)
+    print(f"Serving on {server.url('/')} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Built-in HLS (M3U8) downloader.
+
+Parses master and media playlists, picks a variant from the "video_quality"
+setting and fetches media segments concurrently over a pooled requests
+session. Segments are decrypted (AES-128) and appended to the output file in
+playlist order as soon as every earlier segment has arrived. The number of
+segments written is saved alongside the .part file, so a retry continues from
+the next segment as long as the playlist and the partial data still match.
+"""
+import concurrent.futures
+import importlib.util
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from urllib.parse import urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import resume
+
+# yt-dlp's AES helpers are imported when an encrypted segment comes along, not at startup.
+AES_AVAILABLE = importlib.util.find_spec("yt_dlp") is not None
+
+DEFAULT_SEGMENT_CONCURRENCY = 8
+SEGMENT_RETRIES = 3
+REQUEST_TIMEOUT = (10, 30)
+RESUME_STATE_INTERVAL = 1.0
+READ_CHUNK = 64 * 1024
+CANCEL_POLL_INTERVAL = 0.2
+
+QUALITY_MAX_HEIGHT = {"1080p": 1080, "720p": 720, "480p": 480}
+
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+INVALID_FILENAME_CHARS_RE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+class HLSError(Exception):
+    pass
+
+class HLSUnsupported(HLSError):
+    """The stream needs features the built-in downloader doesn't handle (use yt-dlp instead)."""
+
+class HLSCancelled(HLSError):
+    pass
+
+class HLSRateLimited(HLSError):
+    """The server answered 429; retrying right away would only make it worse."""
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_hls_url(url):
+    path = urlparse(url).path.lower()
+    return path.endswith(".m3u8") or path.endswith(".m3u")
+
+def create_session(settings, pool_size=DEFAULT_SEGMENT_CONCURRENCY, hosts=10):
+    """
+    Creates a keep-alive session with a connection pool of pool_size for each
+    of up to `hosts` hosts, so concurrent segment fetches reuse connections.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=hosts, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if settings.get("user_agent"):
+        session.headers["User-Agent"] = settings["user_agent"]
+    if settings.get("proxy"):
+        session.proxies = {"http": settings["proxy"], "https": settings["proxy"]}
+    return session
+
+def parse_attributes(text):
+    attributes = {}
+    for key, value in ATTRIBUTE_RE.findall(text):
+        attributes[key] = value[1:-1] if value.startswith('"') else value
+    return attributes
+
+def parse_master_playlist(text, base_url):
+    variants, audio_groups = [], {}
+    lines = [line.strip() for line in text.splitlines()]
+    for i, line in enumerate(lines):
+        if line.startswith("#EXT-X-MEDIA:"):
+            attrs = parse_attributes(line[len("#EXT-X-MEDIA:"):])
+            if attrs.get("TYPE") == "AUDIO":
+                audio_groups.setdefault(attrs.get("GROUP-ID"), []).append(attrs)
+        elif line.startswith("#EXT-X-STREAM-INF:"):
+            attrs = parse_attributes(line[len("#EXT-X-STREAM-INF:"):])
+            uri = next((l for l in lines[i + 1:] if l and not l.startswith("#")), None)
+            if not uri: continue
+            width, height = 0, 0
+            if "RESOLUTION" in attrs and "x" in attrs["RESOLUTION"]:
+                width, height = (int(v) for v in attrs["RESOLUTION"].split("x", 1))
+            variants.append({
+                "url": urljoin(base_url, uri),
+                "bandwidth": int(attrs.get("BANDWIDTH", 0) or 0),
+                "width": width, "height": height,
+                "audio_group": attrs.get("AUDIO"),
+            })
+    return variants, audio_groups
+
+def parse_media_playlist(text, base_url):
+    segments = []
+    media_sequence = 0
+    key = None
+    init_segment = None
+    duration = None
+    byterange = None
+    next_offset = 0
+    ended = False
+    for line in (l.strip() for l in text.splitlines()):
+        if not line: continue
+        if line == "#EXT-X-ENDLIST" or line == "#EXT-X-PLAYLIST-TYPE:VOD":
+            ended = True
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            media_sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-KEY:"):
+            attrs = parse_attributes(line[len("#EXT-X-KEY:"):])
+            method = attrs.get("METHOD", "NONE")
+            if method == "NONE":
+                key = None
+            elif method == "AES-128":
+                key = {"uri": urljoin(base_url, attrs["URI"]), "iv": attrs.get("IV")}
+            else:
+                raise HLSUnsupported(f"encryption method {method}")
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = parse_attributes(line[len("#EXT-X-MAP:"):])
+            init_segment = {"url": urljoin(base_url, attrs["URI"]), "byterange": None, "key": key}
+            if "BYTERANGE" in attrs:
+                length, _, offset = attrs["BYTERANGE"].partition("@")
+                init_segment["byterange"] = (int(offset or 0), int(length))
+        elif line.startswith("#EXTINF:"):
+            duration = float(line[len("#EXTINF:"):].split(",", 1)[0] or 0)
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            length, _, offset = line.split(":", 1)[1].partition("@")
+            start = int(offset) if offset else next_offset
+            byterange = (start, int(length))
+            next_offset = start + int(length)
+        elif not line.startswith("#"):
+            segments.append({
+                "url": urljoin(base_url, line),
+                "sequence": media_sequence + len(segments),
+                "duration": duration, "key": key, "byterange": byterange,
+            })
+            duration, byterange = None, None
+    # Without ENDLIST the playlist is live: it only lists the current window and keeps growing.
+    return {"segments": segments, "init_segment": init_segment, "ended": ended}
+
+def select_variant(variants, video_quality="best"):
+    ordered = sorted(variants, key=lambda v: (v["height"], v["bandwidth"]))
+    if video_quality == "worst":
+        return ordered[0]
+    max_height = QUALITY_MAX_HEIGHT.get(video_quality)
+    if max_height:
+        fitting = [v for v in ordered if v["height"] and v["height"] <= max_height]
+        if fitting:
+            return fitting[-1]
+        return ordered[0]
+    return ordered[-1]
+
+def render_filename(template, title, ext):
+    """Renders the simple %(title)s / %(id)s / %(ext)s subset of a yt-dlp output template."""
+    class Fields(dict):
+        def __missing__(self, key): return "NA"
+    try:
+        name = template % Fields(title=title, id=title, ext=ext)
+    except (TypeError, ValueError):
+        name = f"{title}.{ext}"
+    return INVALID_FILENAME_CHARS_RE.sub("_", name)
+
+
+class HLSDownloader:
+    def __init__(self, session, concurrency=DEFAULT_SEGMENT_CONCURRENCY, progress_hook=None, is_cancelled=None, throttle=None):
+        self.session = session
+        self.throttle = throttle
+        self.concurrency = max(1, concurrency)
+        self.progress_hook = progress_hook
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.keys = {}
+        self.keys_lock = threading.Lock()
+
+    def fetch(self, url, byterange=None):
+        headers = {}
+        if byterange:
+            start, length = byterange
+            headers["Range"] = f"bytes={start}-{start + length - 1}"
+        for attempt in range(SEGMENT_RETRIES + 1):
+            if self.is_cancelled():
+                raise HLSCancelled("Download cancelled by user.")
+            try:
+                response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+                # Closing the response on every path returns its connection to the pool, errors included.
+                with response:
+                    if response.status_code == 429:
+                        retry_after = response.headers.get("Retry-After", "")
+                        raise HLSRateLimited(f"HTTP Error 429: Too Many Requests ({url})",
+                                             retry_after=int(retry_after) if retry_after.isdigit() else None)
+                    response.raise_for_status()
+                    # Read in chunks so a cancel is noticed mid-segment and the bandwidth limit paces the transfer itself.
+                    chunks = []
+                    for chunk in response.iter_content(READ_CHUNK):
+                        if self.is_cancelled():
+                            raise HLSCancelled("Download cancelled by user.")
+                        if self.throttle:
+                            self.throttle(len(chunk))
+                        chunks.append(chunk)
+                return b"".join(chunks)
+            except requests.RequestException as e:
+                if attempt == SEGMENT_RETRIES:
+                    raise HLSError(f"Failed to fetch {url}: {e}") from e
+                time.sleep(0.5 * 2 ** attempt)
+
+    def get_key(self, uri):
+        with self.keys_lock:
+            if uri not in self.keys:
+                self.keys[uri] = self.fetch(uri)
+            return self.keys[uri]
+
+    def fetch_segment(self, segment):
+        data = self.fetch(segment["url"], segment["byterange"])
+        key = segment["key"]
+        if key:
+            if not AES_AVAILABLE:
+                raise HLSUnsupported("AES-128 decryption requires yt-dlp")
+            # These use pycryptodomex (see requirements.txt) when it is installed; without it yt-dlp falls
+            # back to pure-Python AES, which decrypts only a few hundred KB/s.
+            from yt_dlp.aes import aes_cbc_decrypt_bytes, unpad_pkcs7
+            if key["iv"]:
+                iv = bytes.fromhex(key["iv"][2:] if key["iv"].lower().startswith("0x") else key["iv"]).rjust(16, b"\0")
+            else:
+                iv = segment["sequence"].to_bytes(16, "big")
+            data = unpad_pkcs7(aes_cbc_decrypt_bytes(data, self.get_key(key["uri"]), iv))
+        return data
+
+    def resolve_media_playlist(self, url, video_quality):
+        text = self.fetch(url).decode("utf-8", "replace")
+        if not text.lstrip().startswith("#EXTM3U"):
+            raise HLSUnsupported("not an M3U8 playlist")
+        if "#EXT-X-STREAM-INF" in text:
+            variants, audio_groups = parse_master_playlist(text, url)
+            if not variants:
+                raise HLSError("Master playlist has no variants")
+            variant = select_variant(variants, video_quality)
+            if any(r.get("URI") for r in audio_groups.get(variant["audio_group"], [])):
+                raise HLSUnsupported("separate audio renditions need merging")
+            url = variant["url"]
+            text = self.fetch(url).decode("utf-8", "replace")
+        media = parse_media_playlist(text, url)
+        media["url"] = url
+        return media
+
+    @staticmethod
+    def segments_fingerprint(media):
+        # Paths only: signed query strings on segment URLs often change from one request to the next.
+        return zlib.crc32("\n".join(urlparse(segment["url"]).path for segment in media["segments"]).encode())
+
+    @classmethod
+    def load_resume_state(cls, part_path, media):
+        """
+        Returns (segments_done, bytes) recorded for an interrupted download of
+        the same media playlist, or (0, 0) if there is nothing usable to resume.
+        """
+        try:
+            with open(part_path + ".json", "r") as f: state = json.load(f)
+            if (state["playlist"] != media["url"] or state["segment_count"] != len(media["segments"])
+                    or state["segments"] != cls.segments_fingerprint(media)):
+                return 0, 0
+            if os.path.getsize(part_path) < state["bytes"]:
+                return 0, 0
+            if not resume.verify_tail_checks(part_path, state["checks"]):
+                logging.warning(f"Partial download {part_path} is damaged; starting over.")
+                return 0, 0
+            return state["segments_done"], state["bytes"]
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    @classmethod
+    def save_resume_state(cls, part_path, media, segments_done, written_bytes):
+        tmp_path = part_path + ".json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"playlist": media["url"], "segment_count": len(media["segments"]), "segments": cls.segments_fingerprint(media),
+                       "segments_done": segments_done, "bytes": written_bytes,
+                       "checks": resume.tail_checks(part_path, [(0, written_bytes)])}, f)
+        os.replace(tmp_path, part_path + ".json")
+
+    def wait_for_segment(self, future):
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                if self.is_cancelled():
+                    raise HLSCancelled("Download cancelled by user.")
+
+    def report(self, status, **data):
+        if self.progress_hook:
+            self.progress_hook(dict(status=status, **data))
+
+    def download(self, url, output_path, video_quality="best", sequence_number=None, output_template="%(title)s.%(ext)s"):
+        media = self.resolve_media_playlist(url, video_quality)
+        if not media["ended"]:
+            raise HLSUnsupported("live stream (no #EXT-X-ENDLIST)")
+        segments = media["segments"]
+        if not segments:
+            raise HLSError("Media playlist has no segments")
+
+        ext = "mp4" if media["init_segment"] else "ts"
+        if sequence_number is not None:
+            filename = f"{sequence_number}.{ext}"
+        else:
+            path = urlparse(url).path.rstrip("/")
+            title = os.path.splitext(os.path.basename(path))[0] or "video"
+            if title.lower() in ("index", "playlist", "master", "prog_index", "chunklist"):
+                title = os.path.basename(os.path.dirname(path)) or title
+            filename = render_filename(output_template, title, ext)
+        os.makedirs(output_path, exist_ok=True)
+        filepath = os.path.join(output_path, filename)
+        part_path = filepath + ".part"
+
+        start_index, downloaded_bytes = self.load_resume_state(part_path, media)
+        segments_done = start_index
+        window = self.concurrency * 2
+        last_state_save = time.monotonic()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            with open(part_path, "r+b" if start_index else "wb") as out:
+                self.report("downloading", downloaded_bytes=downloaded_bytes, filename=filepath, tmpfilename=part_path,
+                            **({"resumed_bytes": downloaded_bytes} if start_index else {}))
+                if start_index:
+                    # Drop anything written after the last recorded segment boundary.
+                    out.truncate(downloaded_bytes)
+                    out.seek(downloaded_bytes)
+                elif media["init_segment"]:
+                    data = self.fetch_segment(dict(media["init_segment"], sequence=0))
+                    out.write(data)
+                    downloaded_bytes += len(data)
+
+                pending, next_submit = {}, start_index
+                for index in range(start_index, len(segments)):
+                    while next_submit < len(segments) and next_submit < index + window:
+                        pending[next_submit] = pool.submit(self.fetch_segment, segments[next_submit])
+                        next_submit += 1
+                    data = self.wait_for_segment(pending.pop(index))
+                    out.write(data)
+                    downloaded_bytes += len(data)
+                    segments_done = index + 1
+                    if time.monotonic() - last_state_save >= RESUME_STATE_INTERVAL:
+                        out.flush()
+                        self.save_resume_state(part_path, media, index + 1, downloaded_bytes)
+                        last_state_save = time.monotonic()
+                    self.report("downloading", downloaded_bytes=downloaded_bytes, filename=filepath, tmpfilename=part_path,
+                                total_bytes_estimate=downloaded_bytes * len(segments) // (index + 1),
+                                fragment_index=index + 1, fragment_count=len(segments))
+        except BaseException:
+            # Segment threads only fetch; nothing else touches the file, so there's no need to wait for them.
+            pool.shutdown(wait=False, cancel_futures=True)
+            if segments_done > start_index:
+                # The file is closed and complete up to here; a retry continues from the next segment.
+                try:
+                    self.save_resume_state(part_path, media, segments_done, downloaded_bytes)
+                except OSError:
+                    pass
+            raise
+        pool.shutdown(wait=True)
+
+        os.replace(part_path, filepath)
+        if os.path.exists(part_path + ".json"):
+            os.remove(part_path + ".json")
+        self.report("finished", filename=filepath, downloaded_bytes=downloaded_bytes, total_bytes=downloaded_bytes)
+        return filepath
@@ -0,0 +1,91 @@
+"""
+Per-host dispatch limits.
+
+Tracks how many downloads are running against each host so a bulk list from
+one site can't take every slot, and keeps a circuit breaker per host: when a
+site answers with HTTP 429 it is left alone for a cooldown (doubling while it
+keeps rate-limiting us) and its queued work waits while other hosts' tasks
+use the free slots.
+"""
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_PER_HOST_LIMIT = 2
+DEFAULT_COOLDOWN = 30
+MAX_COOLDOWN = 15 * 60
+
+# "HTTP Error 429: Too Many Requests" (yt-dlp, urllib), "429 Client Error: Too Many Requests" (requests).
+RATE_LIMITED_RE = re.compile(r"HTTP Error 429\b|too many requests", re.IGNORECASE)
+
+
+def host_key(url):
+    """Groups URLs by host name, ignoring case, port and a leading "www."."""
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def is_rate_limited(message):
+    return bool(message) and RATE_LIMITED_RE.search(message) is not None
+
+
+class HostLimiter:
+    def __init__(self, per_host_limit=DEFAULT_PER_HOST_LIMIT, cooldown=DEFAULT_COOLDOWN):
+        self.per_host_limit = per_host_limit
+        self.cooldown = cooldown
+        self.active = {}        # host -> running downloads
+        self.open_until = {}    # host -> monotonic time the breaker closes again
+        self.strikes = {}       # host -> consecutive rate-limit trips
+        self.lock = threading.Lock()
+
+    def is_paused(self, host):
+        with self.lock:
+            until = self.open_until.get(host)
+            if until is None: return False
+            if time.monotonic() < until: return True
+            del self.open_until[host]
+            return False
+
+    def can_start(self, host):
+        if self.is_paused(host): return False
+        with self.lock:
+            return not self.per_host_limit or self.active.get(host, 0) < self.per_host_limit
+
+    def acquire(self, host):
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+
+    def release(self, host):
+        if host is None: return
+        with self.lock:
+            count = self.active.get(host, 0) - 1
+            if count > 0: self.active[host] = count
+            else: self.active.pop(host, None)
+
+    def trip(self, host, retry_after=None):
+        """Opens the breaker for a host that rate-limited us. Returns the pause in seconds."""
+        with self.lock:
+            now = time.monotonic()
+            if self.open_until.get(host, 0) > now:
+                # Other downloads from the same burst; the breaker is already open.
+                return self.open_until[host] - now
+            strikes = self.strikes.get(host, 0) + 1
+            self.strikes[host] = strikes
+            pause = min(self.cooldown * 2 ** (strikes - 1), MAX_COOLDOWN)
+            if retry_after:
+                pause = min(max(pause, retry_after), MAX_COOLDOWN)
+            self.open_until[host] = now + pause
+            return pause
+
+    def succeeded(self, host):
+        with self.lock:
+            self.strikes.pop(host, None)
+
+    def seconds_until_reopen(self):
+        """Seconds until the next paused host may be dispatched to again, or None."""
+        with self.lock:
+            now = time.monotonic()
+            for host in [h for h, until in self.open_until.items() if until <= now]:
+                del self.open_until[host]
+            if not self.open_until: return None
+            return min(self.open_until.values()) - now
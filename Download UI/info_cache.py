@@ -0,0 +1,102 @@
+"""
+On-disk cache of yt-dlp extraction results.
+
+Entries are addressed by a hash of everything that affects extraction (URL,
+user agent, proxy), expire after a TTL, and the least recently used ones are
+evicted once the cache grows past its size budget.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+INFO_CACHE_DIR = os.path.join("m3udl_cache", "info")
+DEFAULT_TTL = 3 * 3600
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class InfoCache:
+    def __init__(self, directory=INFO_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".json.gz"))
+
+    @staticmethod
+    def make_key(url, settings):
+        material = json.dumps([url, settings.get("user_agent") or "", settings.get("proxy") or ""])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.ttl:
+                self.invalidate(key)
+                return None
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                info = json.load(f)
+            # atime tracks recency for eviction; mtime stays the creation time for the TTL.
+            os.utime(path, (time.time(), stat.st_mtime))
+            return info
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self.invalidate(key)
+            return None
+
+    def put(self, key, info):
+        path = self.path_for(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(info, f)
+            size = os.path.getsize(tmp_path)
+            with self.lock:
+                if os.path.exists(path):
+                    self.total_bytes -= os.path.getsize(path)
+                os.replace(tmp_path, path)
+                self.total_bytes += size
+                if self.total_bytes > self.max_bytes:
+                    self._evict()
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Could not cache extraction result: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def invalidate(self, key):
+        path = self.path_for(key)
+        with self.lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Drops expired entries, then least recently used ones, down to 90% of the budget."""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json.gz"): continue
+            stat = entry.stat()
+            entries.append((now - stat.st_mtime > self.ttl, stat.st_atime, stat.st_size, entry.path))
+        # Expired first, then oldest access.
+        entries.sort(key=lambda e: (not e[0], e[1]))
+        target = self.max_bytes * 0.9
+        for expired, _, size, path in entries:
+            if self.total_bytes <= target and not expired: break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                pass
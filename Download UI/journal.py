@@ -0,0 +1,124 @@
+"""
+Persistent job journal.
+
+Every task the engine knows about is mirrored into an SQLite database (WAL
+mode) so queued and half-finished downloads survive a crash or restart.
+Writes are handed to a background thread that commits them in batches,
+which keeps bulk imports from paying one fsync per URL.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+JOURNAL_FILE = "m3udl_jobs.db"
+JOURNAL_FIELDS = ("url", "output_path", "sequence_number", "status", "retries", "final_filepath", "filename", "error_message", "playlist_title")
+MAX_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    sequence_number INTEGER,
+    status TEXT NOT NULL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    final_filepath TEXT,
+    filename TEXT,
+    error_message TEXT,
+    playlist_title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+
+class JobJournal:
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if "playlist_title" not in columns:
+            # Journals written before playlist imports existed.
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN playlist_title TEXT")
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.writer = threading.Thread(target=self._writer_loop, name="m3udl-journal", daemon=True)
+        self.writer.start()
+
+    # --- Writes (asynchronous, batched) ---
+
+    def record(self, task):
+        now = time.time()
+        row = [task["id"]] + [task.get(field) for field in JOURNAL_FIELDS] + [now, now]
+        self.pending.put(("record", row))
+
+    def update(self, task_id, fields):
+        fields = {k: v for k, v in fields.items() if k in JOURNAL_FIELDS}
+        if fields:
+            self.pending.put(("update", task_id, fields))
+
+    def remove(self, task_ids):
+        self.pending.put(("remove", list(task_ids)))
+
+    def flush(self, timeout=5):
+        """Blocks until everything queued so far has been committed."""
+        done = threading.Event()
+        self.pending.put(("flush", done))
+        done.wait(timeout)
+
+    def close(self):
+        self.flush()
+        self.pending.put(("stop",))
+        self.writer.join(timeout=5)
+        with self.lock:
+            self.conn.close()
+
+    def _writer_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < MAX_BATCH:
+                try: batch.append(self.pending.get_nowait())
+                except queue.Empty: break
+
+            flushed, stop = [], False
+            try:
+                with self.lock, self.conn:
+                    for op in batch:
+                        if op[0] == "record":
+                            columns = ("id",) + JOURNAL_FIELDS + ("created_at", "updated_at")
+                            self.conn.execute(
+                                f"INSERT OR REPLACE INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", op[1])
+                        elif op[0] == "update":
+                            _, task_id, fields = op
+                            assignments = ", ".join(f"{name} = ?" for name in fields)
+                            self.conn.execute(f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                                              list(fields.values()) + [time.time(), task_id])
+                        elif op[0] == "remove":
+                            self.conn.executemany("DELETE FROM jobs WHERE id = ?", [(tid,) for tid in op[1]])
+                        elif op[0] == "flush":
+                            flushed.append(op[1])
+                        elif op[0] == "stop":
+                            stop = True
+            except sqlite3.Error:
+                logging.exception("Failed to write to the job journal.")
+            for done in flushed:
+                done.set()
+            if stop:
+                return
+
+    # --- Reads ---
+
+    def load_unfinished(self, finished_statuses):
+        placeholders = ", ".join("?" * len(finished_statuses))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM jobs WHERE status NOT IN ({placeholders}) ORDER BY created_at, rowid",
+                list(finished_statuses)).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,119 @@
+"""
+Log pipeline.
+
+Logging calls only put the record on a queue; one listener thread formats
+them and writes the rotating text log (and, if enabled, a JSON-lines event
+log), so worker threads never wait on file I/O. The GUI's log view is fed
+from a LogBuffer that any thread can push to without touching Tk; the Tk
+thread drains it in batches on a timer and keeps only the newest lines.
+"""
+import collections
+import json
+import logging
+import logging.handlers
+import queue
+
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+EVENTS_LOG_FILE = "m3udl_events.jsonl"
+EVENTS_LOGGER = "m3udl.events"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+events_logger = logging.getLogger(EVENTS_LOGGER)
+events_logger.propagate = False     # task events go to the JSON-lines file only
+events_logger.setLevel(logging.INFO)
+
+_listener = None
+_events_handler = None
+
+
+class JSONLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": round(record.created, 3), "task_id": getattr(record, "task_id", None), "stage": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+class _OnlyEvents(logging.Filter):
+    def filter(self, record):
+        return record.name == EVENTS_LOGGER
+
+class _NoEvents(logging.Filter):
+    def filter(self, record):
+        return record.name != EVENTS_LOGGER
+
+
+def setup_logging(log_file, events_file=None, console=True):
+    """
+    Routes the root logger and the task events logger through a queue to a
+    background listener. Returns the listener; stop_logging() flushes it.
+    """
+    global _listener
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+    events_logger.addHandler(queue_handler)
+
+    file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    handlers = [file_handler]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.addFilter(_NoEvents())
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    set_events_file(events_file)
+    return _listener
+
+def set_events_file(path):
+    """Starts or stops writing task events to a JSON-lines file (None stops)."""
+    global _events_handler
+    if _listener is None: return
+    old, _events_handler = _events_handler, None
+    handlers = [h for h in _listener.handlers if h is not old]
+    if path:
+        _events_handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+        _events_handler.setFormatter(JSONLinesFormatter())
+        _events_handler.addFilter(_OnlyEvents())
+        handlers.append(_events_handler)
+    _listener.handlers = tuple(handlers)
+    if old is not None:
+        old.close()
+
+def stop_logging():
+    if _listener is not None:
+        _listener.stop()
+
+def events_enabled():
+    return _events_handler is not None
+
+def log_event(task_id, stage, **fields):
+    """Writes one JSON-lines record, e.g. log_event(task_id, "download_finished", seconds=12.5)."""
+    if _events_handler is None: return
+    events_logger.info(stage, extra={"task_id": task_id, "fields": fields})
+
+
+class LogBuffer:
+    """
+    Bounded hand-off between any thread and the Tk thread. deque appends and
+    pops are atomic, so pushing takes no lock; if the view falls behind the
+    oldest lines are dropped instead of memory growing.
+    """
+
+    def __init__(self, maxlen=5000):
+        self.lines = collections.deque(maxlen=maxlen)
+
+    def push(self, line):
+        self.lines.append(line)
+
+    def drain(self, limit=None):
+        batch = []
+        while self.lines and (limit is None or len(batch) < limit):
+            try:
+                batch.append(self.lines.popleft())
+            except IndexError:
+                break
+        return batch
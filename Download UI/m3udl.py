@@ -0,0 +1,153 @@
+"""
+Headless command line front-end for the M3UDL download engine.
+
+    python m3udl.py run urls.txt --jobs 8 --output ~/Downloads
+"""
+import argparse
+import itertools
+import os
+import sys
+from pathlib import Path
+
+from engine import (
+    DownloadEngine, load_settings, LOG_FILE, SETTINGS_FILE,
+    STATUS_COMPLETED, STATUS_ERROR, STATUS_CANCELLED,
+    EVENT_TASK_UPDATED,
+)
+import logpipe
+from journal import JobJournal, JOURNAL_FILE
+from archive import DownloadArchive, ARCHIVE_FILE
+from bulk_import import BATCH_SIZE, ImportFailed, read_entries
+from info_cache import InfoCache, INFO_CACHE_DIR
+
+
+def print_event(engine):
+    def subscriber(event, task_id, data):
+        status = data.get("status")
+        if event == EVENT_TASK_UPDATED and status in (STATUS_COMPLETED, STATUS_ERROR, STATUS_CANCELLED):
+            task = engine.tasks.get(task_id, {})
+            print(f"[{status}] {task.get('filename') or task.get('url')}", flush=True)
+    return subscriber
+
+def run(args):
+    if not os.path.exists(args.file):
+        print(f"Error: URL file not found: {args.file}", file=sys.stderr)
+        return 2
+
+    settings = load_settings(args.settings)
+    settings["autopilot"] = True
+    if args.metrics_port is not None:
+        settings["metrics_port"] = args.metrics_port
+    if args.metrics_file is not None:
+        settings["metrics_file"] = args.metrics_file
+    if args.json_log or settings["json_log"]:
+        logpipe.set_events_file(args.json_log or logpipe.EVENTS_LOG_FILE)
+    if args.jobs:
+        settings["simultaneous_downloads"] = args.jobs
+    if args.adaptive:
+        settings["adaptive_concurrency"] = True
+        if args.jobs:
+            settings["adaptive_max_downloads"] = args.jobs
+    if args.processes:
+        settings["worker_mode"] = "process"
+    if args.per_host is not None:
+        settings["per_host_downloads"] = args.per_host
+    if args.postprocess_jobs:
+        settings["postprocess_workers"] = args.postprocess_jobs
+    if args.limit_rate is not None:
+        settings["speed_limit"] = args.limit_rate
+    if args.connections:
+        settings["direct_connections"] = args.connections
+    if args.ignore_schedule:
+        settings["enable_scheduling"] = False
+    if args.allow_duplicates:
+        settings["skip_duplicates"] = False
+
+    journal = None
+    if not args.no_journal:
+        journal = JobJournal(args.journal or os.path.join(os.path.dirname(os.path.abspath(args.settings)), JOURNAL_FILE))
+
+    info_cache = None
+    if not args.no_info_cache:
+        info_cache = InfoCache(os.path.join(os.path.dirname(os.path.abspath(args.settings)), INFO_CACHE_DIR),
+                               ttl=settings["info_cache_ttl"], max_bytes=settings["info_cache_max_mb"] * 1024 * 1024)
+
+    archive = None
+    if not args.no_archive:
+        archive = DownloadArchive(args.archive or os.path.join(os.path.dirname(os.path.abspath(args.settings)), ARCHIVE_FILE))
+
+    engine = DownloadEngine(settings, journal=journal, info_cache=info_cache, archive=archive)
+    # Overlaps loading yt-dlp with reading the URL file.
+    engine.preload()
+    if not args.quiet:
+        engine.subscribe(print_event(engine))
+
+    output_path = os.path.expanduser(args.output)
+    engine.restore_jobs()
+    # Jobs restored from an interrupted run already cover these URLs.
+    restored = {(t["url"], t["output_path"]) for t in engine.tasks.values()}
+    entries = ((url, title) for url, title in read_entries(args.file) if (url, output_path) not in restored)
+    added = skipped = 0
+    try:
+        for batch in iter(lambda: list(itertools.islice(entries, BATCH_SIZE)), []):
+            added_ids, skipped_count = engine.add_tasks(batch, output_path, sequential=args.sequential)
+            added, skipped = added + len(added_ids), skipped + skipped_count
+    except ImportFailed as e:
+        print(f"Error: {e}", file=sys.stderr)
+        engine.shutdown()
+        return 2
+    engine.log(f"Added {added} URLs to queue from file." + (f" Skipped {skipped} duplicates." if skipped else ""))
+
+    engine.start_scheduler()
+    try:
+        engine.wait_until_idle()
+    except KeyboardInterrupt:
+        engine.log("Interrupted. Cancelling remaining downloads.")
+        engine.stop_queue()
+    finally:
+        engine.shutdown()
+
+    failed = sum(1 for t in engine.tasks.values() if t["status"] != STATUS_COMPLETED)
+    engine.log(f"Finished: {len(engine.tasks) - failed} completed, {failed} failed or cancelled.")
+    return 1 if failed else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="m3udl", description="Headless M3UDL downloader.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Download every URL listed in a text file.")
+    run_parser.add_argument("file", help="Text file with one URL per line ('#' lines are ignored), or an .m3u/.m3u8 playlist.")
+    run_parser.add_argument("-j", "--jobs", type=int, default=None, help="Simultaneous downloads (defaults to the saved setting).")
+    run_parser.add_argument("--adaptive", action="store_true", help="Tune the number of simultaneous downloads automatically (up to --jobs if given).")
+    run_parser.add_argument("--processes", action="store_true", help="Run yt-dlp jobs in reusable worker processes instead of threads.")
+    run_parser.add_argument("--per-host", type=int, default=None, help="Simultaneous downloads from one site, 0 for no limit (defaults to the saved setting).")
+    run_parser.add_argument("--postprocess-jobs", type=int, default=None, help="Simultaneous FFmpeg post-processing jobs (defaults to the saved setting).")
+    run_parser.add_argument("-o", "--output", default=str(Path.home() / "Downloads"), help="Output folder.")
+    run_parser.add_argument("-r", "--limit-rate", default=None, help="Total speed limit for all downloads, e.g. 500K or 2M (defaults to the saved setting).")
+    run_parser.add_argument("-c", "--connections", type=int, default=None, help="Connections per direct file link (defaults to the saved setting).")
+    run_parser.add_argument("--sequential", action="store_true", help="Use sequential numbering (1, 2, 3...).")
+    run_parser.add_argument("--settings", default=SETTINGS_FILE, help="Settings file shared with the GUI.")
+    run_parser.add_argument("--journal", default=None, help=f"Job journal database (defaults to {JOURNAL_FILE} next to the settings file).")
+    run_parser.add_argument("--no-journal", action="store_true", help="Don't record or resume jobs.")
+    run_parser.add_argument("--archive", default=None, help=f"Archive of finished downloads (defaults to {ARCHIVE_FILE} next to the settings file).")
+    run_parser.add_argument("--no-archive", action="store_true", help="Don't record finished downloads or skip URLs downloaded before.")
+    run_parser.add_argument("--allow-duplicates", action="store_true", help="Queue URLs even if they are already queued or downloaded.")
+    run_parser.add_argument("--no-info-cache", action="store_true", help="Always run the extractor instead of reusing cached results.")
+    run_parser.add_argument("--ignore-schedule", action="store_true", help="Download now even if scheduling is enabled.")
+    run_parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics, 0 for off (defaults to the saved setting).")
+    run_parser.add_argument("--metrics-file", default=None, metavar="FILE", help="Rewrite a JSON metrics snapshot to FILE every few seconds (defaults to the saved setting).")
+    run_parser.add_argument("--json-log", default=None, metavar="FILE", help="Also write per-task stage timings as JSON lines to FILE.")
+    run_parser.add_argument("-q", "--quiet", action="store_true", help="Only log, don't print per-task results.")
+    run_parser.set_defaults(func=run)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logpipe.setup_logging(LOG_FILE)
+    try:
+        return args.func(args)
+    finally:
+        logpipe.stop_logging()
+
+if __name__ == "__main__":
+    sys.exit(main())
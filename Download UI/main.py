@@ -1,92 +1,46 @@
+import time
+STARTED = time.perf_counter()   # for the startup time logged once the window is up
+
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox
-import concurrent.futures
-import queue
-import threading
 import os
-import json
-import time
-import logging
 import datetime
-import uuid
+import logging
+import queue
 import subprocess
 import sys
 from pathlib import Path
 
-# --- Dependency Check ---
-try:
-    import yt_dlp
-    YT_DLP_AVAILABLE = True
-except ImportError:
-    YT_DLP_AVAILABLE = False
-
-def check_ffmpeg():
-    """Checks if FFmpeg is available in the system PATH."""
-    try:
-        startupinfo = None
-        if sys.platform == "win32":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        
-        # Run a simple command to check for existence
-        subprocess.run(['ffmpeg', '-version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-
-FFMPEG_AVAILABLE = check_ffmpeg()
+from engine import (
+    DownloadEngine, load_settings, save_settings,
+    YT_DLP_AVAILABLE, FFMPEG_AVAILABLE, LOG_FILE, SCHEDULE_PAUSE, SCHEDULE_LIMIT,
+    EVENT_TASK_ADDED, EVENT_TASKS_ADDED, EVENT_TASK_UPDATED, EVENT_TASK_REMOVED, EVENT_LOG, EVENT_CONCURRENCY,
+)
+import logpipe
+from journal import JobJournal, JOURNAL_FILE
+from metrics import METRICS_FILE
+from archive import DownloadArchive, ARCHIVE_FILE
+from bulk_import import BulkImport
+from ratelimit import parse_rate
+from info_cache import InfoCache, INFO_CACHE_DIR
+from task_list import VirtualTaskList, STATUS_FILTERS, FILTER_ALL
+IMPORTED = time.perf_counter()
 
 # --- Constants ---
 APP_VERSION = "2.3" # Version bump for new feature
-SETTINGS_FILE = "m3udl_settings.json"
-LOG_FILE = "m3udl_app.log"
-
-# --- Set up Logging ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+PROGRESS_REFRESH_MS = 66 # ~15 redraws per second, however often the hooks fire
+LOG_REFRESH_MS = 250
+LOG_VIEW_LINES = 2000   # older lines are dropped from the Log tab (the log file keeps everything)
+SCHEDULE_MODE_LABELS = {SCHEDULE_PAUSE: "Only download in this window", SCHEDULE_LIMIT: "Limit speed in this window"}
 
-# --- Default Settings ---
-DEFAULT_SETTINGS = {
-    "simultaneous_downloads": 3,
-    "max_retries": 3,
-    "retry_delay": 5,
-    "output_format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
-    "proxy": "",
-    "user_agent": "",
-    "speed_limit": "",
-    "autopilot": True,
-    "use_yt_dlp": True,
-    "theme": "System",
-    "enable_scheduling": False,
-    "start_time": "00:00",
-    "end_time": "23:59",
-    "yt_dlp_options": {
-        "video_quality": "best",
-        "audio_quality": "best",
-        "audio_format": "m4a",
-        "output_template": "%(title)s [%(id)s].%(ext)s",
-        "download_subs": False,
-        "sub_lang": "en",
-        "embed_subs": False,
-        "embed_thumbnail": False,
-        "embed_metadata": False,
-        "convert_video": "none"
-    }
-}
-
-# --- Download Statuses ---
-STATUS_QUEUED = "Queued"
-STATUS_DOWNLOADING = "Downloading"
-STATUS_COMPLETED = "Completed"
-STATUS_ERROR = "Error"
-STATUS_CANCELLED = "Cancelled"
+
+def read_int(label, entry, minimum=0):
+    """Reads a whole number from a settings entry, raised to `minimum`; the ValueError names the field."""
+    try:
+        return max(minimum, int(entry.get().strip()))
+    except ValueError:
+        raise ValueError(f"{label}: please enter a whole number.") from None
 
 
 class YTDLPConfigWindow(ctk.CTkToplevel):
@@ -202,17 +156,26 @@ class M3UDLApp(ctk.CTk):
         self.title(f"M3UDL - Ultimate Video Downloader v{APP_VERSION}")
         self.geometry("1100x750")
 
-        self.settings = self.load_settings()
+        self.settings = load_settings()
+        logpipe.set_events_file(logpipe.EVENTS_LOG_FILE if self.settings["json_log"] else None)
+        self.log_buffer = logpipe.LogBuffer(maxlen=LOG_VIEW_LINES)
+        self.ui_calls = queue.SimpleQueue()     # (callback, args) from other threads, run by refresh_progress
         ctk.set_appearance_mode(self.settings["theme"])
         ctk.set_default_color_theme("blue")
 
-        self.tasks = {}
-        self.download_queue = queue.Queue()
-        self.stop_event = threading.Event()
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.settings["simultaneous_downloads"])
+        self.engine = DownloadEngine(
+            self.settings, journal=JobJournal(JOURNAL_FILE), archive=DownloadArchive(ARCHIVE_FILE),
+            info_cache=InfoCache(INFO_CACHE_DIR, ttl=self.settings["info_cache_ttl"], max_bytes=self.settings["info_cache_max_mb"] * 1024 * 1024),
+        )
+        self.tasks = self.engine.tasks
 
         self.create_widgets()
-        self.start_autopilot()
+        self.engine.subscribe(self.on_engine_event)
+        self.engine.restore_jobs()
+        self.engine.start_scheduler()
+        self.after(PROGRESS_REFRESH_MS, self.refresh_progress)
+        self.after(LOG_REFRESH_MS, self.refresh_log)
+        self.after_idle(self.on_window_ready)
 
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
@@ -282,8 +245,8 @@ class M3UDLApp(ctk.CTk):
         bulk_frame.grid_columnconfigure(1, weight=1)
 
         ctk.CTkLabel(bulk_frame, text="Bulk from File", font=ctk.CTkFont(weight="bold")).grid(row=0, column=0, columnspan=3, padx=10, pady=(10, 5))
-        ctk.CTkLabel(bulk_frame, text="Text File:").grid(row=1, column=0, padx=10, pady=5, sticky="w")
-        self.bulk_file_entry = ctk.CTkEntry(bulk_frame, placeholder_text="Select a .txt file with one URL per line")
+        ctk.CTkLabel(bulk_frame, text="URL List:").grid(row=1, column=0, padx=10, pady=5, sticky="w")
+        self.bulk_file_entry = ctk.CTkEntry(bulk_frame, placeholder_text="A .txt file with one URL per line, or an .m3u/.m3u8 playlist")
         self.bulk_file_entry.grid(row=1, column=1, padx=(10, 0), pady=5, sticky="ew")
         ctk.CTkButton(bulk_frame, text="Browse", width=80, command=self.browse_bulk_file).grid(row=1, column=2, padx=(5, 10), pady=5)
 
@@ -304,6 +267,16 @@ class M3UDLApp(ctk.CTk):
         self.bulk_download_btn = ctk.CTkButton(bulk_frame, text="Add Bulk to Queue", command=self.add_bulk_to_queue)
         self.bulk_download_btn.grid(row=4, column=1, columnspan=2, padx=10, pady=(5, 10))
 
+        # Shown while a file is being imported
+        self.bulk_import = None
+        self.bulk_progress_frame = ctk.CTkFrame(bulk_frame, fg_color="transparent")
+        self.bulk_progress_frame.grid_columnconfigure(0, weight=1)
+        self.bulk_progress_bar = ctk.CTkProgressBar(self.bulk_progress_frame)
+        self.bulk_progress_bar.grid(row=0, column=0, padx=(0, 10), sticky="ew")
+        self.bulk_progress_label = ctk.CTkLabel(self.bulk_progress_frame, text="")
+        self.bulk_progress_label.grid(row=0, column=1, padx=(0, 10))
+        ctk.CTkButton(self.bulk_progress_frame, text="Cancel Import", width=100, command=self.cancel_bulk_import).grid(row=0, column=2)
+
     def create_download_manager_tab(self):
         tab = self.tabview.tab("Download Manager")
         tab.grid_columnconfigure(0, weight=1)
@@ -320,9 +293,20 @@ class M3UDLApp(ctk.CTk):
         self.clear_completed_btn = ctk.CTkButton(btn_frame, text="Clear Completed", command=self.confirm_clear_completed)
         self.clear_completed_btn.pack(side="right", padx=5)
 
-        self.scrollable_frame = ctk.CTkScrollableFrame(tab, label_text="Downloads")
-        self.scrollable_frame.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="nsew")
-        self.scrollable_frame.grid_columnconfigure(0, weight=1)
+        self.status_filter_menu = ctk.CTkOptionMenu(btn_frame, values=STATUS_FILTERS, width=130, command=lambda value: self.task_list.set_filter(value))
+        self.status_filter_menu.set(FILTER_ALL)
+        self.status_filter_menu.pack(side="right", padx=5)
+        ctk.CTkLabel(btn_frame, text="Show:").pack(side="right")
+
+        self.slots_label = ctk.CTkLabel(btn_frame, text="")
+        self.slots_label.pack(side="left", padx=10)
+        self.update_slots_label(self.engine.download_slots(), self.settings["adaptive_concurrency"])
+
+        self.task_list = VirtualTaskList(tab, self)
+        self.task_list.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="nsew")
+
+    def update_slots_label(self, level, adaptive):
+        self.slots_label.configure(text=f"Simultaneous: {level}" + (" (adaptive)" if adaptive else ""))
 
     def create_settings_tab(self):
         settings_frame = self.tabview.tab("Settings")
@@ -352,6 +336,28 @@ class M3UDLApp(ctk.CTk):
         self.max_retries_entry = ctk.CTkEntry(download_frame)
         self.max_retries_entry.grid(row=2, column=1, columnspan=2, sticky="ew", padx=10, pady=5)
         self.max_retries_entry.insert(0, str(self.settings["max_retries"]))
+
+        self.adaptive_var = ctk.BooleanVar(value=self.settings["adaptive_concurrency"])
+        ctk.CTkCheckBox(download_frame, text="Adapt to connection (min/max):", variable=self.adaptive_var).grid(row=4, column=0, sticky="w", padx=10, pady=5)
+        adaptive_bounds_frame = ctk.CTkFrame(download_frame, fg_color="transparent")
+        adaptive_bounds_frame.grid(row=4, column=1, columnspan=2, sticky="w", padx=10, pady=5)
+        self.adaptive_min_entry = ctk.CTkEntry(adaptive_bounds_frame, width=60)
+        self.adaptive_min_entry.pack(side="left")
+        self.adaptive_min_entry.insert(0, str(self.settings["adaptive_min_downloads"]))
+        ctk.CTkLabel(adaptive_bounds_frame, text="to").pack(side="left", padx=5)
+        self.adaptive_max_entry = ctk.CTkEntry(adaptive_bounds_frame, width=60)
+        self.adaptive_max_entry.pack(side="left")
+        self.adaptive_max_entry.insert(0, str(self.settings["adaptive_max_downloads"]))
+
+        ctk.CTkLabel(download_frame, text="Max Downloads per Site:").grid(row=3, column=0, sticky="w", padx=10, pady=5)
+        self.per_host_entry = ctk.CTkEntry(download_frame, placeholder_text="0 = no per-site limit")
+        self.per_host_entry.grid(row=3, column=1, columnspan=2, sticky="ew", padx=10, pady=5)
+        self.per_host_entry.insert(0, str(self.settings["per_host_downloads"]))
+
+        ctk.CTkLabel(download_frame, text="Simultaneous Post-processing:").grid(row=5, column=0, sticky="w", padx=10, pady=5)
+        self.postprocess_entry = ctk.CTkEntry(download_frame, placeholder_text="FFmpeg jobs; defaults to CPU cores")
+        self.postprocess_entry.grid(row=5, column=1, columnspan=2, sticky="ew", padx=10, pady=5)
+        self.postprocess_entry.insert(0, str(self.settings["postprocess_workers"]))
         
         output_settings_frame = ctk.CTkFrame(settings_frame)
         output_settings_frame.grid(row=2, column=0, padx=10, pady=10, sticky="ew")
@@ -395,11 +401,50 @@ class M3UDLApp(ctk.CTk):
         if not YT_DLP_AVAILABLE:
             yt_dlp_checkbox.configure(state="disabled", text="Use yt-dlp (Not installed!)")
             self.yt_dlp_var.set(False)
-        yt_dlp_checkbox.grid(row=2, column=0, columnspan=2, pady=5, padx=10, sticky="w")
+        yt_dlp_checkbox.grid(row=2, column=0, pady=5, padx=10, sticky="w")
+        prefetch_frame = ctk.CTkFrame(advanced_frame, fg_color="transparent")
+        prefetch_frame.grid(row=2, column=1, pady=5, padx=10, sticky="e")
+        ctk.CTkLabel(prefetch_frame, text="Prefetch Metadata Ahead:").pack(side="left", padx=(0, 5))
+        self.prefetch_depth_entry = ctk.CTkEntry(prefetch_frame, width=60)
+        self.prefetch_depth_entry.pack(side="left")
+        self.prefetch_depth_entry.insert(0, str(self.settings["prefetch_depth"]))
+
+        self.native_hls_var = ctk.BooleanVar(value=self.settings["native_hls"])
+        ctk.CTkCheckBox(advanced_frame, text="Use built-in parallel downloader for M3U8 URLs", variable=self.native_hls_var).grid(row=3, column=0, pady=5, padx=10, sticky="w")
+        self.keep_partial_var = ctk.BooleanVar(value=self.settings["keep_partial_files"])
+        ctk.CTkCheckBox(advanced_frame, text="Keep partial files of cancelled downloads", variable=self.keep_partial_var).grid(row=4, column=0, pady=5, padx=10, sticky="w")
+        self.process_mode_var = ctk.BooleanVar(value=self.settings["worker_mode"] == "process")
+        ctk.CTkCheckBox(advanced_frame, text="Run yt-dlp jobs in worker processes", variable=self.process_mode_var).grid(row=4, column=1, pady=5, padx=10, sticky="e")
+        self.skip_duplicates_var = ctk.BooleanVar(value=self.settings["skip_duplicates"])
+        ctk.CTkCheckBox(advanced_frame, text="Skip URLs that are already queued or downloaded", variable=self.skip_duplicates_var).grid(row=5, column=0, pady=5, padx=10, sticky="w")
+        self.json_log_var = ctk.BooleanVar(value=self.settings["json_log"])
+        ctk.CTkCheckBox(advanced_frame, text=f"Write task timings to {logpipe.EVENTS_LOG_FILE}", variable=self.json_log_var).grid(row=5, column=1, pady=5, padx=10, sticky="e")
+        hls_conn_frame = ctk.CTkFrame(advanced_frame, fg_color="transparent")
+        hls_conn_frame.grid(row=3, column=1, pady=5, padx=10, sticky="e")
+        ctk.CTkLabel(hls_conn_frame, text="Segment Connections:").pack(side="left", padx=(0, 5))
+        self.hls_concurrency_entry = ctk.CTkEntry(hls_conn_frame, width=60)
+        self.hls_concurrency_entry.pack(side="left")
+        self.hls_concurrency_entry.insert(0, str(self.settings["hls_segment_concurrency"]))
         
         ffmpeg_status_text = "FFmpeg found. Post-processing enabled." if FFMPEG_AVAILABLE else "FFmpeg not found. Post-processing features will be disabled."
         ffmpeg_status_color = "green" if FFMPEG_AVAILABLE else "orange"
-        ctk.CTkLabel(advanced_frame, text=ffmpeg_status_text, text_color=ffmpeg_status_color).grid(row=3, column=0, columnspan=2, pady=5, padx=10, sticky="w")
+        metrics_frame = ctk.CTkFrame(advanced_frame, fg_color="transparent")
+        metrics_frame.grid(row=6, column=0, pady=5, padx=10, sticky="w")
+        ctk.CTkLabel(metrics_frame, text="Metrics Port (0 = off):").pack(side="left", padx=(0, 5))
+        self.metrics_port_entry = ctk.CTkEntry(metrics_frame, width=70)
+        self.metrics_port_entry.pack(side="left")
+        self.metrics_port_entry.insert(0, str(self.settings["metrics_port"]))
+        self.metrics_file_var = ctk.BooleanVar(value=bool(self.settings["metrics_file"]))
+        ctk.CTkCheckBox(advanced_frame, text=f"Write metrics snapshots to {METRICS_FILE}", variable=self.metrics_file_var).grid(row=6, column=1, pady=5, padx=10, sticky="e")
+        self.native_direct_var = ctk.BooleanVar(value=self.settings["native_direct"])
+        ctk.CTkCheckBox(advanced_frame, text="Use built-in multi-connection downloader for direct file links", variable=self.native_direct_var).grid(row=7, column=0, pady=5, padx=10, sticky="w")
+        direct_conn_frame = ctk.CTkFrame(advanced_frame, fg_color="transparent")
+        direct_conn_frame.grid(row=7, column=1, pady=5, padx=10, sticky="e")
+        ctk.CTkLabel(direct_conn_frame, text="Connections per File:").pack(side="left", padx=(0, 5))
+        self.direct_connections_entry = ctk.CTkEntry(direct_conn_frame, width=60)
+        self.direct_connections_entry.pack(side="left")
+        self.direct_connections_entry.insert(0, str(self.settings["direct_connections"]))
+        ctk.CTkLabel(advanced_frame, text=ffmpeg_status_text, text_color=ffmpeg_status_color).grid(row=8, column=0, columnspan=2, pady=5, padx=10, sticky="w")
         
         ctk.CTkButton(settings_frame, text="Save Settings", command=self.save_settings).grid(row=6, column=0, pady=20)
 
@@ -425,9 +470,18 @@ class M3UDLApp(ctk.CTk):
         self.end_time_entry = ctk.CTkEntry(main_frame, width=120)
         self.end_time_entry.grid(row=3, column=1, padx=10, pady=10, sticky="w")
         self.end_time_entry.insert(0, self.settings["end_time"])
+
+        ctk.CTkLabel(main_frame, text="During This Window:").grid(row=4, column=0, padx=10, pady=10, sticky="w")
+        self.schedule_mode_var = ctk.StringVar(value=SCHEDULE_MODE_LABELS[self.settings["schedule_mode"]])
+        ctk.CTkOptionMenu(main_frame, variable=self.schedule_mode_var, values=list(SCHEDULE_MODE_LABELS.values())).grid(row=4, column=1, padx=10, pady=10, sticky="w")
+
+        ctk.CTkLabel(main_frame, text="Speed Limit in Window:").grid(row=5, column=0, padx=10, pady=10, sticky="w")
+        self.schedule_speed_entry = ctk.CTkEntry(main_frame, width=120, placeholder_text="e.g., 2M")
+        self.schedule_speed_entry.grid(row=5, column=1, padx=10, pady=10, sticky="w")
+        self.schedule_speed_entry.insert(0, self.settings["schedule_speed_limit"])
         
-        info_label = ctk.CTkLabel(main_frame, text="When scheduling is enabled, new downloads will only begin between the specified start and end times.\nThis feature is checked by Autopilot and when you manually click 'Start Queue'.", wraplength=400, justify="left")
-        info_label.grid(row=4, column=0, columnspan=3, padx=10, pady=20, sticky="w")
+        info_label = ctk.CTkLabel(main_frame, text="When scheduling is enabled, new downloads will either only begin between the specified start and end times, or run at any time with the speed limit above applying inside the window (and the Network speed limit outside it).\nSpeed limits are shared by all downloads and apply to running downloads as soon as the window opens or closes.", wraplength=400, justify="left")
+        info_label.grid(row=6, column=0, columnspan=3, padx=10, pady=20, sticky="w")
 
         ctk.CTkButton(tab, text="Save Settings", command=self.save_settings).grid(row=1, column=0, pady=20)
 
@@ -448,93 +502,55 @@ class M3UDLApp(ctk.CTk):
 
     # --- UI Update and Task Management ---
 
-    def add_task(self, url, output_path, sequence_number=None):
-        task_id = str(uuid.uuid4())
-        task = {
-            "id": task_id, "url": url, "output_path": output_path,
-            "status": STATUS_QUEUED, "progress": 0, "retries": 0,
-            "future": None, "ui": {}, "final_filepath": None,
-            "error_message": "",
-            "sequence_number": sequence_number
-        }
-        self.tasks[task_id] = task
-        self.create_task_ui(task_id)
-        self.download_queue.put(task_id)
-        
-        log_msg = f"Queued: {url}"
-        if sequence_number is not None:
-            log_msg += f" (as number {sequence_number})"
-        self.log(log_msg)
-        
-        return task_id
-
-    def create_task_ui(self, task_id):
-        task = self.tasks[task_id]
-        frame = ctk.CTkFrame(self.scrollable_frame, border_width=1, border_color="#565B5E")
-        frame.grid(sticky="ew", padx=5, pady=5)
-        frame.grid_columnconfigure(0, weight=1)
-        task["ui"]["frame"] = frame
-
-        filename_label = ctk.CTkLabel(frame, text=os.path.basename(task['url']) or task['url'], anchor="w")
-        filename_label.grid(row=0, column=0, padx=10, pady=2, sticky="ew")
-        task["ui"]["filename"] = filename_label
-
-        progress_bar = ctk.CTkProgressBar(frame)
-        progress_bar.set(0)
-        progress_bar.grid(row=1, column=0, padx=10, pady=2, sticky="ew")
-        task["ui"]["progress"] = progress_bar
-
-        status_label = ctk.CTkLabel(frame, text=STATUS_QUEUED, anchor="w")
-        status_label.grid(row=1, column=1, padx=10, pady=2, sticky="w")
-        task["ui"]["status"] = status_label
-
-        action_frame = ctk.CTkFrame(frame, fg_color="transparent")
-        action_frame.grid(row=0, column=1, rowspan=2, padx=10, pady=2, sticky="e")
-        task["ui"]["action_frame"] = action_frame
-
-        cancel_btn = ctk.CTkButton(action_frame, text="Cancel", width=70, command=lambda t=task_id: self.cancel_task(t))
-        cancel_btn.pack()
-        task["ui"]["cancel_btn"] = cancel_btn
+    def on_engine_event(self, event, task_id, data):
+        if event == EVENT_LOG:
+            # Log lines are batched by refresh_log rather than costing a Tk call each.
+            self.log_buffer.push(f"{time.strftime('%H:%M:%S')} - {data['message']}")
+            return
+        # Engine callbacks arrive on worker threads, which must not touch Tk.
+        self.call_in_ui(self._handle_engine_event, event, task_id, data)
 
-    def update_ui_safe(self, task_id, **kwargs):
-        self.after(0, self._update_ui, task_id, kwargs)
+    def call_in_ui(self, callback, *args):
+        """Queues `callback(*args)` to run on the Tk thread at its next refresh tick; safe from any thread."""
+        self.ui_calls.put((callback, args))
 
-    def _update_ui(self, task_id, updates):
-        if task_id not in self.tasks: return
-        
-        task = self.tasks[task_id]
-        ui = task["ui"]
-
-        if "status" in updates:
-            status = updates["status"]
-            task["status"] = status
-            ui["status"].configure(text=status)
-            if status == STATUS_COMPLETED:
-                ui["status"].configure(text_color="green")
-                ui["progress"].set(1)
-                ui["cancel_btn"].pack_forget()
-                ui["frame"].configure(border_color="green")
-                open_btn = ctk.CTkButton(ui["action_frame"], text="Open Folder", width=100, command=lambda p=task["final_filepath"]: self.open_file_location(p))
-                open_btn.pack()
-            elif status == STATUS_ERROR:
-                ui["status"].configure(text_color="red")
-                ui["frame"].configure(border_color="red")
-                if "error_message" in task and task["error_message"]:
-                    ui["status"].bind("<Enter>", lambda e, msg=task["error_message"]: self.show_tooltip(msg))
-                    ui["status"].bind("<Leave>", lambda e: self.hide_tooltip())
-            elif status == STATUS_CANCELLED:
-                ui["status"].configure(text_color="gray")
-                ui["cancel_btn"].pack_forget()
-            elif status == STATUS_DOWNLOADING:
-                ui["frame"].configure(border_color="#3B8ED0")
-
-        if "progress" in updates:
-            task["progress"] = updates["progress"]
-            ui["progress"].set(updates["progress"])
-        if "filename" in updates:
-            ui["filename"].configure(text=updates["filename"])
-        if "error_message" in updates:
-            task["error_message"] = updates["error_message"]
+    def run_ui_calls(self):
+        while True:
+            try:
+                callback, args = self.ui_calls.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                callback(*args)
+            except Exception:
+                # As with after(): one failing callback mustn't stop the refresh timer.
+                logging.exception("UI callback failed")
+
+    def _handle_engine_event(self, event, task_id, data):
+        if event == EVENT_TASK_ADDED:
+            self.task_list.add_task(task_id)
+        elif event == EVENT_TASKS_ADDED:
+            self.task_list.add_tasks(data["task_ids"])
+        elif event == EVENT_TASK_UPDATED:
+            self.task_list.task_updated(task_id, data)
+        elif event == EVENT_TASK_REMOVED:
+            self.task_list.remove_task(task_id)
+        elif event == EVENT_CONCURRENCY:
+            self.update_slots_label(data["level"], data["adaptive"])
+
+    def on_window_ready(self):
+        self.update_idletasks()
+        elapsed = time.perf_counter() - STARTED
+        self.log(f"Window ready {elapsed * 1000:.0f} ms after start ({(IMPORTED - STARTED) * 1000:.0f} ms of it importing).")
+        logpipe.log_event(None, "startup", seconds=round(elapsed, 3), imports=round(IMPORTED - STARTED, 3))
+        # Now that the window is up, yt-dlp can load without holding it back.
+        self.engine.preload()
+
+    def refresh_progress(self):
+        self.run_ui_calls()
+        # Only visible rows whose numbers changed since the last tick are redrawn.
+        self.task_list.refresh_progress(self.engine.progress.drain())
+        self.after(PROGRESS_REFRESH_MS, self.refresh_progress)
 
     def show_tooltip(self, text):
         self.tooltip = ctk.CTkToplevel(self)
@@ -551,164 +567,11 @@ class M3UDLApp(ctk.CTk):
 
     # --- Core Logic ---
 
-    def process_queue(self):
-        if self.stop_event.is_set(): return
-            
-        if self.settings["enable_scheduling"]:
-            if not self.is_within_schedule():
-                if not hasattr(self, 'last_schedule_log_time') or time.time() - self.last_schedule_log_time > 300:
-                    self.log("Queue processing paused due to schedule.")
-                    self.last_schedule_log_time = time.time()
-                return
-
-        active_downloads = sum(1 for t in self.tasks.values() if t["status"] == STATUS_DOWNLOADING)
-        
-        while not self.download_queue.empty() and active_downloads < self.settings["simultaneous_downloads"]:
-            try:
-                task_id = self.download_queue.get_nowait()
-                if self.tasks[task_id]["status"] == STATUS_QUEUED:
-                    self.update_ui_safe(task_id, status=STATUS_DOWNLOADING)
-                    future = self.executor.submit(self.download_video, task_id)
-                    self.tasks[task_id]["future"] = future
-                    future.add_done_callback(self.on_download_done)
-                    active_downloads += 1
-            except queue.Empty:
-                break
-
-    def download_video(self, task_id):
-        task = self.tasks[task_id]
-        url, output_path = task["url"], task["output_path"]
-        opts = self.settings.get("yt_dlp_options", {})
-
-        def progress_hook(d):
-            if self.tasks[task_id]['status'] == STATUS_CANCELLED:
-                raise yt_dlp.utils.DownloadError("Download cancelled by user.")
-            if d['status'] == 'downloading':
-                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
-                if total_bytes:
-                    progress = d['downloaded_bytes'] / total_bytes
-                    self.update_ui_safe(task_id, progress=progress)
-            elif d['status'] == 'finished':
-                task['final_filepath'] = d.get('filename') or d.get('info_dict', {}).get('_filename')
-                self.update_ui_safe(task_id, progress=1.0)
-                if task['final_filepath']:
-                     self.update_ui_safe(task_id, filename=os.path.basename(task['final_filepath']))
-
-        if self.settings["use_yt_dlp"] and YT_DLP_AVAILABLE:
-            try:
-                video_quality_map = { "best": "bestvideo", "1080p": "bestvideo[height<=1080]", "720p": "bestvideo[height<=720]", "480p": "bestvideo[height<=480]", "worst": "worstvideo" }
-                audio_quality_map = {"best": "bestaudio", "worst": "worstaudio"}
-                video_part = video_quality_map.get(opts.get("video_quality", "best"), "bestvideo")
-                audio_part = audio_quality_map.get(opts.get("audio_quality", "best"), "bestaudio")
-                format_string = f"{video_part}[ext=mp4]+{audio_part}[ext=m4a]/{video_part}+{audio_part}/best"
-
-                postprocessors = []
-                if FFMPEG_AVAILABLE:
-                    if opts.get("embed_thumbnail"): postprocessors.append({'key': 'EmbedThumbnail', 'already_have_thumbnail': False})
-                    if opts.get("embed_metadata"): postprocessors.append({'key': 'FFmpegMetadata', 'add_metadata': True})
-                    if opts.get("embed_subs") and opts.get("download_subs"): postprocessors.append({'key': 'FFmpegEmbedSubtitle'})
-                    if opts.get("audio_format") not in ["m4a"]: postprocessors.append({'key': 'FFmpegExtractAudio', 'preferredcodec': opts.get("audio_format", "m4a")})
-                    if opts.get("convert_video") != "none": postprocessors.append({'key': 'FFmpegVideoConvertor', 'preferedformat': opts.get("convert_video")})
-
-                # Choose output template based on task data
-                if task.get('sequence_number') is not None:
-                    output_template = f"{task['sequence_number']}.%(ext)s"
-                else:
-                    output_template = opts.get("output_template", "%(title)s.%(ext)s")
-
-                ydl_opts = {
-                    'outtmpl': os.path.join(output_path, output_template),
-                    'format': format_string,
-                    'progress_hooks': [progress_hook], 'noplaylist': True,
-                    'ratelimit': self.settings["speed_limit"] or None,
-                    'proxy': self.settings["proxy"] or None,
-                    'http_headers': {'User-Agent': self.settings["user_agent"]} if self.settings["user_agent"] else None,
-                    'postprocessors': postprocessors if postprocessors else None,
-                    'writesubtitles': opts.get("download_subs", False),
-                    'subtitleslangs': [opts.get("sub_lang", "en")] if opts.get("download_subs") else None,
-                }
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info_dict = ydl.extract_info(url, download=False)
-                    
-                    if task.get('sequence_number') is None:
-                        filename = ydl.prepare_filename(info_dict)
-                        self.update_ui_safe(task_id, filename=os.path.basename(filename))
-                    else:
-                        ext = info_dict.get('ext', 'mp4')
-                        self.update_ui_safe(task_id, filename=f"{task['sequence_number']}.{ext}")
-
-                    ydl.download([url])
-                return (STATUS_COMPLETED, f"Downloaded: {url}", None)
-            except Exception as e:
-                error_str = str(e).split('\n')[0]
-                return (STATUS_ERROR, f"yt-dlp error for {url}: {error_str}", error_str)
-        else:
-            return (STATUS_ERROR, "yt-dlp is not available. Please install it.", "yt-dlp is not available.")
-
-    def on_download_done(self, future):
-        task_id = next((tid for tid, task in self.tasks.items() if task["future"] == future), None)
-        if not task_id: return
-
-        try:
-            status, message, error_details = future.result()
-            self.log(message)
-            if status == STATUS_COMPLETED:
-                self.update_ui_safe(task_id, status=STATUS_COMPLETED)
-            else:
-                self.handle_download_error(task_id, error_details or message)
-        except Exception as e:
-            self.handle_download_error(task_id, str(e))
-        
-        self.process_queue()
-
-    def handle_download_error(self, task_id, error_message):
-        task = self.tasks[task_id]
-        if task["status"] == STATUS_CANCELLED:
-            self.log(f"Cancelled: {task['url']}")
-            return
-
-        if task["retries"] < self.settings["max_retries"]:
-            task["retries"] += 1
-            delay = self.settings["retry_delay"]
-            self.log(f"Download failed for {task['url']}. Retrying in {delay}s... (Attempt {task['retries']})")
-            self.update_ui_safe(task_id, status=f"Retrying ({task['retries']})...", error_message=error_message)
-            self.after(delay * 1000, lambda: self.retry_task(task_id))
-        else:
-            self.log(f"Download failed permanently for {task['url']}: {error_message}")
-            self.update_ui_safe(task_id, status=STATUS_ERROR, error_message=error_message)
-
-    def retry_task(self, task_id):
-        self.tasks[task_id]['status'] = STATUS_QUEUED
-        self.download_queue.put(task_id)
-        self.process_queue()
+    def add_task(self, url, output_path, sequential=False):
+        return self.engine.add_task(url, output_path, sequential=sequential)
 
     def cancel_task(self, task_id):
-        task = self.tasks.get(task_id)
-        if not task: return
-        
-        if task['status'] in [STATUS_DOWNLOADING, STATUS_QUEUED]:
-            task['status'] = STATUS_CANCELLED
-            self.update_ui_safe(task_id, status=STATUS_CANCELLED)
-
-    # --- Autopilot and Scheduling ---
-    def start_autopilot(self):
-        def autopilot_monitor():
-            while not self.stop_event.is_set():
-                if self.settings["autopilot"]:
-                    self.process_queue()
-                time.sleep(2)
-        threading.Thread(target=autopilot_monitor, daemon=True).start()
-
-    def is_within_schedule(self):
-        try:
-            now = datetime.datetime.now().time()
-            start = datetime.datetime.strptime(self.settings["start_time"], "%H:%M").time()
-            end = datetime.datetime.strptime(self.settings["end_time"], "%H:%M").time()
-            if start <= end: return start <= now <= end
-            else: return now >= start or now <= end
-        except ValueError:
-            self.log("Invalid time format in scheduling settings. Ignoring schedule.")
-            return True
+        self.engine.cancel_task(task_id)
 
     # --- Button Commands and Actions ---
     def browse_output(self):
@@ -716,7 +579,7 @@ class M3UDLApp(ctk.CTk):
         if folder:
             self.output_entry.delete(0, tk.END); self.output_entry.insert(0, folder)
     def browse_bulk_file(self):
-        file = filedialog.askopenfilename(filetypes=[("Text files", "*.txt")])
+        file = filedialog.askopenfilename(filetypes=[("URL lists", "*.txt *.m3u *.m3u8"), ("All files", "*.*")])
         if file:
             self.bulk_file_entry.delete(0, tk.END); self.bulk_file_entry.insert(0, file)
     def browse_bulk_output(self):
@@ -729,12 +592,8 @@ class M3UDLApp(ctk.CTk):
         output_path = self.output_entry.get().strip()
         if not url:
             messagebox.showerror("Error", "Please enter a URL"); return
-        
-        seq_num = None
-        if self.single_sequential_var.get():
-            seq_num = self.get_next_sequence_number(output_path)
-            
-        self.add_task(url, output_path, sequence_number=seq_num)
+
+        self.add_task(url, output_path, sequential=self.single_sequential_var.get())
         self.url_entry.delete(0, tk.END)
         self.tabview.set("Download Manager")
     
@@ -746,80 +605,59 @@ class M3UDLApp(ctk.CTk):
     def add_bulk_to_queue(self):
         file_path, output_path = self.bulk_file_entry.get().strip(), self.bulk_output_entry.get().strip()
         if not file_path or not os.path.exists(file_path):
-            messagebox.showerror("Error", "Please select a valid text file"); return
-        try:
-            with open(file_path, 'r') as f:
-                urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-            
-            use_seq = self.bulk_sequential_var.get()
-            start_seq_num = 0
-            if use_seq:
-                start_seq_num = self.get_next_sequence_number(output_path)
-
-            for i, url in enumerate(urls):
-                seq_num = start_seq_num + i if use_seq else None
-                self.add_task(url, output_path, sequence_number=seq_num)
-
-            self.log(f"Added {len(urls)} URLs to queue from file.")
-            self.tabview.set("Download Manager")
-        except Exception as e: messagebox.showerror("Error", f"Failed to read file: {e}")
-
-    def get_next_sequence_number(self, directory):
-        """
-        Finds the next available sequence number in a directory, considering
-        both files on disk and items already in the download queue.
-        """
-        max_num = 0
-        
-        # 1. Check files on disk
-        try:
-            for filename in os.listdir(directory):
-                name, _ = os.path.splitext(filename)
-                try:
-                    num = int(name)
-                    if num > max_num:
-                        max_num = num
-                except ValueError:
-                    continue
-        except FileNotFoundError:
-            pass
-
-        # 2. Check tasks already in the queue for the same directory
-        for task in self.tasks.values():
-            if task['output_path'] == directory and task.get('sequence_number') is not None:
-                if task['sequence_number'] > max_num:
-                    max_num = task['sequence_number']
+            messagebox.showerror("Error", "Please select a valid URL list file"); return
+        if self.bulk_import: return
+
+        # Read and queued on a background thread; progress comes back through call_in_ui().
+        self.bulk_import = BulkImport(
+            self.engine, file_path, output_path, sequential=self.bulk_sequential_var.get(),
+            on_progress=lambda fraction, added, skipped: self.call_in_ui(self.update_bulk_progress, fraction, added, skipped),
+            on_done=lambda bulk_import: self.call_in_ui(self.finish_bulk_import, bulk_import),
+        )
+        self.bulk_download_btn.configure(state="disabled")
+        self.bulk_progress_bar.set(0)
+        self.bulk_progress_label.configure(text="Reading file...")
+        self.bulk_progress_frame.grid(row=5, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+        self.bulk_import.start()
+        self.tabview.set("Download Manager")
 
-        return max_num + 1
+    def update_bulk_progress(self, fraction, added, skipped):
+        self.bulk_progress_bar.set(fraction)
+        self.bulk_progress_label.configure(text=f"{added} added" + (f", {skipped} duplicates" if skipped else ""))
+
+    def cancel_bulk_import(self):
+        if self.bulk_import:
+            self.bulk_import.cancel()
+
+    def finish_bulk_import(self, bulk_import):
+        self.bulk_import = None
+        self.bulk_progress_frame.grid_remove()
+        self.bulk_download_btn.configure(state="normal")
+        summary = f"Added {bulk_import.added} URLs to queue from file." + (f" Skipped {bulk_import.skipped} duplicates." if bulk_import.skipped else "")
+        if bulk_import.error:
+            self.log(f"Bulk import stopped: {bulk_import.error} {summary}")
+            messagebox.showerror("Error", f"Failed to import file: {bulk_import.error}")
+        elif bulk_import.cancelled:
+            self.log(f"Bulk import cancelled. {summary}")
+        else:
+            self.log(summary)
 
     def start_queue(self):
-        self.stop_event.clear()
-        self.log("Manual queue start initiated.")
-        self.process_queue()
+        self.engine.start_queue()
 
     def confirm_stop_queue(self):
         if messagebox.askyesno("Stop All?", "Are you sure you want to cancel all active and queued downloads?"):
             self.stop_queue()
 
     def stop_queue(self):
-        self.stop_event.set()
-        while not self.download_queue.empty():
-            try: self.download_queue.get_nowait()
-            except queue.Empty: break
-        for task_id, task in self.tasks.items():
-            if task['status'] in [STATUS_QUEUED, STATUS_DOWNLOADING]:
-                self.cancel_task(task_id)
-        self.log("Stop command issued. All active downloads cancelled.")
+        self.engine.stop_queue()
 
     def confirm_clear_completed(self):
         if messagebox.askyesno("Clear List?", "Are you sure you want to remove all completed, errored, and cancelled items from the list?"):
             self.clear_completed()
 
     def clear_completed(self):
-        completed_ids = [tid for tid, task in self.tasks.items() if task["status"] in [STATUS_COMPLETED, STATUS_ERROR, STATUS_CANCELLED]]
-        for tid in completed_ids:
-            self.tasks[tid]["ui"]["frame"].destroy(); del self.tasks[tid]
-        self.log("Cleared completed tasks from view.")
+        self.engine.clear_completed()
 
     def open_file_location(self, path):
         if not path: return
@@ -850,52 +688,72 @@ class M3UDLApp(ctk.CTk):
         ctk.set_appearance_mode(new_theme.lower())
 
     def save_settings(self):
+        # Everything is parsed and checked first, so a bad field leaves the current settings untouched.
+        try:
+            for label, entry in (("Speed Limit", self.speed_entry), ("Speed Limit in Window", self.schedule_speed_entry)):
+                try: parse_rate(entry.get())
+                except ValueError as e:
+                    raise ValueError(f"{label}: {e}\nUse bytes per second with an optional K, M or G suffix (e.g., 500K or 2M).")
+            for label, entry in (("Start Time", self.start_time_entry), ("End Time", self.end_time_entry)):
+                try: datetime.datetime.strptime(entry.get(), "%H:%M")
+                except ValueError:
+                    raise ValueError(f"{label}: please enter a time in HH:MM format (e.g., 09:30 or 22:00).")
+            numbers = {key: read_int(label, entry, minimum) for key, label, entry, minimum in (
+                ("adaptive_min_downloads", "Adapt to connection (min)", self.adaptive_min_entry, 1),
+                ("adaptive_max_downloads", "Adapt to connection (max)", self.adaptive_max_entry, 1),
+                ("max_retries", "Max Retries", self.max_retries_entry, 0),
+                ("per_host_downloads", "Max Downloads per Site", self.per_host_entry, 0),
+                ("postprocess_workers", "Simultaneous Post-processing", self.postprocess_entry, 1),
+                ("hls_segment_concurrency", "Segment Connections", self.hls_concurrency_entry, 1),
+                ("direct_connections", "Connections per File", self.direct_connections_entry, 1),
+                ("prefetch_depth", "Prefetch Metadata Ahead", self.prefetch_depth_entry, 0),
+                ("metrics_port", "Metrics Port", self.metrics_port_entry, 0),
+            )}
+        except ValueError as e:
+            messagebox.showerror("Invalid Setting", str(e))
+            return
+
         try:
-            start_time_str = self.start_time_entry.get()
-            end_time_str = self.end_time_entry.get()
-            datetime.datetime.strptime(start_time_str, "%H:%M")
-            datetime.datetime.strptime(end_time_str, "%H:%M")
-
-            new_max_workers = int(self.sim_downloads_slider.get())
-            if new_max_workers != self.settings["simultaneous_downloads"]:
-                self.executor.shutdown(wait=False, cancel_futures=True)
-                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=new_max_workers)
-                self.settings["simultaneous_downloads"] = new_max_workers
-                self.log(f"Simultaneous downloads set to {new_max_workers}. Restarting thread pool.")
-
-            self.settings["max_retries"] = int(self.max_retries_entry.get())
+            numbers["adaptive_max_downloads"] = max(numbers["adaptive_min_downloads"], numbers["adaptive_max_downloads"])
+            self.settings.update(numbers)
             self.settings.update({
+                "adaptive_concurrency": self.adaptive_var.get(),
                 "proxy": self.proxy_entry.get(), "user_agent": self.ua_entry.get(),
                 "speed_limit": self.speed_entry.get(), "autopilot": self.autopilot_var.get(),
-                "use_yt_dlp": self.yt_dlp_var.get(), "theme": self.theme_menu.get().lower(),
-                "enable_scheduling": self.schedule_var.get(), "start_time": start_time_str,
-                "end_time": end_time_str
+                "use_yt_dlp": self.yt_dlp_var.get(), "native_hls": self.native_hls_var.get(),
+                "native_direct": self.native_direct_var.get(),
+                "keep_partial_files": self.keep_partial_var.get(), "skip_duplicates": self.skip_duplicates_var.get(),
+                "worker_mode": "process" if self.process_mode_var.get() else "thread",
+                "json_log": self.json_log_var.get(),
+                "metrics_file": (self.settings["metrics_file"] or METRICS_FILE) if self.metrics_file_var.get() else "",
+                "theme": self.theme_menu.get().lower(),
+                "enable_scheduling": self.schedule_var.get(), "start_time": self.start_time_entry.get(),
+                "end_time": self.end_time_entry.get(), "schedule_speed_limit": self.schedule_speed_entry.get(),
+                "schedule_mode": next(mode for mode, label in SCHEDULE_MODE_LABELS.items() if label == self.schedule_mode_var.get()),
             })
-            
-            with open(SETTINGS_FILE, "w") as f: json.dump(self.settings, f, indent=4)
+            self.engine.set_max_workers(int(self.sim_downloads_slider.get()))
+            self.engine.reset_http_session()
+            self.engine.settings_changed()
+            logpipe.set_events_file(logpipe.EVENTS_LOG_FILE if self.settings["json_log"] else None)
+            save_settings(self.settings)
             self.log("Settings saved successfully.")
             messagebox.showinfo("Settings Saved", "All settings have been saved successfully.")
-        except ValueError:
-            messagebox.showerror("Invalid Time", "Please enter times in HH:MM format (e.g., 09:30 or 22:00).")
         except Exception as e: messagebox.showerror("Error", f"Failed to save settings: {e}")
 
-    def load_settings(self):
-        settings = DEFAULT_SETTINGS.copy()
-        if os.path.exists(SETTINGS_FILE):
-            try:
-                with open(SETTINGS_FILE, "r") as f: loaded_settings = json.load(f)
-                for key, value in loaded_settings.items():
-                    if isinstance(value, dict) and key in settings: settings[key].update(value)
-                    else: settings[key] = value
-            except json.JSONDecodeError: logging.error("Could not decode settings.json, using defaults.")
-        return settings
-
     def log(self, message):
-        logging.info(message)
-        log_entry = f"{time.strftime('%H:%M:%S')} - {message}\n"
-        self.log_text.configure(state="normal")
-        self.log_text.insert(tk.END, log_entry); self.log_text.see(tk.END)
-        self.log_text.configure(state="disabled")
+        self.engine.log(message)
+
+    def refresh_log(self):
+        lines = self.log_buffer.drain()
+        if lines:
+            self.log_text.configure(state="normal")
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_VIEW_LINES
+            if excess > 0:
+                self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_text.see(tk.END)
+            self.log_text.configure(state="disabled")
+        self.after(LOG_REFRESH_MS, self.refresh_log)
     
     def clear_log(self):
         self.log_text.configure(state="normal")
@@ -904,19 +762,21 @@ class M3UDLApp(ctk.CTk):
         self.log("Log cleared.")
 
     def on_closing(self):
-        active_downloads = any(t["status"] == STATUS_DOWNLOADING for t in self.tasks.values())
-        if active_downloads:
+        if self.engine.has_active_downloads():
             if not messagebox.askyesno("Confirm Exit", "Downloads are in progress. Are you sure you want to exit?"):
                 return
         
-        self.stop_event.set()
-        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.cancel_bulk_import()
+        self.engine.shutdown()
         try:
-            with open(SETTINGS_FILE, "w") as f: json.dump(self.settings, f, indent=4)
+            save_settings(self.settings)
         except Exception as e: print(f"Could not save settings on exit: {e}")
+        logpipe.stop_logging()
         self.destroy()
 
 if __name__ == "__main__":
+    # Only here: a module-level handler would be added again by every process that imports this file.
+    logpipe.setup_logging(LOG_FILE)
     if not YT_DLP_AVAILABLE:
         root = tk.Tk(); root.withdraw()
         messagebox.showwarning("Dependency Missing",
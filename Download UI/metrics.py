@@ -0,0 +1,264 @@
+"""
+Download metrics.
+
+Every task records when it reaches each stage (queued, dispatched, extracted,
+first byte, transfer done, post-processing done), so a slow batch shows
+where the time goes: waiting for a slot, running the extractor, waiting for
+the server, transferring or running FFmpeg. Totals are kept here and
+exported as Prometheus text on a localhost port and/or as a JSON snapshot
+file rewritten every few seconds.
+"""
+import collections
+import http.server
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+STAGES = ("queued", "dispatched", "extracted", "first_byte", "transferred", "postprocessed")
+# The interval that ends at each stage, named for what the task was doing.
+INTERVALS = {
+    "dispatched": "queue_wait",
+    "extracted": "extract",
+    "first_byte": "connect",
+    "transferred": "transfer",
+    "postprocessed": "postprocess",
+}
+QUANTILES = (0.5, 0.95)
+DURATION_SAMPLES = 1000     # recent durations kept per interval for the quantiles
+THROUGHPUT_WINDOW = 60      # seconds
+
+METRICS_FILE = "m3udl_metrics.json"
+DEFAULT_INTERVAL = 15
+
+HTTP_ERROR_RE = re.compile(r"HTTP Error (\d{3})")
+
+
+def failure_cause(message):
+    """Sorts an error message into a short label fit for a metric, e.g. "http_404" or "timeout"."""
+    message = message or ""
+    match = HTTP_ERROR_RE.search(message)
+    if match: return f"http_{match.group(1)}"
+    lowered = message.lower()
+    if "timed out" in lowered or "timeout" in lowered: return "timeout"
+    if "connection" in lowered or "resolve" in lowered: return "connection"
+    if "unsupported url" in lowered: return "unsupported"
+    if "ffmpeg" in lowered or "post-process" in lowered: return "postprocess"
+    return "other"
+
+def quantile(sorted_values, q):
+    if not sorted_values: return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Metrics:
+    """
+    Counters and stage durations for one engine. `gauges` is a callable
+    returning current values such as {"queued": 12, "downloading": 3}.
+    """
+
+    def __init__(self, gauges=None):
+        self.gauges = gauges or dict
+        self.started = time.monotonic()
+        self.bytes_total = 0
+        self.bytes_resumed = 0      # bytes retries took from partial files instead of downloading again
+        self.per_second = collections.deque(maxlen=THROUGHPUT_WINDOW + 1)   # [second, bytes]
+        self.durations = {name: collections.deque(maxlen=DURATION_SAMPLES) for name in list(INTERVALS.values()) + ["total"]}
+        self.duration_sums = collections.Counter()
+        self.duration_counts = collections.Counter()
+        self.finished = collections.Counter()   # (host, status) -> tasks
+        self.retries = collections.Counter()    # (host, cause) -> retries
+        self.lock = threading.Lock()
+
+    # --- Recording ---
+
+    def mark(self, task, stage):
+        """
+        Stamps `task` as having reached `stage` and records how long the
+        interval ending there took. Re-queueing for a retry starts a fresh
+        timeline; a stage already reached (e.g. the first byte) keeps its
+        first time.
+        """
+        now = time.monotonic()
+        timings = task.setdefault("timings", {})
+        if stage == "queued":
+            timings.clear()
+        elif stage in timings:
+            return
+        earlier = [timings[s] for s in STAGES[:STAGES.index(stage)] if s in timings]
+        timings[stage] = now
+        if earlier:
+            self._record_duration(INTERVALS[stage], now - max(earlier))
+
+    def finish(self, task, host, status):
+        """Counts a task that reached a finished status, with its time since it was first queued."""
+        with self.lock:
+            self.finished[(host, status)] += 1
+        if "queued_at" in task:
+            self._record_duration("total", time.monotonic() - task["queued_at"])
+
+    def retry(self, host, cause):
+        with self.lock:
+            self.retries[(host, cause)] += 1
+
+    def record_bytes(self, amount):
+        second = int(time.monotonic())
+        with self.lock:
+            self.bytes_total += amount
+            if self.per_second and self.per_second[-1][0] == second:
+                self.per_second[-1][1] += amount
+            else:
+                self.per_second.append([second, amount])
+
+    def record_resumed(self, amount):
+        with self.lock:
+            self.bytes_resumed += amount
+
+    def _record_duration(self, name, seconds):
+        with self.lock:
+            self.durations[name].append(seconds)
+            self.duration_sums[name] += seconds
+            self.duration_counts[name] += 1
+
+    @staticmethod
+    def stage_durations(task):
+        """{interval: seconds} for the stages a task has gone through so far."""
+        timings = task.get("timings", {})
+        reached = [s for s in STAGES if s in timings]
+        return {INTERVALS[later]: round(timings[later] - timings[earlier], 3) for earlier, later in zip(reached, reached[1:])}
+
+    # --- Export ---
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            recent = sum(amount for second, amount in self.per_second if second >= now - THROUGHPUT_WINDOW)
+            stages = {}
+            for name, values in self.durations.items():
+                ordered = sorted(values)
+                stages[name] = {"count": self.duration_counts[name], "sum": round(self.duration_sums[name], 3),
+                                **{f"p{int(q * 100)}": None if not ordered else round(quantile(ordered, q), 3) for q in QUANTILES}}
+            finished, retries = dict(self.finished), dict(self.retries)
+            bytes_total, bytes_resumed = self.bytes_total, self.bytes_resumed
+
+        hosts = {}
+        for (host, status), count in finished.items():
+            hosts.setdefault(host, {"finished": {}, "retries": {}})["finished"][status] = count
+        for (host, cause), count in retries.items():
+            hosts.setdefault(host, {"finished": {}, "retries": {}})["retries"][cause] = count
+        for entry in hosts.values():
+            done = sum(entry["finished"].values())
+            failed = done - entry["finished"].get("Completed", 0) - entry["finished"].get("Cancelled", 0)
+            entry["error_rate"] = round(failed / done, 4) if done else None
+
+        return {
+            "time": time.time(),
+            "uptime": round(now - self.started, 3),
+            "bytes_total": bytes_total,
+            "bytes_resumed": bytes_resumed,
+            "throughput": round(recent / min(THROUGHPUT_WINDOW, max(now - self.started, 1)), 1),
+            "tasks": self.gauges(),
+            "stages": stages,
+            "hosts": hosts,
+        }
+
+    def prometheus(self):
+        snap = self.snapshot()
+        lines = [
+            "# HELP m3udl_downloaded_bytes_total Bytes received by all downloads.",
+            "# TYPE m3udl_downloaded_bytes_total counter",
+            f"m3udl_downloaded_bytes_total {snap['bytes_total']}",
+            "# HELP m3udl_resumed_bytes_total Bytes retries reused from partial files instead of downloading again.",
+            "# TYPE m3udl_resumed_bytes_total counter",
+            f"m3udl_resumed_bytes_total {snap['bytes_resumed']}",
+            f"# HELP m3udl_throughput_bytes_per_second Average download speed over the last {THROUGHPUT_WINDOW} seconds.",
+            "# TYPE m3udl_throughput_bytes_per_second gauge",
+            f"m3udl_throughput_bytes_per_second {snap['throughput']}",
+            "# HELP m3udl_tasks Tasks currently in each status.",
+            "# TYPE m3udl_tasks gauge",
+        ]
+        lines += [f'm3udl_tasks{{status="{_escape(status)}"}} {count}' for status, count in snap["tasks"].items()]
+        lines += ["# HELP m3udl_stage_seconds Time tasks spent in each stage.", "# TYPE m3udl_stage_seconds summary"]
+        for name, stats in snap["stages"].items():
+            for q in QUANTILES:
+                value = stats[f"p{int(q * 100)}"]
+                lines.append(f'm3udl_stage_seconds{{stage="{name}",quantile="{q}"}} {"NaN" if value is None else value}')
+            lines.append(f'm3udl_stage_seconds_sum{{stage="{name}"}} {stats["sum"]}')
+            lines.append(f'm3udl_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+        lines += ["# HELP m3udl_tasks_finished_total Tasks that reached a finished status, by host.", "# TYPE m3udl_tasks_finished_total counter"]
+        for host, entry in snap["hosts"].items():
+            lines += [f'm3udl_tasks_finished_total{{host="{_escape(host)}",status="{status}"}} {count}' for status, count in entry["finished"].items()]
+        lines += ["# HELP m3udl_retries_total Retries and rate-limit requeues, by host and cause.", "# TYPE m3udl_retries_total counter"]
+        for host, entry in snap["hosts"].items():
+            lines += [f'm3udl_retries_total{{host="{_escape(host)}",cause="{cause}"}} {count}' for cause, count in entry["retries"].items()]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /metrics.json on localhost from a daemon thread."""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.prometheus(), "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.snapshot()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="m3udl-metrics", daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SnapshotWriter:
+    """Rewrites a JSON snapshot file every `interval` seconds, and once more on close."""
+
+    def __init__(self, metrics, path, interval=DEFAULT_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = max(1, interval)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="m3udl-metrics-snapshot", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.metrics.snapshot(), f, indent=2)
+            # Readers never see a half-written file.
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not write metrics snapshot {self.path}: {e}")
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.write()
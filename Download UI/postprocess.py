@@ -0,0 +1,46 @@
+"""
+Post-processing stage.
+
+FFmpeg steps such as embedding metadata or converting the video are CPU work,
+not network work, so they no longer run inside a download slot. The download
+stage runs yt-dlp without our postprocessors (merging separate video and
+audio streams still happens there, since that is what produces the file) and
+captures the info dict yt-dlp would have handed to them. The engine then
+frees the download slot and runs the postprocessors on that info in its own
+pool, sized to the CPU rather than the connection.
+"""
+
+STEP_LABELS = {
+    "Metadata": "adding metadata",
+    "EmbedThumbnail": "embedding thumbnail",
+    "EmbedSubtitle": "embedding subtitles",
+    "ExtractAudio": "extracting audio",
+    "VideoConvertor": "converting video",
+}
+
+
+def capture_info(ydl):
+    """
+    Adds a final post_process step to `ydl` that records the info dict of the
+    downloaded file. Returns the dict it fills in (empty until a download
+    finishes), ready to be passed to run_postprocessors later.
+    """
+    from yt_dlp.postprocessor.common import PostProcessor
+
+    captured = {}
+    class CaptureInfo(PostProcessor):
+        def run(self, info):
+            captured.clear()
+            # yt-dlp empties __files_to_move once this stage is over, so keep our own copy.
+            captured.update(info, __files_to_move=dict(info.get("__files_to_move") or {}))
+            # Merger and fixups have run by now and their objects can't be sent between processes.
+            captured.pop("__postprocessors", None)
+            return [], info
+    ydl.add_post_processor(CaptureInfo(ydl), when="post_process")
+    return captured
+
+def run_postprocessors(ydl, info):
+    """Runs the postprocessors configured on `ydl` over a captured info dict; returns the final file path."""
+    files_to_move = info.pop("__files_to_move", None)
+    info = ydl.post_process(info["filepath"], info, files_to_move)
+    return info["filepath"]
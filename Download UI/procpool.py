@@ -0,0 +1,269 @@
+"""
+Process-based yt-dlp workers.
+
+In "process" worker mode each yt-dlp job runs in a long-lived worker process
+instead of a thread of the app process, so extractor regexes, JSON parsing
+and hook calls no longer compete with the UI for the GIL. Workers import
+yt-dlp once and are reused for later jobs. Progress (throttled to a few
+messages per second) and results come back over a Pipe as small tuples, and
+the bandwidth limit is shared through the TokenBucket's shared memory.
+
+This module is imported by the worker processes, so it keeps its top-level
+imports light. It is also all they import at startup: see start_process.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+PROGRESS_INTERVAL = 0.1
+POLL_INTERVAL = 0.1
+CANCEL_GRACE = 2.0
+PROGRESS_FIELDS = ("status", "downloaded_bytes", "total_bytes", "total_bytes_estimate", "speed", "eta", "filename", "tmpfilename")
+WORKER_JOB = "job"  # cancellation key for the FFmpeg processes of the job a worker is running
+
+
+class WorkerDied(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+
+_start_lock = threading.Lock()
+
+def start_process(process):
+    """
+    Starts a spawned process without running the app's __main__ script in it.
+    spawn imports the parent's __main__ again (as __mp_main__) in every child;
+    for main.py that is customtkinter, the engine and its capability probe.
+    While the child is launched, __main__ names this module instead.
+    """
+    with _start_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = sys.modules[__name__]
+        try:
+            process.start()
+        finally:
+            sys.modules["__main__"] = main
+
+def expected_filename(ydl, info_dict, sequence_number=None):
+    """The name the finished file will have, for showing in the task list."""
+    if sequence_number is None:
+        return os.path.basename(ydl.prepare_filename(info_dict))
+    return f"{sequence_number}.{info_dict.get('ext', 'mp4')}"
+
+
+# --- App side ---
+
+class ProcessWorkerPool:
+    def __init__(self, bandwidth, max_idle=1):
+        self.context = multiprocessing.get_context("spawn")
+        self.bandwidth = bandwidth
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def run(self, job, on_event, is_cancelled):
+        """
+        Runs one job in a worker process, calling on_event(kind, data) for
+        its progress. Returns (ok, error_message, captured_info), the last
+        being the info dict for the post-processing stage if the job asked
+        for it. Raises JobCancelled if the job was cancelled and WorkerDied
+        if the worker crashed.
+        """
+        worker = self._checkout()
+        try:
+            result = worker.run(job, on_event, is_cancelled)
+        except JobCancelled:
+            # A worker that stopped on its own is fine to reuse; one that had to be terminated is dead.
+            self._checkin(worker)
+            raise
+        except BaseException:
+            worker.terminate()
+            raise
+        self._checkin(worker)
+        return result
+
+    def set_max_idle(self, max_idle):
+        with self.lock:
+            self.max_idle = max_idle
+            surplus, self.idle = self.idle[max_idle:], self.idle[:max_idle]
+        for worker in surplus:
+            worker.terminate()
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            worker.terminate()
+
+    def _checkout(self):
+        with self.lock:
+            while self.idle:
+                worker = self.idle.pop()
+                if worker.process.is_alive():
+                    return worker
+        return WorkerProcess(self.context, self.bandwidth)
+
+    def _checkin(self, worker):
+        with self.lock:
+            if not self.closed and len(self.idle) < self.max_idle and worker.process.is_alive():
+                self.idle.append(worker)
+                return
+        worker.terminate()
+
+
+class WorkerProcess:
+    def __init__(self, context, bandwidth):
+        self.conn, child_conn = context.Pipe()
+        self.cancel_event = context.Event()
+        self.process = context.Process(target=worker_main, args=(child_conn, self.cancel_event, bandwidth),
+                                       name="m3udl-ytdlp-worker", daemon=True)
+        start_process(self.process)
+        child_conn.close()
+
+    def run(self, job, on_event, is_cancelled):
+        self.cancel_event.clear()
+        self.conn.send(job)
+        cancel_deadline = None
+        while True:
+            if self.conn.poll(POLL_INTERVAL):
+                try:
+                    kind, data = self.conn.recv()
+                except (EOFError, OSError):
+                    raise WorkerDied(f"yt-dlp worker process exited with code {self.process.exitcode}")
+                if kind == "result":
+                    if cancel_deadline is not None:
+                        raise JobCancelled("Download cancelled by user.")
+                    return data
+                on_event(kind, data)
+            elif not self.process.is_alive():
+                raise WorkerDied(f"yt-dlp worker process exited with code {self.process.exitcode}")
+
+            if is_cancelled():
+                if cancel_deadline is None:
+                    self.cancel_event.set()
+                    cancel_deadline = time.monotonic() + CANCEL_GRACE
+                elif time.monotonic() > cancel_deadline:
+                    # Stuck somewhere hooks can't reach; a fresh worker will take its place.
+                    self.terminate()
+                    raise JobCancelled("Worker process did not stop in time and was terminated.")
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        self.conn.close()
+
+
+# --- Worker process side ---
+
+class DownloadCancelled(Exception):
+    pass
+
+
+def worker_main(conn, cancel_event, bandwidth):
+    import cancellation
+    cancellation.track_subprocesses()
+    cancellation.set_current_task(WORKER_JOB)
+
+    send_lock = threading.Lock()
+    def send(kind, data):
+        # yt-dlp may call hooks from several fragment threads at once.
+        with send_lock:
+            conn.send((kind, data))
+
+    def watch_cancel():
+        while True:
+            cancel_event.wait()
+            cancellation.kill_processes(WORKER_JOB)
+            time.sleep(POLL_INTERVAL)
+    threading.Thread(target=watch_cancel, name="m3udl-cancel-watch", daemon=True).start()
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return  # the app went away
+        result = run_job(job, send, cancel_event, bandwidth)
+        cancel_event.clear()
+        try:
+            send("result", result)
+        except OSError:
+            return
+
+_info_caches = {}
+
+def run_job(job, send, cancel_event, bandwidth):
+    import yt_dlp
+    import postprocess
+    from archive import video_key
+    from info_cache import InfoCache
+
+    cache, key = None, job.get("cache_key")
+    if job.get("info_cache"):
+        config = job["info_cache"]
+        cache = _info_caches.get(config["directory"])
+        if cache is None:
+            cache = _info_caches[config["directory"]] = InfoCache(**config)
+
+    counted, last_sent = {}, [0.0]
+    def progress_hook(d):
+        if cancel_event.is_set():
+            raise DownloadCancelled("Download cancelled by user.")
+        downloaded = d.get("downloaded_bytes") or 0
+        is_new = d.get("tmpfilename") not in counted
+        previous = counted.get(d.get("tmpfilename"), 0)
+        if d["status"] == "downloading" and downloaded > previous:
+            bandwidth.consume(downloaded - previous, cancel_event.is_set)
+            counted[d.get("tmpfilename")] = downloaded
+        now = time.monotonic()
+        # The first event for a file goes out at once: the parent learns its path (and source) from it.
+        if d["status"] != "downloading" or now - last_sent[0] >= PROGRESS_INTERVAL or is_new:
+            last_sent[0] = now
+            info = d.get("info_dict") or {}
+            # Where the file comes from, so the parent can check the server's copy before a retry resumes it.
+            send("progress", dict({field: d.get(field) for field in PROGRESS_FIELDS}, source=[info.get("url"), info.get("http_headers") or {}]))
+
+    def postprocessor_hook(d):
+        if cancel_event.is_set():
+            raise DownloadCancelled("Download cancelled by user.")
+
+    def extract(ydl, use_cache=True):
+        if cache and use_cache:
+            info = cache.get(key)
+            if info is not None:
+                return info, True
+        info = ydl.sanitize_info(ydl.extract_info(job["url"], download=False))
+        if cache:
+            cache.put(key, info)
+        return info, False
+
+    opts = dict(job["ydl_opts"], progress_hooks=[progress_hook], postprocessor_hooks=[postprocessor_hook], quiet=False)
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            captured = postprocess.capture_info(ydl) if job.get("capture_info") else None
+            info_dict = job.get("info")
+            reused = info_dict is not None
+            if info_dict is None:
+                info_dict, reused = extract(ydl)
+            send("video_key", video_key(info_dict))
+            send("filename", expected_filename(ydl, info_dict, job.get("sequence_number")))
+            try:
+                ydl.process_ie_result(info_dict, download=True)
+            except DownloadCancelled:
+                raise
+            except Exception:
+                if not reused: raise
+                # Cached or prefetched format URLs may have expired; extract fresh and try once more.
+                if cache:
+                    cache.invalidate(key)
+                info_dict, _ = extract(ydl, use_cache=False)
+                ydl.process_ie_result(info_dict, download=True)
+            return True, None, ydl.sanitize_info(captured) if captured else None
+    except Exception as e:
+        return False, str(e).split('\n')[0], None
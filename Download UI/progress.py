@@ -0,0 +1,96 @@
+"""
+Shared progress table.
+
+Download workers write byte counts into the table on every progress callback;
+that is just a dict update under a lock. Consumers (the Tk window, the CLI)
+pull the rows that changed since their last look on their own schedule, so
+the cost of rendering no longer scales with how often yt-dlp calls its hooks.
+"""
+import threading
+import time
+
+# Weight of the newest sample in the smoothed transfer speed.
+SPEED_SMOOTHING = 0.3
+
+
+class ProgressTable:
+    def __init__(self):
+        self.rows = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    def update(self, task_id, downloaded_bytes, total_bytes=None, speed=None, eta=None):
+        now = time.monotonic()
+        with self.lock:
+            row = self.rows.get(task_id)
+            if row is None:
+                row = self.rows[task_id] = {
+                    "downloaded_bytes": 0, "total_bytes": None, "progress": 0.0,
+                    "speed": None, "eta": None, "updated": now,
+                }
+            elif speed is None:
+                elapsed = now - row["updated"]
+                delta = downloaded_bytes - row["downloaded_bytes"]
+                if elapsed > 0 and delta >= 0:
+                    sample = delta / elapsed
+                    speed = sample if row["speed"] is None else (SPEED_SMOOTHING * sample + (1 - SPEED_SMOOTHING) * row["speed"])
+                else:
+                    speed = row["speed"]
+
+            total_bytes = total_bytes or row["total_bytes"]
+            if eta is None and speed and total_bytes:
+                eta = max(0, (total_bytes - downloaded_bytes) / speed)
+
+            row.update(downloaded_bytes=downloaded_bytes, total_bytes=total_bytes, speed=speed, eta=eta, updated=now)
+            if total_bytes:
+                row["progress"] = min(1.0, downloaded_bytes / total_bytes)
+            self.dirty.add(task_id)
+
+    def finish(self, task_id):
+        with self.lock:
+            row = self.rows.get(task_id)
+            if row is None: return
+            row.update(progress=1.0, speed=None, eta=0)
+            self.dirty.add(task_id)
+
+    def reset(self, task_id):
+        with self.lock:
+            self.rows.pop(task_id, None)
+            self.dirty.discard(task_id)
+
+    def get(self, task_id):
+        with self.lock:
+            row = self.rows.get(task_id)
+            return dict(row) if row else None
+
+    def drain(self):
+        """Returns {task_id: row} for every row changed since the last call."""
+        with self.lock:
+            changed = {tid: dict(self.rows[tid]) for tid in self.dirty if tid in self.rows}
+            self.dirty.clear()
+        return changed
+
+
+def format_bytes(num):
+    if num is None: return "?"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num) < 1024:
+            return f"{num:.1f} {unit}" if unit != "B" else f"{int(num)} B"
+        num /= 1024
+    return f"{num:.1f} TiB"
+
+def format_eta(seconds):
+    if seconds is None: return "--:--"
+    seconds = int(seconds)
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+def format_row(row):
+    """One-line "45% · 2.3 MiB/s · ETA 00:12" summary for a progress row."""
+    parts = [f"{row['progress'] * 100:.0f}%" if row["total_bytes"] else format_bytes(row["downloaded_bytes"])]
+    if row["speed"]:
+        parts.append(f"{format_bytes(row['speed'])}/s")
+    if row["eta"] is not None and row["total_bytes"]:
+        parts.append(f"ETA {format_eta(row['eta'])}")
+    return " · ".join(parts)
@@ -0,0 +1,76 @@
+"""
+Shared bandwidth limiter.
+
+Every download backend draws from one TokenBucket, so the configured speed
+limit caps the total rate of all running downloads rather than each one
+separately. The rate can be changed at any time (e.g. when a schedule tier
+starts) and running downloads pick it up on their next chunk.
+"""
+import multiprocessing
+import re
+import time
+
+RATE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*$", re.IGNORECASE)
+RATE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+BURST_SECONDS = 0.25
+MAX_SLEEP = 0.25
+
+RATE, NEXT_FREE, GENERATION = range(3)
+_context = multiprocessing.get_context("spawn")
+
+
+def parse_rate(text):
+    """
+    Parses a speed limit such as "500K", "2M" or "1.5MB/s" into bytes per
+    second. Empty or zero means unlimited (None).
+    """
+    if text is None or text == "": return None
+    if isinstance(text, (int, float)): return float(text) or None
+    match = RATE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Invalid speed limit: {text!r}")
+    return float(match.group(1)) * RATE_UNITS[match.group(2).lower()] or None
+
+
+class TokenBucket:
+    """
+    Virtual-time token bucket: each consume() reserves the next n/rate
+    seconds of bandwidth, so concurrent callers are served in arrival order
+    and the combined rate never exceeds the limit (plus a small burst).
+
+    The state lives in shared memory, so worker processes handed the bucket
+    (see procpool) draw from the same limit as the threads of this process.
+    """
+
+    def __init__(self, rate=None):
+        # [rate, next_free, generation]; rate 0 means unlimited.
+        self.state = _context.RawArray("d", [rate or 0.0, time.monotonic(), 0.0])
+        self.lock = _context.Lock()
+
+    @property
+    def rate(self):
+        return self.state[RATE] or None
+
+    def set_rate(self, rate):
+        with self.lock:
+            if (rate or 0.0) == self.state[RATE]: return
+            self.state[RATE] = rate or 0.0
+            # Reservations made at the old rate no longer apply.
+            self.state[NEXT_FREE] = time.monotonic()
+            self.state[GENERATION] += 1
+
+    def consume(self, amount, is_cancelled=None):
+        """Blocks until `amount` bytes fit under the limit (returns early if cancelled or the rate changes)."""
+        with self.lock:
+            rate = self.state[RATE]
+            if not rate or amount <= 0: return
+            now = time.monotonic()
+            self.state[NEXT_FREE] = max(self.state[NEXT_FREE], now) + amount / rate
+            wake_at = self.state[NEXT_FREE] - BURST_SECONDS
+            generation = self.state[GENERATION]
+        while True:
+            remaining = wake_at - time.monotonic()
+            if remaining <= 0 or generation != self.state[GENERATION]: return
+            if is_cancelled and is_cancelled(): return
+            time.sleep(min(remaining, MAX_SLEEP))
@@ -0,0 +1,115 @@
+"""
+Indexed task table.
+
+Behaves like the plain {task_id: task} dict the engine used before, but also
+keeps a status -> task ids index and a future -> task id index, so counting
+active downloads, finding the task a finished future belongs to and
+collecting all tasks in a given state no longer scan every task.
+"""
+import threading
+
+
+class TaskRegistry:
+    def __init__(self):
+        self.tasks = {}
+        self.by_status = {}
+        self.by_future = {}
+        self.lock = threading.RLock()
+
+    # --- Dict-style access ---
+
+    def __contains__(self, task_id):
+        return task_id in self.tasks
+
+    def __getitem__(self, task_id):
+        return self.tasks[task_id]
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def get(self, task_id, default=None):
+        return self.tasks.get(task_id, default)
+
+    def keys(self):
+        with self.lock:
+            return list(self.tasks.keys())
+
+    def values(self):
+        with self.lock:
+            return list(self.tasks.values())
+
+    def items(self):
+        with self.lock:
+            return list(self.tasks.items())
+
+    # --- Mutation ---
+
+    def add(self, task):
+        with self.lock:
+            self.tasks[task["id"]] = task
+            self.by_status.setdefault(task["status"], set()).add(task["id"])
+
+    def remove(self, task_id):
+        with self.lock:
+            task = self.tasks.pop(task_id, None)
+            if task is None: return None
+            self._unindex_status(task_id, task["status"])
+            future = task.get("future")
+            if future is not None:
+                self.by_future.pop(future, None)
+            return task
+
+    def update(self, task_id, updates):
+        """Applies field updates to a task, keeping the status index in step."""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None: return None
+            status = updates.get("status")
+            if status is not None and status != task["status"]:
+                self._unindex_status(task_id, task["status"])
+                self.by_status.setdefault(status, set()).add(task_id)
+            task.update(updates)
+            return task
+
+    def set_future(self, task_id, future):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None: return
+            if task.get("future") is not None:
+                self.by_future.pop(task["future"], None)
+            task["future"] = future
+            if future is not None:
+                self.by_future[future] = task_id
+
+    def pop_future(self, future):
+        """Returns the id of the task a finished future belonged to and forgets the mapping."""
+        with self.lock:
+            task_id = self.by_future.pop(future, None)
+            task = self.tasks.get(task_id)
+            if task is not None and task.get("future") is future:
+                task["future"] = None
+            return task_id
+
+    def _unindex_status(self, task_id, status):
+        ids = self.by_status.get(status)
+        if ids is not None:
+            ids.discard(task_id)
+            if not ids:
+                del self.by_status[status]
+
+    # --- Queries ---
+
+    def count(self, *statuses):
+        with self.lock:
+            return sum(len(self.by_status.get(status, ())) for status in statuses)
+
+    def ids_with_status(self, *statuses):
+        with self.lock:
+            ids = set()
+            for status in statuses:
+                ids.update(self.by_status.get(status, ()))
+            return ids
+
+    def counts(self):
+        with self.lock:
+            return {status: len(ids) for status, ids in self.by_status.items()}
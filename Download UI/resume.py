@@ -0,0 +1,68 @@
+"""
+Checks that make continuing a partial download safe.
+
+A retry picks up the .part file an earlier attempt left behind instead of
+fetching everything again. That only works if the server still has the same
+file (same ETag, Last-Modified and size) and the partial data on disk is
+still what was written. So resume state records the server's validators and
+a CRC of the last TAIL_BYTES of every span already written. If either has
+changed, the partial is thrown away rather than extended into a corrupt file.
+"""
+import zlib
+
+import requests
+
+TAIL_BYTES = 64 * 1024
+HEAD_TIMEOUT = 10
+
+
+def validators(response):
+    """The headers that identify which version of a file a response belongs to."""
+    return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+def validators_match(saved, current):
+    """False if any validator the server sent both times has changed."""
+    return all(not saved.get(key) or not current.get(key) or saved[key] == current[key] for key in ("etag", "last_modified", "size"))
+
+def head_validators(session, url, headers=None):
+    """Validators and size of `url` from a HEAD request, or None if the request fails or the server sends none."""
+    try:
+        response = session.head(url, headers=headers or {}, timeout=HEAD_TIMEOUT, allow_redirects=True)
+    except requests.RequestException:
+        return None
+    if response.status_code >= 400: return None
+    found = dict(validators(response), size=response.headers.get("Content-Length"))
+    return found if any(found.values()) else None
+
+def written_spans(missing, size):
+    """The [start, end) spans of a `size`-byte file not covered by the sorted `missing` ranges."""
+    spans, position = [], 0
+    for start, end in sorted(missing):
+        if start > position:
+            spans.append((position, start))
+        position = max(position, end)
+    if position < size:
+        spans.append((position, size))
+    return spans
+
+def tail_checks(path, spans):
+    """[[first, end, crc32]] over the last TAIL_BYTES of each span of `path`."""
+    checks = []
+    with open(path, "rb") as f:
+        for start, end in spans:
+            first = max(start, end - TAIL_BYTES)
+            f.seek(first)
+            checks.append([first, end, zlib.crc32(f.read(end - first))])
+    return checks
+
+def verify_tail_checks(path, checks):
+    """True if `path` still holds the bytes `tail_checks` saw."""
+    try:
+        with open(path, "rb") as f:
+            for first, end, crc in checks:
+                f.seek(first)
+                data = f.read(end - first)
+                if len(data) != end - first or zlib.crc32(data) != crc: return False
+    except (OSError, ValueError, TypeError):
+        return False
+    return True
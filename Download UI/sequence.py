@@ -0,0 +1,64 @@
+"""
+Sequence number allocation for sequential file naming.
+
+The first allocation for an output directory scans it once for numbered
+files ("41.mp4"); after that the highest number is kept in memory, so adding
+the next task costs nothing even next to 100k existing files. Allocation
+happens under a lock, so two adds at the same time never get the same
+number.
+"""
+import os
+import threading
+
+
+def sequence_number_of(path):
+    """The number a file name like "41.mp4" carries, or None."""
+    name, _ = os.path.splitext(os.path.basename(path))
+    return int(name) if name.isdigit() else None
+
+
+class SequenceAllocator:
+    def __init__(self):
+        self.highest = {}       # normalized directory -> highest number seen or handed out
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(directory):
+        return os.path.normcase(os.path.abspath(directory))
+
+    def allocate(self, directory, count=1):
+        """Reserves `count` consecutive numbers for `directory` and returns the first."""
+        key = self._key(directory)
+        with self.lock:
+            if key not in self.highest:
+                self.highest[key] = self._scan(directory)
+            first = self.highest[key] + 1
+            self.highest[key] += count
+            return first
+
+    def observe(self, directory, number):
+        """Records a number used outside allocate(), e.g. by a restored task or a finished file."""
+        if number is None: return
+        key = self._key(directory)
+        with self.lock:
+            # Scanned now rather than later: a restored task's file may not exist yet for the scan to find.
+            if key not in self.highest:
+                self.highest[key] = self._scan(directory)
+            self.highest[key] = max(self.highest[key], number)
+
+    def observe_file(self, path):
+        if path:
+            self.observe(os.path.dirname(path), sequence_number_of(path))
+
+    @staticmethod
+    def _scan(directory):
+        highest = 0
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    number = sequence_number_of(entry.name)
+                    if number is not None and number > highest:
+                        highest = number
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        return highest
@@ -0,0 +1,279 @@
+"""
+Virtualized Download Manager list.
+
+Only enough row widgets to fill the visible area are created. Scrolling
+re-binds those rows to different tasks instead of creating new widgets, so
+the widget count stays constant whether the queue holds 10 or 100,000 tasks.
+"""
+import customtkinter as ctk
+
+from engine import (
+    STATUS_QUEUED, STATUS_DOWNLOADING, STATUS_RETRYING, STATUS_POSTPROCESSING, STATUS_COMPLETED, STATUS_ERROR, STATUS_CANCELLED,
+    FINISHED_STATUSES,
+)
+from progress import format_row, format_bytes
+
+ROW_HEIGHT = 64
+FINISHED_PAGE_SIZE = 100
+
+FILTER_ALL = "All"
+FILTER_ACTIVE = "Active"
+STATUS_FILTERS = [FILTER_ALL, FILTER_ACTIVE, STATUS_QUEUED, STATUS_DOWNLOADING, STATUS_POSTPROCESSING, STATUS_COMPLETED, STATUS_ERROR, STATUS_CANCELLED]
+
+SHOW_MORE_ROW = "__show_more__"
+
+STATUS_COLORS = {STATUS_COMPLETED: "green", STATUS_ERROR: "red", STATUS_CANCELLED: "gray"}
+BORDER_COLORS = {STATUS_COMPLETED: "green", STATUS_ERROR: "red", STATUS_DOWNLOADING: "#3B8ED0", STATUS_POSTPROCESSING: "#8E6FD0"}
+DEFAULT_BORDER_COLOR = "#565B5E"
+
+
+class TaskRow(ctk.CTkFrame):
+    """A reusable row widget; bind_task() points it at a task or at the "show more" summary."""
+
+    def __init__(self, master, task_list):
+        super().__init__(master, height=ROW_HEIGHT - 6, border_width=1, border_color=DEFAULT_BORDER_COLOR)
+        self.task_list = task_list
+        self.task_id = None
+        self.grid_propagate(False)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.filename_label = ctk.CTkLabel(self, text="", anchor="w")
+        self.filename_label.grid(row=0, column=0, padx=10, pady=2, sticky="ew")
+
+        self.progress_bar = ctk.CTkProgressBar(self)
+        self.progress_bar.set(0)
+        self.progress_bar.grid(row=1, column=0, padx=10, pady=2, sticky="ew")
+
+        self.status_label = ctk.CTkLabel(self, text="", anchor="w", width=260)
+        self.status_label.grid(row=1, column=1, padx=10, pady=2, sticky="w")
+        self.status_label.bind("<Enter>", self.on_status_enter)
+        self.status_label.bind("<Leave>", lambda e: self.task_list.app.hide_tooltip())
+
+        self.action_btn = ctk.CTkButton(self, text="Cancel", width=100, command=self.on_action)
+        self.action_btn.grid(row=0, column=1, padx=10, pady=2, sticky="e")
+
+    def bind_task(self, task_id):
+        self.task_id = task_id
+        if task_id == SHOW_MORE_ROW:
+            hidden = self.task_list.hidden_finished
+            self.filename_label.configure(text=f"{hidden} more finished item{'s' if hidden != 1 else ''} hidden")
+            self.status_label.configure(text="", text_color=("gray10", "gray90"))
+            self.progress_bar.grid_remove()
+            self.configure(border_color=DEFAULT_BORDER_COLOR)
+            self.action_btn.configure(text=f"Show {min(hidden, FINISHED_PAGE_SIZE)} more", state="normal")
+            return
+
+        task = self.task_list.app.tasks.get(task_id)
+        if task is None: return
+        self.progress_bar.grid()
+        self.filename_label.configure(text=task["filename"])
+        self.render_status(task, self.task_list.app.engine.progress.get(task_id))
+
+    def render_status(self, task, row):
+        status = task["status"]
+        progress = 1 if status in (STATUS_COMPLETED, STATUS_POSTPROCESSING) else (row["progress"] if row else 0)
+        self.progress_bar.set(progress)
+
+        text = status
+        if status == STATUS_DOWNLOADING and row:
+            text = f"{status} {format_row(row)}"
+        elif status == STATUS_POSTPROCESSING and task.get("pp_step"):
+            # Download finished; the bar stays full while FFmpeg works on the file.
+            text = f"{status} · {task['pp_step']}..."
+        elif status == STATUS_RETRYING:
+            text = f"{status} ({task['retries']})..."
+        elif status == STATUS_QUEUED and task.get("total_bytes"):
+            # Known ahead of time when metadata was prefetched.
+            text = f"{status} · {format_bytes(task['total_bytes'])}"
+        if task.get("resumed_bytes") and status in (STATUS_DOWNLOADING, STATUS_RETRYING, STATUS_QUEUED, STATUS_COMPLETED):
+            # Partial data retries continued from rather than downloading again.
+            text += f" · {format_bytes(task['resumed_bytes'])} resumed"
+        self.status_label.configure(text=text, text_color=STATUS_COLORS.get(status, ("gray10", "gray90")))
+        self.configure(border_color=BORDER_COLORS.get(status, DEFAULT_BORDER_COLOR))
+
+        if status == STATUS_COMPLETED:
+            self.action_btn.configure(text="Open Folder", state="normal" if task["final_filepath"] else "disabled")
+        elif status in (STATUS_ERROR, STATUS_CANCELLED):
+            self.action_btn.configure(text="Cancel", state="disabled")
+        else:
+            self.action_btn.configure(text="Cancel", state="normal")
+
+    def on_action(self):
+        if self.task_id == SHOW_MORE_ROW:
+            self.task_list.show_more_finished()
+            return
+        task = self.task_list.app.tasks.get(self.task_id)
+        if task is None: return
+        if task["status"] == STATUS_COMPLETED:
+            self.task_list.app.open_file_location(task["final_filepath"])
+        else:
+            self.task_list.app.cancel_task(self.task_id)
+
+    def on_status_enter(self, event):
+        task = self.task_list.app.tasks.get(self.task_id)
+        if task and task["status"] == STATUS_ERROR and task.get("error_message"):
+            self.task_list.app.show_tooltip(task["error_message"])
+
+
+class VirtualTaskList(ctk.CTkFrame):
+    def __init__(self, master, app):
+        super().__init__(master)
+        self.app = app
+        self.task_ids = []          # insertion order, every task in the engine
+        self.view = []              # filtered ids currently scrollable, maybe ending with SHOW_MORE_ROW
+        self.view_index = {}
+        self.view_dirty = False
+        self.refresh_pending = False
+        self.first_row = 0
+        self.rows = []
+        self.status_filter = FILTER_ALL
+        self.finished_shown = FINISHED_PAGE_SIZE
+        self.hidden_finished = 0
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        self.summary_label = ctk.CTkLabel(self, text="No downloads", anchor="w")
+        self.summary_label.grid(row=0, column=0, columnspan=2, padx=10, pady=(5, 0), sticky="ew")
+
+        self.canvas = ctk.CTkFrame(self, fg_color="transparent")
+        self.canvas.grid(row=1, column=0, padx=(5, 0), pady=5, sticky="nsew")
+        self.canvas.grid_columnconfigure(0, weight=1)
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, padx=(0, 5), pady=5, sticky="ns")
+
+        self.canvas.bind("<Configure>", self.on_resize)
+        self.bind_all("<MouseWheel>", self.on_mousewheel, add="+")
+        self.bind_all("<Button-4>", self.on_mousewheel, add="+")
+        self.bind_all("<Button-5>", self.on_mousewheel, add="+")
+
+    # --- Data model ---
+
+    def add_task(self, task_id):
+        self.task_ids.append(task_id)
+        self.invalidate()
+
+    def add_tasks(self, task_ids):
+        self.task_ids.extend(task_ids)
+        self.invalidate()
+
+    def remove_task(self, task_id):
+        # Pruned from task_ids in one pass on the next rebuild.
+        self.invalidate()
+
+    def task_updated(self, task_id, updates):
+        if "status" in updates:
+            # Status changes can move a task in or out of the current filter.
+            self.invalidate()
+        elif task_id in self.view_index:
+            self.redraw_task(task_id)
+
+    def set_filter(self, status_filter):
+        self.status_filter = status_filter
+        self.finished_shown = FINISHED_PAGE_SIZE
+        self.first_row = 0
+        self.invalidate()
+
+    def show_more_finished(self):
+        self.finished_shown += FINISHED_PAGE_SIZE
+        self.invalidate()
+
+    def matches_filter(self, status):
+        if self.status_filter == FILTER_ALL: return True
+        if self.status_filter == FILTER_ACTIVE: return status not in FINISHED_STATUSES
+        if self.status_filter == STATUS_QUEUED: return status in (STATUS_QUEUED, STATUS_RETRYING)
+        return status == self.status_filter
+
+    def rebuild_view(self):
+        tasks = self.app.tasks
+        self.task_ids = [tid for tid in self.task_ids if tid in tasks]
+        matching = [tid for tid in self.task_ids if self.matches_filter(tasks[tid]["status"])]
+
+        # Keep only the most recent finished items; older ones collapse into a summary row.
+        finished = [tid for tid in matching if tasks[tid]["status"] in FINISHED_STATUSES]
+        self.hidden_finished = max(0, len(finished) - self.finished_shown)
+        if self.hidden_finished:
+            hidden = set(finished[:self.hidden_finished])
+            matching = [tid for tid in matching if tid not in hidden]
+            matching.append(SHOW_MORE_ROW)
+
+        self.view = matching
+        self.view_index = {tid: i for i, tid in enumerate(matching)}
+        self.view_dirty = False
+
+        counts = tasks.counts()
+        summary = ", ".join(f"{count} {status.lower()}" for status, count in counts.items())
+        self.summary_label.configure(text=f"{len(tasks)} downloads" + (f" ({summary})" if summary else ""))
+
+    # --- Rendering ---
+
+    def invalidate(self):
+        self.view_dirty = True
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            self.after_idle(self.refresh)
+
+    def refresh(self):
+        self.refresh_pending = False
+        if self.view_dirty:
+            self.rebuild_view()
+        self.first_row = max(0, min(self.first_row, len(self.view) - len(self.rows)))
+        for i, row in enumerate(self.rows):
+            index = self.first_row + i
+            if index < len(self.view):
+                row.bind_task(self.view[index])
+                row.grid(row=i, column=0, padx=5, pady=3, sticky="ew")
+            else:
+                row.task_id = None
+                row.grid_remove()
+        self.update_scrollbar()
+
+    def redraw_task(self, task_id, progress_row=None):
+        index = self.view_index.get(task_id)
+        if index is None or not (self.first_row <= index < self.first_row + len(self.rows)): return
+        row = self.rows[index - self.first_row]
+        task = self.app.tasks.get(task_id)
+        if task is None or row.task_id != task_id: return
+        if progress_row is None:
+            row.bind_task(task_id)
+        else:
+            row.render_status(task, progress_row)
+
+    def refresh_progress(self, changed_rows):
+        for task_id, progress_row in changed_rows.items():
+            self.redraw_task(task_id, progress_row)
+
+    def on_resize(self, event):
+        visible = max(1, event.height // ROW_HEIGHT)
+        while len(self.rows) < visible:
+            self.rows.append(TaskRow(self.canvas, self))
+        while len(self.rows) > visible:
+            self.rows.pop().destroy()
+        self.refresh()
+
+    def update_scrollbar(self):
+        total = len(self.view)
+        if total <= len(self.rows) or total == 0:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.first_row / total, (self.first_row + len(self.rows)) / total)
+
+    def scroll_to(self, first_row):
+        first_row = max(0, min(first_row, len(self.view) - len(self.rows)))
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self.refresh()
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.view)))
+        elif action == "scroll":
+            step = len(self.rows) if unit == "pages" else 1
+            self.scroll_to(self.first_row + int(value) * step)
+
+    def on_mousewheel(self, event):
+        # Bound application-wide, so ignore wheel events over other widgets.
+        if not str(event.widget).startswith(str(self.canvas)): return
+        up = event.num == 4 or (event.num != 5 and event.delta > 0)
+        self.scroll_to(self.first_row + (-3 if up else 3))
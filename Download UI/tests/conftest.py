@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules import each other as top-level modules from "Download UI".
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+from fakeserver import FakeMediaServer  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def server():
+    with FakeMediaServer() as server:
+        yield server
+
+
+@pytest.fixture
+def make_engine(tmp_path, monkeypatch):
+    """Builds headless engines that keep their runtime files in tmp_path; all are shut down afterwards."""
+    monkeypatch.chdir(tmp_path)
+    engines = []
+    def make(start=True, journal=None, **settings):
+        merged = engine.load_settings(str(tmp_path / "settings.json"))
+        merged.update(settings)
+        downloads = engine.DownloadEngine(merged, journal=journal, info_cache=None)
+        if start: downloads.start_scheduler()
+        engines.append(downloads)
+        return downloads
+    yield make
+    for downloads in engines:
+        if not downloads.shutdown_event.is_set():
+            downloads.shutdown()
@@ -0,0 +1,38 @@
+import pytest
+
+from archive import DedupIndex, DownloadArchive, normalize_url
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://www.youtube.com/watch?v=ID&utm_source=x", "youtube.com/watch?v=ID"),
+    ("http://m.youtube.com/watch?feature=share&v=ID", "youtube.com/watch?v=ID"),
+    ("https://youtu.be/ID?si=abc", "youtube.com/watch?v=ID"),
+    ("https://www.youtube.com/shorts/ID", "youtube.com/watch?v=ID"),
+    ("https://youtube.com/embed/ID/", "youtube.com/watch?v=ID"),
+    ("https://Example.com:443/a/b/?b=2&a=1", "example.com/a/b?a=1&b=2"),
+    ("https://example.com:8443/a", "example.com:8443/a"),
+    ("  not a url  ", "not a url"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_dedup_index_tracks_queued_and_downloaded(tmp_path):
+    archive = DownloadArchive(str(tmp_path / "archive.db"))
+    index = DedupIndex(archive)
+    keys = [f"url {normalize_url('https://www.example.com/v.mp4?utm_medium=a')}"]
+    same = [f"url {normalize_url('https://example.com/v.mp4')}"]
+
+    assert index.find(keys) is None
+    index.claim(1, keys)
+    assert index.find(same) == ("queued", 1)
+    index.release(1)
+    assert index.find(same) is None
+
+    index.claim(2, keys)
+    index.add_key(2, "youtube ID")
+    assert index.find(["youtube ID"]) == ("queued", 2)
+    index.complete(2, "https://example.com/v.mp4")
+    assert index.find(same) == ("downloaded", None)
+    assert index.find(["youtube ID"]) == ("downloaded", None)
+    archive.close()
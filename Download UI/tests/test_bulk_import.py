@@ -0,0 +1,33 @@
+import pytest
+
+from bulk_import import ImportFailed, iter_entries, parse_extinf
+
+
+def test_parse_extinf_title_follows_first_unquoted_comma():
+    assert parse_extinf("#EXTINF:-1,Plain title") == "Plain title"
+    assert parse_extinf('#EXTINF:-1 tvg-name="A, B" group-title="News",Channel, with comma') == "Channel, with comma"
+    assert parse_extinf("#EXTINF:10") is None
+
+
+def test_iter_entries_pairs_titles_with_urls():
+    lines = [
+        "#EXTM3U",
+        "#EXTINF:-1,First",
+        "https://example.com/1.mp4",
+        "# a comment",
+        "",
+        "https://example.com/2.mp4",
+        '#EXTINF:5 group-title="x,y",Third',
+        "https://example.com/3.m3u8",
+    ]
+    assert list(iter_entries(lines)) == [
+        ("https://example.com/1.mp4", "First"),
+        ("https://example.com/2.mp4", None),
+        ("https://example.com/3.m3u8", "Third"),
+    ]
+
+
+def test_iter_entries_rejects_hls_media_playlists():
+    lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:4", "#EXTINF:4.0,", "seg0.ts"]
+    with pytest.raises(ImportFailed):
+        list(iter_entries(lines))
@@ -0,0 +1,47 @@
+from concurrency import PROBE_WINDOWS, AdaptiveConcurrency
+
+
+def window(controller, throughput, busy=None, failures=0):
+    controller.record_bytes(throughput)
+    for _ in range(failures):
+        controller.record_failure()
+    return controller.sample(1.0, controller.level if busy is None else busy)
+
+
+def test_adds_slots_while_throughput_rises():
+    controller = AdaptiveConcurrency(1, 4, start=1)
+    assert window(controller, 100) == (2, "throughput rising")
+    assert window(controller, 200) == (3, "throughput rising")
+    assert window(controller, 300) == (4, "throughput rising")
+    assert window(controller, 400) == (4, None)
+
+
+def test_failures_halve_the_level():
+    controller = AdaptiveConcurrency(1, 8, start=6)
+    level, reason = window(controller, 100, failures=2)
+    assert level == 3 and reason == "2 failures"
+    assert window(controller, 100, failures=1)[0] == 1
+
+
+def test_undoes_a_step_that_made_throughput_drop():
+    controller = AdaptiveConcurrency(1, 8, start=2)
+    assert window(controller, 100)[0] == 3
+    assert window(controller, 50) == (2, "throughput fell after adding a download")
+    assert window(controller, 50) == (2, None)
+
+
+def test_holds_when_slots_are_idle_and_probes_on_a_plateau():
+    controller = AdaptiveConcurrency(1, 8, start=2)
+    window(controller, 100)
+    assert window(controller, 500, busy=1) == (3, None)
+    for _ in range(PROBE_WINDOWS - 1):
+        assert window(controller, 100)[1] is None
+    assert window(controller, 100) == (4, "probing for more bandwidth")
+
+
+def test_bounds_clamp_the_level():
+    controller = AdaptiveConcurrency(1, 8, start=6)
+    controller.set_bounds(2, 4)
+    assert controller.level == 4
+    controller.set_bounds(5, 3)
+    assert (controller.minimum, controller.maximum, controller.level) == (5, 5, 5)
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+import requests
+
+import direct
+from fakeserver import file_bytes
+
+SIZE = 3 * 1024 * 1024 + 12345
+
+
+@pytest.fixture(autouse=True)
+def small_ranges(monkeypatch):
+    # Smaller ranges and timeouts keep the tests quick while still exercising splitting and stalls.
+    monkeypatch.setattr(direct, "MIN_SPLIT", 256 * 1024)
+    monkeypatch.setattr(direct, "STALL_TIMEOUT", 1)
+    monkeypatch.setattr(direct, "REQUEST_TIMEOUT", (5, 1))
+
+
+class Interrupted(requests.ConnectionError):
+    pass
+
+
+def download(server, path, tmp_path, connections=4, fail_after=None, retries=None, monkeypatch=None):
+    """Runs one attempt; `fail_after` bytes makes every connection fail once that much has arrived."""
+    received, resumed = [0], []
+    def throttle(amount):
+        received[0] += amount
+        if fail_after is not None and received[0] > fail_after:
+            raise Interrupted("connection dropped")
+    def hook(d):
+        if d.get("resumed_bytes"): resumed.append(d["resumed_bytes"])
+    if retries is not None:
+        monkeypatch.setattr(direct, "REQUEST_RETRIES", retries)
+    downloader = direct.DirectDownloader(requests.Session(), connections, hook, throttle=throttle)
+    filepath = downloader.download(server.url(path), str(tmp_path))
+    return filepath, received[0], resumed
+
+
+@pytest.mark.parametrize("connections", [1, 2, 4, 8])
+def test_multi_connection_download_is_byte_exact(server, tmp_path, connections):
+    filepath, received, _ = download(server, f"/video/exact{connections}.mp4?size={SIZE}&rate=8000000", tmp_path, connections)
+    with open(filepath, "rb") as f:
+        assert f.read() == file_bytes(f"/video/exact{connections}.mp4", 0, SIZE)
+    # The throttle meters wire bytes; a split range may read a little past its new end.
+    assert received >= SIZE
+    assert not (tmp_path / f"exact{connections}.mp4.part.json").exists()
+
+
+def test_stalled_connection_recovers(server, tmp_path):
+    path = f"/video/stall.mp4?size={SIZE}&stall_after=100000&stalls=1&stall=30"
+    filepath, _, _ = download(server, path, tmp_path)
+    with open(filepath, "rb") as f:
+        assert f.read() == file_bytes("/video/stall.mp4", 0, SIZE)
+
+
+def test_resume_after_failure_fetches_only_missing_ranges(server, tmp_path, monkeypatch):
+    path = f"/video/resume.mp4?size={SIZE}"
+    with pytest.raises(direct.DirectError):
+        download(server, path, tmp_path, fail_after=SIZE // 2, retries=0, monkeypatch=monkeypatch)
+    state = json.loads((tmp_path / "resume.mp4.part.json").read_text())
+    missing = sum(end - start for start, end in state["remaining"])
+    assert 0 < missing < SIZE
+
+    filepath, received, resumed = download(server, path, tmp_path)
+    assert missing <= received < SIZE
+    assert resumed == [SIZE - missing]
+    with open(filepath, "rb") as f:
+        assert f.read() == file_bytes("/video/resume.mp4", 0, SIZE)
+
+
+@pytest.mark.parametrize("damage", ["etag", "tail"])
+def test_untrusted_partial_is_discarded(server, tmp_path, monkeypatch, damage):
+    path = f"/video/changed-{damage}.mp4?size={SIZE}"
+    with pytest.raises(direct.DirectError):
+        download(server, path, tmp_path, fail_after=SIZE // 2, retries=0, monkeypatch=monkeypatch)
+    state_path = tmp_path / f"changed-{damage}.mp4.part.json"
+    state = json.loads(state_path.read_text())
+    if damage == "etag":
+        state["validators"]["etag"] = '"a-different-version"'
+        state_path.write_text(json.dumps(state))
+    else:
+        first, end, _ = state["checks"][0]
+        with open(tmp_path / f"changed-{damage}.mp4.part", "r+b") as f:
+            f.seek(end - 4)
+            f.write(b"\xde\xad\xbe\xef")
+
+    filepath, received, resumed = download(server, path, tmp_path)
+    assert received >= SIZE and resumed == []
+    with open(filepath, "rb") as f:
+        assert f.read() == file_bytes(f"/video/changed-{damage}.mp4", 0, SIZE)
+
+
+def test_http_error_is_reported(server, tmp_path):
+    with pytest.raises(direct.DirectError, match="HTTP Error 404"):
+        download(server, "/video/missing.mp4?fail=99&code=404", tmp_path)
+
+
+def test_rate_limit_carries_retry_after(server, tmp_path):
+    with pytest.raises(direct.DirectRateLimited) as raised:
+        download(server, "/video/busy.mp4?fail=1&code=429&retry_after=7", tmp_path)
+    assert raised.value.retry_after == 7
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+import direct
+import engine
+import hls
+
+
+@pytest.mark.parametrize("path, method, unsupported", [
+    ("/video/pp.mp4", "download_direct", direct.DirectUnsupported),
+    ("/hls/pp.m3u8?segments=2", "download_hls", hls.HLSUnsupported),
+])
+def test_built_in_downloaders_leave_post_processing_to_yt_dlp(server, tmp_path, make_engine, monkeypatch, path, method, unsupported):
+    monkeypatch.setattr(engine, "FFMPEG_AVAILABLE", True)
+    downloads = make_engine(start=False)
+    downloads.settings["yt_dlp_options"]["convert_video"] = "mkv"
+    task_id = downloads.add_task(server.url(path), str(tmp_path))
+    with pytest.raises(unsupported, match="post-processing"):
+        getattr(downloads, method)(task_id, lambda d: None)
+    assert not list(tmp_path.glob("pp.*"))
+
+
+def failed_yt_dlp_task(downloads, server, tmp_path, path):
+    """A queued task that left a 200000-byte partial of `path` behind, as yt-dlp's progress hook records it."""
+    task_id = downloads.add_task(server.url(path), str(tmp_path))
+    task = downloads.tasks[task_id]
+    part_path = str(tmp_path / "video.mp4.part")
+    with open(part_path, "wb") as f:
+        f.write(b"x" * 200000)
+    task["partial_files"] = {part_path}
+    task["partial_sources"] = {part_path: [server.url(path), {}]}
+    return task, part_path
+
+
+def test_retry_resumes_unchanged_partial(server, tmp_path, make_engine):
+    downloads = make_engine(start=False)
+    task, part_path = failed_yt_dlp_task(downloads, server, tmp_path, "/video/same.mp4?size=1000000")
+    downloads.snapshot_partial_files(task)
+    assert downloads.verify_partial_files(task) == 200000
+    assert task["resumed_bytes"] == 200000
+
+
+def test_retry_discards_partial_when_server_copy_changed(server, tmp_path, make_engine):
+    downloads = make_engine(start=False)
+    task, part_path = failed_yt_dlp_task(downloads, server, tmp_path, "/video/old.mp4?size=1000000")
+    downloads.snapshot_partial_files(task)
+    # The fake server's ETag depends on the path, so this answers like a new version of the file.
+    task["partial_sources"][part_path] = [server.url("/video/new.mp4?size=1000000"), {}]
+    assert downloads.verify_partial_files(task) == 0
+    assert not os.path.exists(part_path)
+
+
+def test_rate_limited_failure_sends_no_head_requests(server, tmp_path, make_engine):
+    downloads = make_engine(start=False)
+    task, part_path = failed_yt_dlp_task(downloads, server, tmp_path, "/video/limited-head.mp4")
+    downloads.update_task(task["id"], status=engine.STATUS_DOWNLOADING)
+    before = server.requests
+    downloads.handle_download_error(task["id"], "HTTP Error 429: Too Many Requests")
+    assert "resume_checks" not in task
+    assert task["status"] == engine.STATUS_QUEUED
+    assert server.requests == before
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+import requests
+
+import hls
+from fakeserver import file_bytes
+
+SEGMENTS, SEGMENT_SIZE = 20, 32 * 1024
+
+
+class Interrupted(requests.ConnectionError):
+    pass
+
+
+def download(server, tmp_path, fail_after=None):
+    received, resumed = [0], []
+    def throttle(amount):
+        received[0] += amount
+        if fail_after is not None and received[0] > fail_after:
+            raise Interrupted("connection dropped")
+    def hook(d):
+        if d.get("resumed_bytes"): resumed.append(d["resumed_bytes"])
+    downloader = hls.HLSDownloader(requests.Session(), 4, hook, throttle=throttle)
+    filepath = downloader.download(server.url(f"/hls/show.m3u8?segments={SEGMENTS}&size={SEGMENT_SIZE}"), str(tmp_path))
+    return filepath, resumed
+
+
+def expected_bytes():
+    return b"".join(file_bytes(f"/hls/show/{i}.ts", 0, SEGMENT_SIZE) for i in range(SEGMENTS))
+
+
+def test_download_joins_segments_in_order(server, tmp_path):
+    filepath, _ = download(server, tmp_path)
+    with open(filepath, "rb") as f:
+        assert f.read() == expected_bytes()
+
+
+def test_resume_after_failure_continues_from_last_segment(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(hls, "SEGMENT_RETRIES", 0)
+    with pytest.raises(hls.HLSError):
+        download(server, tmp_path, fail_after=SEGMENTS * SEGMENT_SIZE // 2)
+    state = json.loads((tmp_path / "show.ts.part.json").read_text())
+    assert 0 < state["segments_done"] < SEGMENTS
+
+    filepath, resumed = download(server, tmp_path)
+    assert resumed == [state["bytes"]]
+    with open(filepath, "rb") as f:
+        assert f.read() == expected_bytes()
+
+
+def test_live_playlist_is_left_to_yt_dlp(server, tmp_path):
+    downloader = hls.HLSDownloader(requests.Session())
+    with pytest.raises(hls.HLSUnsupported, match="live"):
+        downloader.download(server.url("/hls/live.m3u8?segments=3&live=1"), str(tmp_path))
+    assert not list(tmp_path.iterdir())
+
+
+def test_failed_responses_are_closed(server, monkeypatch):
+    monkeypatch.setattr(hls, "SEGMENT_RETRIES", 0)
+    closed = []
+    class Session(requests.Session):
+        def get(self, *args, **kwargs):
+            response = super().get(*args, **kwargs)
+            response.close = lambda close=response.close: (closed.append(response.status_code), close())
+            return response
+    downloader = hls.HLSDownloader(Session())
+    with pytest.raises(hls.HLSRateLimited):
+        downloader.fetch(server.url("/hls/busy/0.ts?fail=1&code=429"))
+    with pytest.raises(hls.HLSError):
+        downloader.fetch(server.url("/hls/gone/0.ts?fail=9&code=404"))
+    assert closed == [429, 404]
@@ -0,0 +1,71 @@
+import engine
+import hosts
+from hosts import HostLimiter, host_key, is_rate_limited
+
+
+def test_host_key_and_rate_limit_messages():
+    assert host_key("https://WWW.Example.com:8080/a") == "example.com"
+    assert host_key("https://cdn.example.com/a") == "cdn.example.com"
+    assert is_rate_limited("ERROR: HTTP Error 429: Too Many Requests")
+    assert is_rate_limited("429 Client Error: Too Many Requests for url")
+    assert not is_rate_limited("HTTP Error 4290")
+    assert not is_rate_limited(None)
+
+
+def test_breaker_doubles_and_resets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(hosts.time, "monotonic", lambda: now[0])
+    limiter = HostLimiter(per_host_limit=1, cooldown=30)
+
+    assert limiter.trip("a.com") == 30
+    assert limiter.is_paused("a.com") and not limiter.can_start("a.com")
+    assert limiter.can_start("b.com")
+    # More failures from the same burst don't add strikes.
+    now[0] += 10
+    assert limiter.trip("a.com") == 20
+    assert limiter.seconds_until_reopen() == 20
+
+    now[0] += 20
+    assert not limiter.is_paused("a.com")
+    assert limiter.trip("a.com") == 60
+    now[0] += 60
+    assert limiter.trip("a.com", retry_after=500) == 500
+    now[0] += 500
+    assert limiter.trip("a.com") == 240
+    now[0] += 240
+    limiter.succeeded("a.com")
+    assert limiter.trip("a.com") == 30
+    now[0] += 30
+    limiter.succeeded("a.com")
+    assert limiter.trip("a.com", retry_after=10 ** 6) == hosts.MAX_COOLDOWN
+
+
+def test_per_host_limit():
+    limiter = HostLimiter(per_host_limit=2)
+    limiter.acquire("a.com")
+    assert limiter.can_start("a.com")
+    limiter.acquire("a.com")
+    assert not limiter.can_start("a.com")
+    limiter.release("a.com")
+    assert limiter.can_start("a.com")
+
+
+def test_engine_pauses_rate_limited_host_without_using_a_retry(server, tmp_path, make_engine):
+    downloads = make_engine(host_cooldown=1, max_retries=0, native_direct=True)
+    task_id = downloads.add_task(server.url("/video/limited.mp4?size=65536&fail=1&code=429&retry_after=1"), str(tmp_path))
+    assert downloads.wait_until_idle(60)
+    task = downloads.tasks[task_id]
+    assert task["status"] == engine.STATUS_COMPLETED
+    assert task["retries"] == 0
+    assert downloads.hosts.strikes == {}
+    assert downloads.metrics.retries[("127.0.0.1", "rate_limited")] == 1
+
+
+def test_engine_gives_up_on_a_host_that_keeps_rate_limiting(server, tmp_path, make_engine):
+    downloads = make_engine(host_cooldown=0, max_rate_limit_requeues=2, native_direct=True)
+    task_id = downloads.add_task(server.url("/video/always-limited.mp4?fail=99&code=429"), str(tmp_path))
+    assert downloads.wait_until_idle(60)
+    task = downloads.tasks[task_id]
+    assert task["status"] == engine.STATUS_ERROR
+    assert "429" in task["error_message"]
+    assert downloads.metrics.retries[("127.0.0.1", "rate_limited")] == 2
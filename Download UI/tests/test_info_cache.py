@@ -0,0 +1,41 @@
+import os
+import time
+
+from info_cache import InfoCache
+
+
+def test_round_trip_and_key(tmp_path):
+    cache = InfoCache(str(tmp_path))
+    key = InfoCache.make_key("https://example.com/v", {"proxy": ""})
+    assert key != InfoCache.make_key("https://example.com/v", {"proxy": "http://proxy:8080"})
+    assert cache.get(key) is None
+    cache.put(key, {"id": "v", "formats": [1, 2]})
+    assert cache.get(key) == {"id": "v", "formats": [1, 2]}
+    assert InfoCache(str(tmp_path)).total_bytes == cache.total_bytes > 0
+
+
+def test_expired_and_corrupt_entries_are_dropped(tmp_path):
+    cache = InfoCache(str(tmp_path), ttl=60)
+    cache.put("old", {"id": "old"})
+    past = time.time() - 120
+    os.utime(cache.path_for("old"), (past, past))
+    assert cache.get("old") is None and not os.path.exists(cache.path_for("old"))
+
+    with open(cache.path_for("bad"), "wb") as f:
+        f.write(b"not gzip")
+    assert cache.get("bad") is None and not os.path.exists(cache.path_for("bad"))
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = InfoCache(str(tmp_path), max_bytes=10 ** 9)
+    payload = {"data": os.urandom(3000).hex()}
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, payload)
+        os.utime(cache.path_for(key), (1000 + i, time.time()))
+    cache.get("a")      # now the most recently used
+    entry_size = os.path.getsize(cache.path_for("a"))
+    cache.max_bytes = entry_size * 3.5
+    cache.put("d", payload)
+    # Down to 90% of the budget: only "b", the least recently used, has to go.
+    assert sorted(name.split(".")[0] for name in os.listdir(tmp_path)) == ["a", "c", "d"]
+    assert cache.total_bytes == sum(os.path.getsize(cache.path_for(key)) for key in "acd")
@@ -0,0 +1,31 @@
+from journal import JobJournal
+
+
+def task(task_id, status="Queued", **fields):
+    return dict({"id": task_id, "url": f"https://example.com/{task_id}.mp4", "output_path": "/out",
+                 "sequence_number": None, "status": status, "retries": 0}, **fields)
+
+
+def test_unfinished_jobs_survive_reopening(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    journal = JobJournal(path)
+    for task_id in "abcd":
+        journal.record(task(task_id))
+    journal.update("b", {"status": "Completed", "filename": "b.mp4", "not_a_column": 1})
+    journal.update("c", {"status": "Downloading", "retries": 2})
+    journal.remove(["d"])
+    journal.close()
+
+    journal = JobJournal(path)
+    rows = journal.load_unfinished(("Completed", "Error", "Cancelled"))
+    assert [(row["id"], row["status"], row["retries"]) for row in rows] == [("a", "Queued", 0), ("c", "Downloading", 2)]
+    journal.close()
+
+
+def test_flush_commits_queued_writes(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    for i in range(2500):
+        journal.record(task(str(i)))
+    journal.flush()
+    assert len(journal.load_unfinished(("Completed",))) == 2500
+    journal.close()
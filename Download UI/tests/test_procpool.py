@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+
+import procpool
+from ratelimit import TokenBucket
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_worker_processes_do_not_import_the_app_script(tmp_path):
+    """spawn would otherwise run the app's __main__ script (main.py, m3udl.py) again in every worker."""
+    marker = tmp_path / "imported"
+    script = tmp_path / "app.py"
+    script.write_text(textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {APP_DIR!r})
+        if __name__ != "__main__":
+            open({str(marker)!r}, "a").write(__name__ + "\\n")
+        if __name__ == "__main__":
+            import procpool
+            from ratelimit import TokenBucket
+            pool = procpool.ProcessWorkerPool(TokenBucket())
+            job = {{"url": "not a url", "ydl_opts": {{"quiet": True, "no_warnings": True}}}}
+            ok, error, _ = pool.run(job, lambda kind, data: None, lambda: False)
+            pool.shutdown()
+            print(ok, error)
+    """))
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1].startswith("False ")
+    assert not marker.exists()
+
+
+def test_first_progress_event_for_a_file_is_sent_at_once(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(procpool, "PROGRESS_INTERVAL", float("inf"))
+    sent = []
+    job = {"url": server.url("/video/first.mp4?size=300000"),
+           "ydl_opts": {"quiet": True, "outtmpl": str(tmp_path / "%(id)s.%(ext)s")}}
+    ok, error, _ = procpool.run_job(job, lambda kind, data: sent.append((kind, data)), threading.Event(), TokenBucket())
+    assert ok, error
+    downloading = [data for kind, data in sent if kind == "progress" and data["status"] == "downloading"]
+    assert downloading and downloading[0]["tmpfilename"].endswith("first.mp4.part")
+    assert downloading[0]["source"][0] == job["url"]
@@ -0,0 +1,45 @@
+from progress import ProgressTable, format_bytes, format_eta, format_row
+
+
+def test_drain_returns_changed_rows_once(monkeypatch):
+    table = ProgressTable()
+    table.update("a", 100, 1000)
+    table.update("b", 5)
+    assert set(table.drain()) == {"a", "b"}
+    assert table.drain() == {}
+    table.update("a", 200)
+    changed = table.drain()
+    assert list(changed) == ["a"] and changed["a"]["total_bytes"] == 1000
+    assert changed["a"]["progress"] == 0.2
+
+
+def test_speed_is_smoothed_and_gives_an_eta(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("progress.time.monotonic", lambda: now[0])
+    table = ProgressTable()
+    table.update("a", 0, 10000)
+    now[0] += 1
+    table.update("a", 1000)
+    assert table.get("a")["speed"] == 1000 and table.get("a")["eta"] == 9
+    now[0] += 1
+    table.update("a", 3000)
+    assert table.get("a")["speed"] == 0.3 * 2000 + 0.7 * 1000
+
+
+def test_finish_and_reset():
+    table = ProgressTable()
+    table.update("a", 10, 100, speed=5, eta=18)
+    table.finish("a")
+    row = table.get("a")
+    assert (row["progress"], row["speed"], row["eta"]) == (1.0, None, 0)
+    table.reset("a")
+    assert table.get("a") is None and table.drain() == {}
+    table.finish("missing")
+
+
+def test_formatting():
+    assert format_bytes(512) == "512 B" and format_bytes(1536) == "1.5 KiB" and format_bytes(None) == "?"
+    assert format_eta(75) == "01:15" and format_eta(3725) == "1:02:05" and format_eta(None) == "--:--"
+    row = {"progress": 0.45, "total_bytes": 100, "downloaded_bytes": 45, "speed": 2.5 * 1024 ** 2, "eta": 12}
+    assert format_row(row) == "45% · 2.5 MiB/s · ETA 00:12"
+    assert format_row(dict(row, total_bytes=None, speed=None)) == "45 B"
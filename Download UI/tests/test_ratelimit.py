@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from ratelimit import TokenBucket, parse_rate
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", None), (None, None), ("0", None), (0, None),
+    ("500K", 500 * 1024), ("2M", 2 * 1024 ** 2), ("1.5MB/s", 1.5 * 1024 ** 2), ("100 kib", 100 * 1024),
+    (2048, 2048.0),
+])
+def test_parse_rate(text, expected):
+    assert parse_rate(text) == expected
+
+
+def test_parse_rate_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_rate("fast")
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket()
+    started = time.monotonic()
+    bucket.consume(10 ** 12)
+    assert time.monotonic() - started < 0.05
+
+
+def test_concurrent_consumers_share_one_limit():
+    rate = 400_000
+    bucket = TokenBucket(rate)
+    def consume():
+        for _ in range(10):
+            bucket.consume(10_000)
+    threads = [threading.Thread(target=consume) for _ in range(4)]
+    started = time.monotonic()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.monotonic() - started
+    # 400 KB at 400 KB/s, less the burst allowance.
+    assert 1.0 - 0.25 - 0.1 <= elapsed < 2.0
+
+
+def test_raising_the_rate_releases_waiting_consumers():
+    bucket = TokenBucket(1000)
+    done = threading.Event()
+    threading.Thread(target=lambda: (bucket.consume(100_000), done.set()), daemon=True).start()
+    assert not done.wait(0.3)
+    bucket.set_rate(None)
+    assert done.wait(1)
+    assert bucket.rate is None
+
+
+def test_cancelled_consumer_returns_early():
+    bucket = TokenBucket(1000)
+    started = time.monotonic()
+    bucket.consume(100_000, is_cancelled=lambda: time.monotonic() - started > 0.2)
+    assert time.monotonic() - started < 1
@@ -0,0 +1,64 @@
+import concurrent.futures
+import random
+import threading
+
+from registry import TaskRegistry
+
+STATUSES = ("Queued", "Downloading", "Completed", "Error")
+
+
+def make_task(task_id, status="Queued"):
+    return {"id": task_id, "status": status, "future": None}
+
+
+def test_status_index_follows_updates_and_removal():
+    tasks = TaskRegistry()
+    for i in range(4):
+        tasks.add(make_task(i))
+    tasks.update(1, {"status": "Downloading"})
+    tasks.update(2, {"status": "Downloading", "filename": "x"})
+    tasks.update(3, {"filename": "y"})
+
+    assert tasks.count("Queued") == 2 and tasks.count("Downloading") == 2
+    assert tasks.ids_with_status("Downloading", "Error") == {1, 2}
+    assert tasks[2]["filename"] == "x"
+    assert tasks.update(99, {"status": "Error"}) is None
+
+    tasks.remove(1)
+    assert 1 not in tasks and tasks.counts() == {"Queued": 2, "Downloading": 1}
+    tasks.remove(2)
+    assert "Downloading" not in tasks.counts()
+
+
+def test_future_index():
+    tasks = TaskRegistry()
+    tasks.add(make_task("a"))
+    first, second = concurrent.futures.Future(), concurrent.futures.Future()
+    tasks.set_future("a", first)
+    tasks.set_future("a", second)
+    assert tasks.pop_future(first) is None
+    assert tasks.pop_future(second) == "a"
+    assert tasks["a"]["future"] is None
+
+    tasks.set_future("a", first)
+    tasks.remove("a")
+    assert tasks.pop_future(first) is None
+
+
+def test_indexes_stay_consistent_under_concurrent_updates():
+    tasks = TaskRegistry()
+    for i in range(200):
+        tasks.add(make_task(i))
+    def churn(seed):
+        rng = random.Random(seed)
+        for _ in range(2000):
+            tasks.update(rng.randrange(200), {"status": rng.choice(STATUSES)})
+    threads = [threading.Thread(target=churn, args=(seed,)) for seed in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    actual = {}
+    for task in tasks.values():
+        actual.setdefault(task["status"], set()).add(task["id"])
+    assert {status: tasks.ids_with_status(status) for status in actual} == actual
+    assert sum(tasks.counts().values()) == len(tasks) == 200
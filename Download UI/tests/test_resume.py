@@ -0,0 +1,37 @@
+import resume
+
+
+def test_written_spans_are_the_gaps_between_missing_ranges():
+    assert resume.written_spans([], 100) == [(0, 100)]
+    assert resume.written_spans([(0, 100)], 100) == []
+    assert resume.written_spans([(60, 100), (10, 20)], 100) == [(0, 10), (20, 60)]
+    assert resume.written_spans([(10, 40), (30, 50)], 60) == [(0, 10), (50, 60)]
+
+
+def test_tail_checks_notice_changed_bytes(tmp_path):
+    path = tmp_path / "video.part"
+    path.write_bytes(bytes(range(256)) * 1024)
+    checks = resume.tail_checks(path, [(0, 1000), (100000, 200000)])
+    assert resume.verify_tail_checks(path, checks)
+
+    with open(path, "r+b") as f:
+        f.seek(199999)
+        f.write(b"\x00")
+    assert not resume.verify_tail_checks(path, checks)
+    assert not resume.verify_tail_checks(tmp_path / "gone.part", checks)
+
+
+def test_validators_match_ignores_missing_values():
+    saved = {"etag": '"1"', "last_modified": "Tue, 14 Nov 2023 22:13:20 GMT", "size": "10"}
+    assert resume.validators_match(saved, dict(saved))
+    assert resume.validators_match(saved, {"etag": None, "last_modified": None, "size": "10"})
+    assert not resume.validators_match(saved, dict(saved, etag='"2"'))
+    assert not resume.validators_match(saved, dict(saved, size="11"))
+
+
+def test_head_validators(server):
+    import requests
+    session = requests.Session()
+    found = resume.head_validators(session, server.url("/video/head.mp4?size=1234"))
+    assert found["size"] == "1234" and found["etag"] and found["last_modified"]
+    assert resume.head_validators(session, server.url("/video/head.mp4?fail=9&code=404")) is None
@@ -0,0 +1,158 @@
+"""Dispatch, cancellation and restart behaviour of the engine, against the fake media server."""
+import threading
+import time
+
+import engine
+from journal import JobJournal
+
+SLOW = "size=300000&rate=600000"       # about half a second per download
+
+
+def other_host(url):
+    # Another host name for the same server, so per-host limits treat it separately.
+    return url.replace("127.0.0.1", "localhost")
+
+
+class Peaks:
+    """Samples how many downloads run in total and per host while a test runs."""
+
+    def __init__(self, downloads):
+        self.downloads = downloads
+        self.total, self.per_host = 0, {}
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop.wait(0.005):
+            self.total = max(self.total, self.downloads.tasks.count(engine.STATUS_DOWNLOADING))
+            for host, count in dict(self.downloads.hosts.active).items():
+                self.per_host[host] = max(self.per_host.get(host, 0), count)
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        return self
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def statuses(downloads, task_ids):
+    return [downloads.tasks[task_id]["status"] for task_id in task_ids]
+
+
+def test_dispatch_respects_slot_and_per_host_limits(server, tmp_path, make_engine):
+    downloads = make_engine(simultaneous_downloads=3, per_host_downloads=2)
+    peaks = Peaks(downloads)
+    task_ids = [downloads.add_task(server.url(f"/video/limits{i}.mp4?{SLOW}"), str(tmp_path)) for i in range(4)]
+    task_ids += [downloads.add_task(other_host(server.url(f"/video/limits-other{i}.mp4?{SLOW}")), str(tmp_path)) for i in range(2)]
+    assert downloads.wait_until_idle(60)
+    peaks.close()
+    assert statuses(downloads, task_ids) == [engine.STATUS_COMPLETED] * 6
+    assert peaks.total == 3
+    assert peaks.per_host["127.0.0.1"] == 2 and peaks.per_host["localhost"] <= 2
+    assert downloads.hosts.active == {}
+
+
+def test_paused_host_waits_while_other_hosts_download(server, tmp_path, make_engine):
+    downloads = make_engine(simultaneous_downloads=2, host_cooldown=1.5)
+    downloads.hosts.trip("127.0.0.1")
+    tripped = time.monotonic()
+    paused = downloads.add_task(server.url("/video/paused.mp4?size=1000"), str(tmp_path))
+    other = downloads.add_task(other_host(server.url("/video/not-paused.mp4?size=1000")), str(tmp_path))
+
+    wait_for(lambda: downloads.tasks[other]["status"] == engine.STATUS_COMPLETED)
+    assert downloads.tasks[paused]["status"] == engine.STATUS_QUEUED
+    assert downloads.wait_until_idle(30)
+    assert downloads.tasks[paused]["status"] == engine.STATUS_COMPLETED
+    assert time.monotonic() - tripped >= 1.5
+
+
+def test_resizing_starts_queued_downloads_at_once(server, tmp_path, make_engine):
+    downloads = make_engine(simultaneous_downloads=1, per_host_downloads=0)
+    peaks = Peaks(downloads)
+    task_ids = [downloads.add_task(server.url(f"/video/resize{i}.mp4?size=300000&rate=300000"), str(tmp_path)) for i in range(3)]
+    wait_for(lambda: downloads.tasks.count(engine.STATUS_DOWNLOADING) == 1)
+    downloads.set_max_workers(3)
+    wait_for(lambda: downloads.tasks.count(engine.STATUS_DOWNLOADING) == 3, timeout=0.8)
+    assert downloads.wait_until_idle(30)
+    peaks.close()
+    assert statuses(downloads, task_ids) == [engine.STATUS_COMPLETED] * 3
+    assert peaks.total == 3
+
+
+def test_speed_limit_is_shared_by_all_downloads(server, tmp_path, make_engine):
+    downloads = make_engine(simultaneous_downloads=3, per_host_downloads=0, speed_limit="300K")
+    started = time.monotonic()
+    for i in range(3):
+        downloads.add_task(server.url(f"/video/limited{i}.mp4?size=200000"), str(tmp_path))
+    assert downloads.wait_until_idle(30)
+    # 600 KB at 300 KiB/s is about two seconds, less the burst allowance.
+    assert time.monotonic() - started >= 1.5
+
+
+def partial_files(tmp_path, name):
+    return sorted(path.name for path in tmp_path.glob(f"{name}*.part*"))
+
+
+def test_cancel_mid_download_removes_partial_files_and_frees_the_host(server, tmp_path, make_engine):
+    downloads = make_engine(simultaneous_downloads=2, per_host_downloads=1)
+    slow = downloads.add_task(server.url("/video/cancelled.mp4?size=8000000&rate=200000"), str(tmp_path))
+    wait_for(lambda: (downloads.progress.get(slow) or {}).get("downloaded_bytes"))
+    assert partial_files(tmp_path, "cancelled")
+    waiting = downloads.add_task(server.url("/video/after-cancel.mp4?size=1000"), str(tmp_path))
+    time.sleep(0.2)
+    assert downloads.tasks[waiting]["status"] == engine.STATUS_QUEUED   # the host's one slot is taken
+
+    downloads.cancel_task(slow)
+    assert downloads.tasks[slow]["status"] == engine.STATUS_CANCELLED
+    assert downloads.wait_until_idle(30)
+    assert downloads.tasks[waiting]["status"] == engine.STATUS_COMPLETED
+    wait_for(lambda: not partial_files(tmp_path, "cancelled"))
+    assert downloads.hosts.active == {}
+    assert downloads.workers.running == set() and downloads.workers.detached == set()
+
+
+def test_stop_queue_cancels_everything_and_holds_new_work(server, tmp_path, make_engine):
+    downloads = make_engine(simultaneous_downloads=2, per_host_downloads=0)
+    task_ids = [downloads.add_task(server.url(f"/video/stopped{i}.mp4?size=8000000&rate=200000"), str(tmp_path)) for i in range(3)]
+    wait_for(lambda: downloads.tasks.count(engine.STATUS_DOWNLOADING) == 2)
+    wait_for(lambda: len(partial_files(tmp_path, "stopped")) >= 2)
+
+    downloads.stop_queue()
+    assert statuses(downloads, task_ids) == [engine.STATUS_CANCELLED] * 3
+    assert downloads.download_queue.empty()
+    wait_for(lambda: not partial_files(tmp_path, "stopped"))
+    assert downloads.hosts.active == {}
+
+    later = downloads.add_task(server.url("/video/after-stop.mp4?size=1000"), str(tmp_path))
+    time.sleep(0.2)
+    assert downloads.tasks[later]["status"] == engine.STATUS_QUEUED
+    downloads.start_queue()
+    assert downloads.wait_until_idle(30)
+    assert downloads.tasks[later]["status"] == engine.STATUS_COMPLETED
+
+
+def test_journal_restores_queued_tasks_after_a_restart(server, tmp_path, make_engine):
+    journal_path = str(tmp_path / "jobs.db")
+    first = make_engine(autopilot=False, journal=JobJournal(journal_path))
+    task_ids = [first.add_task(server.url(f"/video/restored{i}.mp4?size=1000"), str(tmp_path)) for i in range(3)]
+    first.shutdown()    # closes the journal; nothing was started
+
+    second = make_engine(start=False, autopilot=False, journal=JobJournal(journal_path))
+    assert second.restore_jobs() == 3
+    assert sorted(second.tasks.keys()) == sorted(task_ids)
+    assert [second.tasks[task_id]["url"] for task_id in task_ids] == [server.url(f"/video/restored{i}.mp4?size=1000") for i in range(3)]
+    second.start_scheduler()
+    second.start_queue()
+    assert second.wait_until_idle(30)
+    assert statuses(second, task_ids) == [engine.STATUS_COMPLETED] * 3
+    second.shutdown()
+
+    third = make_engine(start=False, journal=JobJournal(journal_path))
+    assert third.restore_jobs() == 0
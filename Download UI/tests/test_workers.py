@@ -0,0 +1,96 @@
+import threading
+import time
+
+from workers import WorkerPool
+
+
+class Gate:
+    """Jobs that block until released, recording how many ran at once."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.started = threading.Semaphore(0)
+
+    def job(self, value=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.started.release()
+        self.release.wait(10)
+        with self.lock:
+            self.running -= 1
+        return value
+
+    def wait_started(self, count):
+        for _ in range(count):
+            assert self.started.acquire(timeout=5)
+
+
+def test_runs_at_most_size_jobs_and_keeps_the_rest():
+    pool, gate = WorkerPool(2), Gate()
+    futures = [pool.submit(gate.job, i) for i in range(5)]
+    gate.wait_started(2)
+    time.sleep(0.1)
+    assert gate.running == 2
+    gate.release.set()
+    assert [f.result(5) for f in futures] == list(range(5))
+    assert gate.peak == 2
+    pool.shutdown()
+
+
+def test_growing_starts_waiting_jobs_at_once():
+    pool, gate = WorkerPool(1), Gate()
+    futures = [pool.submit(gate.job) for _ in range(3)]
+    gate.wait_started(1)
+    pool.resize(3)
+    gate.wait_started(2)
+    assert gate.running == 3
+    gate.release.set()
+    for future in futures: future.result(5)
+    pool.shutdown()
+
+
+def test_shrinking_lets_running_jobs_finish_and_drops_nothing():
+    pool, gate = WorkerPool(3), Gate()
+    futures = [pool.submit(gate.job, i) for i in range(6)]
+    gate.wait_started(3)
+    pool.resize(1)
+    gate.release.set()
+    assert [f.result(5) for f in futures] == list(range(6))
+    deadline = time.monotonic() + 5
+    while pool.workers > 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.workers <= 1
+    pool.shutdown()
+
+
+def test_detached_worker_is_replaced_while_it_finishes():
+    pool, stuck, gate = WorkerPool(1), Gate(), Gate()
+    gate.release.set()
+    stuck_future = pool.submit(stuck.job, "stuck")
+    stuck.wait_started(1)
+    waiting = pool.submit(gate.job, "next")
+    time.sleep(0.1)
+    assert not waiting.done()
+
+    assert pool.detach(stuck_future)
+    assert waiting.result(5) == "next"
+    assert not pool.detach(stuck_future)
+    stuck.release.set()
+    assert stuck_future.result(5) == "stuck"
+    assert pool.workers <= 1 and not pool.detached
+    pool.shutdown()
+
+
+def test_shutdown_cancels_jobs_that_have_not_started():
+    pool, gate = WorkerPool(1), Gate()
+    running = pool.submit(gate.job, 1)
+    gate.wait_started(1)
+    pending = pool.submit(gate.job, 2)
+    pool.shutdown()
+    assert pending.cancelled()
+    gate.release.set()
+    assert running.result(5) == 1
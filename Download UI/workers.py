@@ -0,0 +1,99 @@
+"""
+Resizable download worker pool.
+
+Unlike ThreadPoolExecutor, the number of workers can change while jobs are
+running. Growing starts threads for waiting jobs right away; shrinking never
+interrupts a running job, surplus workers simply exit once they finish what
+they are doing. Jobs are never dropped by a resize.
+
+A worker stuck finishing a cancelled job can be detached: it stops counting
+towards the pool size, so a replacement starts at once, and it exits as
+soon as the job returns.
+"""
+import collections
+import concurrent.futures
+import threading
+
+
+class WorkerPool:
+    def __init__(self, size, name="m3udl-worker"):
+        self.size = max(1, size)
+        self.name = name
+        self.jobs = collections.deque()
+        self.running = set()
+        self.detached = set()
+        self.workers = 0
+        self.idle = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        self.spawned = 0
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("cannot submit to a pool that has been shut down")
+            self.jobs.append((future, fn, args, kwargs))
+            self._spawn_for_waiting_jobs()
+            self.cond.notify()
+        return future
+
+    def resize(self, size):
+        with self.cond:
+            self.size = max(1, size)
+            self._spawn_for_waiting_jobs()
+            # Wakes idle workers so the surplus can exit.
+            self.cond.notify_all()
+
+    def detach(self, future):
+        """Stops counting the worker running `future` towards the pool size."""
+        with self.cond:
+            if future not in self.running: return False
+            self.running.discard(future)
+            self.detached.add(future)
+            self.workers -= 1
+            self._spawn_for_waiting_jobs()
+            return True
+
+    def shutdown(self, cancel_pending=True):
+        with self.cond:
+            self.closed = True
+            if cancel_pending:
+                while self.jobs:
+                    self.jobs.popleft()[0].cancel()
+            self.cond.notify_all()
+
+    def _spawn_for_waiting_jobs(self):
+        while self.workers < self.size and len(self.jobs) > self.idle:
+            self.workers += 1
+            self.spawned += 1
+            threading.Thread(target=self._worker, name=f"{self.name}-{self.spawned}", daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.jobs and not self.closed and self.workers <= self.size:
+                    self.idle += 1
+                    self.cond.wait()
+                    self.idle -= 1
+                if self.workers > self.size or not self.jobs:
+                    self.workers -= 1
+                    return
+                future, fn, args, kwargs = self.jobs.popleft()
+                if not future.set_running_or_notify_cancel(): continue
+                self.running.add(future)
+
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+            with self.cond:
+                if future in self.detached:
+                    # A replacement already took this worker's place.
+                    self.detached.discard(future)
+                    return
+                self.running.discard(future)
+            del future, fn, args, kwargs